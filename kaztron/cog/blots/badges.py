@@ -1,10 +1,10 @@
 import logging
-from typing import Optional
+from typing import Optional, Dict, Any, List, Tuple
 
 import discord
 from discord.ext import commands
 
-from kaztron import KazCog
+from kaztron import KazCog, task
 from kaztron.cog.blots import model
 from kaztron.cog.blots.controller import BlotsBadgeController, BlotsConfig
 from kaztron.driver import database
@@ -22,6 +22,19 @@ from kaztron.utils.strings import split_chunks_on
 logger = logging.getLogger(__name__)
 
 
+class BadgeParseError(Exception):
+    """
+    A message is not a valid badge.
+
+    :param log_message: Description of the problem, for the log.
+    :param user_message: Error message to show the user, or None to not show an error.
+    """
+    def __init__(self, log_message: str, user_message: str=None):
+        super().__init__(log_message)
+        self.log_message = log_message
+        self.user_message = user_message
+
+
 class BadgeManager(KazCog):
     """!kazhelp
     category: Commands
@@ -56,10 +69,12 @@ class BadgeManager(KazCog):
         - badges:
             - report
             - load
+            - resume
     """
     cog_config: BlotsConfig
 
     ITEMS_PER_PAGE = 8
+    LOAD_PAGE_SIZE = 100  #: messages per history page (maximum allowed by Discord)
     EMBED_COLOUR = solarized.green
 
     badge_channel_id = KazCog.config.blots.badge_channel
@@ -68,19 +83,26 @@ class BadgeManager(KazCog):
         super().__init__(bot, 'blots', BlotsConfig)
         self.channel = None  # type: discord.Channel
         self.c = None  # type: BlotsBadgeController
+        self.cog_state.set_defaults(badges_last_message_id=None)
 
     async def on_ready(self):
         await super().on_ready()
         channel_id = self.config.get('blots', 'badge_channel')
         self.channel = self.get_channel(channel_id)
         self.c = BlotsBadgeController(self.server, self.config)
+        if not self.scheduler.get_instances(self.task_catch_up):
+            self.scheduler.schedule_task_in(self.task_catch_up, 0)
 
     def export_kazhelp_vars(self):
         return {'badge_channel': '#' + self.channel.name}
 
-    async def add_badge(self, message: discord.Message, suppress_errors=False) \
-            -> Optional[model.Badge]:
+    def _parse_badge(self, message: discord.Message) -> Dict[str, Any]:
+        """
+        Parse and validate a badge message.
 
+        :return: Keyword arguments for :meth:`BlotsBadgeController.save_badge`.
+        :raise BadgeParseError: Not a valid badge message.
+        """
         # Check if this seems like a command (usually badge commands for the badge channel)
         class FakeContext:
             def __init__(self, bot, msg):
@@ -91,8 +113,7 @@ class BadgeManager(KazCog):
         msg_init = message.content.strip()
         if msg_init.startswith(prefix) and\
                 (len(msg_init) == len(prefix) or not msg_init[len(prefix)].isspace()):
-            logger.warning("Skipping badge parsing: message appears to be a command.")
-            return
+            raise BadgeParseError("Skipping badge parsing: message appears to be a command.")
 
         # Parsing
         badges = [b for b in model.BadgeType if b.pattern.search(message.content)]
@@ -101,55 +122,119 @@ class BadgeManager(KazCog):
 
         # Validation: member
         if len(message.mentions) != 1:
-            logger.warning("Badge must mention exactly 1 user: {}"
-                .format(', '.join([m.nick or m.name for m in message.mentions])))
-            if not suppress_errors:
-                await self.bot.send_message(self.channel,
-                    "**Error**: Badges must mention exactly 1 user.")
-            return
+            raise BadgeParseError(
+                "Badge must mention exactly 1 user: {}"
+                .format(', '.join([m.nick or m.name for m in message.mentions])),
+                "**Error**: Badges must mention exactly 1 user.")
         elif message.mentions[0] == message.author:
-            logger.warning("Cannot give badge to self")
-            if not suppress_errors:
-                await self.bot.send_message(self.channel,
+            raise BadgeParseError("Cannot give badge to self",
                 "**Error**: You can't give yourself a badge!")
-            return
 
         # Validation: badge type
         if len(badges) != 1:
-            logger.warning("Only 1 badge can be given at a time: {!s}".format(badges))
-            if not suppress_errors:
-                await self.bot.send_message(self.channel,
-                    "{} **Error**: You can only give 1 badge at a time (found {:d}).".format(
-                        message.author.mention, len(badges)))
-            return
+            raise BadgeParseError(
+                "Only 1 badge can be given at a time: {!s}".format(badges),
+                "{} **Error**: You can only give 1 badge at a time (found {:d}).".format(
+                    message.author.mention, len(badges)))
         elif model.BadgeType.Guild in badges and not check_mod(dummy_context):
-            logger.warning("Guild badge by non-mod: {}"
-                .format(message.author.nick or message.author.name))
-            if not suppress_errors:
-                await self.bot.send_message(self.channel,
-                    "{} **Error**: Only Overseers can give the Guild badge."
-                        .format(message.author.mention))
-            return
+            raise BadgeParseError(
+                "Guild badge by non-mod: {}".format(message.author.nick or message.author.name),
+                "{} **Error**: Only Overseers can give the Guild badge."
+                    .format(message.author.mention))
 
         # Validation: reason
         if reason is None:
-            logger.warning("Cannot find badge reason")
-            if not suppress_errors:
-                await self.bot.send_message(self.channel,
-                    ("{} **Error**: Can't find the badge reason. Make sure the badge reason "
-                     "has the text `**For:**` at the beginning of the line.")
-                        .format(message.author.mention))
-            return
+            raise BadgeParseError("Cannot find badge reason",
+                ("{} **Error**: Can't find the badge reason. Make sure the badge reason "
+                 "has the text `**For:**` at the beginning of the line.")
+                    .format(message.author.mention))
+
+        return {
+            'message_id': message.id,
+            'member': message.mentions[0],
+            'from_member': message.author,
+            'badge': badges[0],
+            'reason': reason,
+            'timestamp': message.timestamp
+        }
 
-        badge_row = self.c.save_badge(
-            message_id=message.id,
-            member=message.mentions[0],
-            from_member=message.author,
-            badge=badges[0],
-            reason=reason,
-            timestamp=message.timestamp
-        )
-        return badge_row
+    async def add_badge(self, message: discord.Message, suppress_errors=False) \
+            -> Optional[model.Badge]:
+        try:
+            badge_args = self._parse_badge(message)
+        except BadgeParseError as e:
+            logger.warning(e.log_message)
+            if not suppress_errors and e.user_message:
+                await self.bot.send_message(self.channel, e.user_message)
+            return None
+        return self.c.save_badge(**badge_args)
+
+    def _set_resume_point(self, message: discord.Message):
+        """ Record a badge channel message as read, if it's newer than the current resume point. """
+        last_id = self.cog_state.badges_last_message_id
+        if last_id is None or int(message.id) > int(last_id):
+            self.cog_state.badges_last_message_id = message.id
+
+    def _ingest_page(self, messages: List[discord.Message]) -> int:
+        """
+        Parse and save a page of badge channel history in one transaction, then advance the resume
+        point past it and write it to the state file.
+
+        :return: Number of badges added or updated.
+        """
+        badges = []
+        for message in messages:
+            if message.author.id == self.bot.user.id:
+                continue
+            try:
+                badges.append(self._parse_badge(message))
+            except BadgeParseError as e:
+                logger.debug("badges load: Skipping message {}: {}"
+                    .format(message.id, e.log_message))
+        count = self.c.save_badges(badges)
+        with self.cog_state:
+            for message in messages:
+                self._set_resume_point(message)
+        logger.info("badges load: Read {:d} messages, added or updated {:d} badges"
+            .format(len(messages), count))
+        return count
+
+    async def catch_up(self) -> Tuple[int, int]:
+        """
+        Load all badge channel messages since the resume point, oldest first, one page at a time.
+        Each page is saved (and the resume point advanced) before the next is fetched, so an
+        interrupted catch-up continues where it left off.
+
+        :return: Number of messages read and number of badges added or updated.
+        :raise ValueError: No resume point is set (no messages ever loaded).
+        """
+        if self.cog_state.badges_last_message_id is None:
+            raise ValueError("No badge channel messages have been loaded yet")
+
+        total_messages = 0
+        total_badges = 0
+        while True:
+            after = discord.Object(id=self.cog_state.badges_last_message_id)
+            page = [m async for m in self.bot.logs_from(
+                self.channel, self.LOAD_PAGE_SIZE, after=after, reverse=True)]
+            if not page:
+                break
+            total_messages += len(page)
+            total_badges += self._ingest_page(page)
+            if len(page) < self.LOAD_PAGE_SIZE or \
+                    self.cog_state.badges_last_message_id == after.id:
+                break
+        return total_messages, total_badges
+
+    @task(is_unique=True)
+    async def task_catch_up(self):
+        try:
+            messages, badges = await self.catch_up()
+        except ValueError:
+            logger.info("Badge catch-up: no resume point, skipping (use `.badges load`)")
+        else:
+            logger.info("Badge catch-up: read {:d} messages, added or updated {:d} badges"
+                .format(messages, badges))
 
     @ready_only
     async def on_message(self, message: discord.Message):
@@ -162,6 +247,8 @@ class BadgeManager(KazCog):
         logger.info("Detected message in badge channel (#{})".format(self.channel.name))
         logger.debug("Badge Manager: {}".format(message_log_str(message)))
         badge_row = await self.add_badge(message)
+        with self.cog_state:
+            self._set_resume_point(message)
         if badge_row:
             await self.bot.send_message(self.channel,
                 "Congratulations, {1.mention}! {0.mention} just gave you the {2} badge!".format(
@@ -323,12 +410,30 @@ class BadgeManager(KazCog):
                             "This might take a while...").format(messages))
 
         total_badges = 0
+        page = []
         async for message in self.bot.logs_from(self.channel, messages):
-            if message.author.id == self.bot.user.id:
-                continue
-            logger.info("badges load: Attempting to add/update badge: " + message_log_str(message))
-            badge_row = await self.add_badge(message, suppress_errors=True)
-            if badge_row:
-                total_badges += 1
+            page.append(message)
+            if len(page) >= self.LOAD_PAGE_SIZE:
+                total_badges += self._ingest_page(page)
+                page = []
+        if page:
+            total_badges += self._ingest_page(page)
 
         await self.bot.say("Added or updated {:d} badges.".format(total_badges))
+
+    @badges.command(pass_context=True, ignore_extra=True)
+    @mod_only()
+    async def resume(self, ctx: commands.Context):
+        """!kazhelp
+        description:
+            Load all badge channel messages since the last message {{name}} read, and add any
+            missing badges. This is done automatically on startup: only needed if that failed.
+        """
+        await self.bot.say("Loading badge channel messages since the last loaded message...")
+        try:
+            total_messages, total_badges = await self.catch_up()
+        except ValueError:
+            raise commands.CommandError(
+                "No badge channel messages have been loaded yet: use `.badges load` first.")
+        await self.bot.say("Read {:d} messages. Added or updated {:d} badges."
+            .format(total_messages, total_badges))
@@ -116,6 +116,10 @@ class CheckInManager(KazCog):
         logger.info("Announcing end of check-in window")
         await self.bot.send_message(self.check_in_channel,
             "~\n**Check-ins for this week are now CLOSED!**\n" + ("=" * 32))
+        try:
+            self.c.save_week_report(datetime.utcnow() - timedelta(days=1))
+        except ValueError as e:  # shouldn't happen unless the task runs early
+            logger.warning("Could not save check-in week report: {}".format(e))
 
     async def send_check_in_list(self,
                                dest: discord.Channel,
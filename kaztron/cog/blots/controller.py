@@ -2,11 +2,10 @@ import logging
 from collections import OrderedDict
 from datetime import datetime, timedelta
 from typing import List, Tuple, Dict, Optional, Union, Sequence, Mapping, \
-    MutableMapping, Iterable
+    MutableMapping, Iterable, Collection, Set, Any
 
 import discord
 from discord.ext import commands
-from sqlalchemy import orm
 
 from kaztron.config import KaztronConfig, SectionView
 # noinspection PyUnresolvedReferences
@@ -14,6 +13,7 @@ from kaztron.driver import database as db
 from kaztron.cog.blots.model import *
 from kaztron.driver.database import make_error_handler_decorator
 from kaztron.utils.datetime import get_weekday, parse as dt_parse
+from kaztron.utils.itertools import chunked
 
 logger = logging.getLogger(__name__)
 
@@ -32,6 +32,11 @@ def init_db():
     Session.configure(bind=engine)
     session = Session()
     Base.metadata.create_all(engine)
+    # create_all() doesn't add new indexes to existing tables
+    # (Index.create() has no checkfirst parameter before SQLAlchemy 1.4)
+    existing = db.inspect(engine).get_indexes(check_in_user_index.table.name)
+    if check_in_user_index.name not in (index['name'] for index in existing):
+        check_in_user_index.create(engine)
 
 
 on_error_rollback = make_error_handler_decorator(lambda *args, **kwargs: args[0].session, logger)
@@ -88,6 +93,23 @@ class BlotsController:
             self.session.commit()
             return user
 
+    def _get_users(self, discord_ids: Iterable[str]) -> Dict[str, User]:
+        """
+        Get the database users for many Discord IDs at once, creating any that don't exist yet.
+        New users are flushed but not committed.
+        """
+        discord_ids = set(discord_ids)
+        users = {}
+        for chunk in chunked(discord_ids, db.SQLITE_MAX_VARIABLES):
+            for user in self.session.query(User).filter(User.discord_id.in_(chunk)):
+                users[user.discord_id] = user
+        new_users = [User(discord_id=id_) for id_ in discord_ids - users.keys()]
+        if new_users:
+            self.session.add_all(new_users)
+            self.session.flush()
+            users.update((user.discord_id, user) for user in new_users)
+        return users
+
 
 class CheckInController(BlotsController):
     """
@@ -193,6 +215,38 @@ class CheckInController(BlotsController):
             .format(len(results), ' and '.join(log_conds)))
         return results
 
+    def _query_latest_check_ins(self, *criteria, discord_ids: Collection[str]=None)\
+            -> Dict[str, CheckIn]:
+        """
+        Query each user's latest check-in matching the given filter criteria.
+
+        :param criteria: SQL filter criteria on check-ins.
+        :param discord_ids: If given, only query for these users.
+        :return: Map of Discord ID to latest check-in.
+        """
+        latest = self.session \
+            .query(CheckIn.user_id, db.func.max(CheckIn.timestamp).label('timestamp_max')) \
+            .filter(*criteria)
+
+        # Small member lists are filtered in the database. Large ones (e.g. all members who didn't
+        # check in) would exceed SQLite's bound parameter limit and are slow to bind anyway, so
+        # instead query every user's latest check-in and filter against the member snapshot.
+        if discord_ids is not None and len(discord_ids) <= db.SQLITE_MAX_VARIABLES:
+            latest = latest.join(CheckIn.user).filter(User.discord_id.in_(discord_ids))
+        latest = latest.group_by(CheckIn.user_id).subquery(name='latest')
+
+        query = self.session.query(CheckIn).join(latest, db.and_(
+            CheckIn.user_id == latest.c.user_id,
+            CheckIn.timestamp == latest.c.timestamp_max
+        )).order_by(CheckIn.id)  # if timestamps tie, the last-inserted check-in wins
+
+        results = {}
+        for check_in in query:
+            discord_id = check_in.user.discord_id
+            if discord_ids is None or discord_id in discord_ids:
+                results[discord_id] = check_in
+        return results
+
     def query_latest_check_ins(self, members: List[discord.Member]=None, before: datetime=None)\
             -> CheckInMap:
         """
@@ -200,18 +254,106 @@ class CheckInController(BlotsController):
         :param before: If specified, will query the latest checkin before this time.
         :return:
         """
-        query: orm.Query
-        query = self.session \
-            .query(CheckIn, db.func.max(CheckIn.timestamp).label('timestamp_max'))
-        if members:
-            query = query.join(CheckIn.user)\
-                         .filter(User.discord_id.in_(tuple(m.id for m in members)))
-        if before:
-            query = query.filter(CheckIn.timestamp < before)
-        results = query.group_by(CheckIn.user_id).all()
+        member_map = {m.id: m for m in members} if members else None
+        latest = self._query_latest_check_ins(
+            *((CheckIn.timestamp < before,) if before else ()),
+            discord_ids=member_map.keys() if member_map else None
+        )
+        if member_map is None:
+            results = {self.server.get_member(id_): c for id_, c in latest.items()}
+        else:
+            results = {member_map[id_]: c for id_, c in latest.items()}
         logger.info("query_latest_check_ins: Found {:d} records".format(len(results)))
-        return {self.server.get_member(check_in.user.discord_id): check_in
-                for check_in, _ in results}
+        return results
+
+    def _compute_week_check_ins(self, start: datetime, end: datetime)\
+            -> Tuple[Dict[str, CheckIn], Dict[str, CheckIn]]:
+        week_map = self._query_latest_check_ins(
+            db.and_(start <= CheckIn.timestamp, CheckIn.timestamp <= end))
+        prev_map = self._query_latest_check_ins(CheckIn.timestamp < start)
+        return week_map, prev_map
+
+    def _drop_week_reports(self, *criteria):
+        """ Delete materialised week reports matching the given criteria. Does not commit. """
+        weeks = self.session.query(CheckInWeek.start).filter(*criteria)
+        if weeks.first() is None:
+            return
+        self.session.query(CheckInWeekEntry) \
+            .filter(CheckInWeekEntry.week_start.in_(weeks)) \
+            .delete(synchronize_session=False)
+        count = self.session.query(CheckInWeek).filter(*criteria) \
+            .delete(synchronize_session=False)
+        for obj in list(self.session.identity_map.values()):
+            if isinstance(obj, (CheckInWeek, CheckInWeekEntry)):
+                self.session.expunge(obj)
+        logger.info("Dropped {:d} materialised check-in week reports".format(count))
+
+    def _materialise_week(self, start: datetime, end: datetime)\
+            -> Tuple[Dict[str, CheckIn], Dict[str, CheckIn]]:
+        week_map, prev_map = self._compute_week_check_ins(start, end)
+        self._drop_week_reports(CheckInWeek.start == start)
+        self.session.add(CheckInWeek(start=start, end=end, generated=datetime.utcnow()))
+        self.session.flush()
+        self.session.bulk_insert_mappings(CheckInWeekEntry, [{
+            'week_start': start,
+            'user_id': (week_map.get(id_) or prev_map.get(id_)).user_id,
+            'check_in_id': week_map[id_].id if id_ in week_map else None,
+            'prev_check_in_id': prev_map[id_].id if id_ in prev_map else None
+        } for id_ in week_map.keys() | prev_map.keys()])
+        self.session.commit()
+        logger.info("Materialised check-in week report for {} to {}: {:d} users".format(
+            start.isoformat(' '), end.isoformat(' '), len(week_map.keys() | prev_map.keys())))
+        return week_map, prev_map
+
+    @on_error_rollback
+    def save_week_report(self, included_date: datetime):
+        """
+        Materialise the report data for a closed check-in week, replacing any existing data for
+        that week. Later reports for that week are read from the database.
+
+        :param included_date: The check-in week to save must include this date.
+        :raise ValueError: The check-in week has not closed yet.
+        """
+        start, end = self.get_check_in_week(included_date)
+        if end >= datetime.utcnow():
+            raise ValueError("Check-in week {} to {} has not closed yet"
+                .format(start.isoformat(' '), end.isoformat(' ')))
+        self._materialise_week(start, end)
+
+    @on_error_rollback
+    def get_week_check_ins(self, included_date: datetime)\
+            -> Tuple[Dict[str, CheckIn], Dict[str, CheckIn]]:
+        """
+        Get each user's last check-in during the check-in week that includes a given date, and each
+        user's last check-in before that week.
+
+        Closed weeks are materialised the first time they are requested, and read from the
+        database afterwards. The current week is always queried live.
+
+        :return: Two maps of Discord ID to check-in: the week's check-ins, and the latest
+            check-ins before the week.
+        """
+        start, end = self.get_check_in_week(included_date)
+        if end >= datetime.utcnow():
+            return self._compute_week_check_ins(start, end)
+
+        if self.session.query(CheckInWeek).filter_by(start=start).one_or_none() is None:
+            return self._materialise_week(start, end)
+
+        week_map = {}
+        prev_map = {}
+        for entry in self.session.query(CheckInWeekEntry).filter_by(week_start=start):
+            if entry.check_in is not None:
+                week_map[entry.check_in.user.discord_id] = entry.check_in
+            if entry.prev_check_in is not None:
+                prev_map[entry.prev_check_in.user.discord_id] = entry.prev_check_in
+        logger.debug("get_week_check_ins: read materialised week {} to {}"
+            .format(start.isoformat(' '), end.isoformat(' ')))
+        return week_map, prev_map
+
+    def _get_exempt_ids(self) -> Set[str]:
+        return {discord_id for discord_id, in
+                self.session.query(User.discord_id).filter_by(is_exempt=True)}
 
     def generate_check_in_report(self, included_date: datetime=None)\
             -> Tuple[CheckInMap, CheckInMap]:
@@ -230,34 +372,18 @@ class CheckInController(BlotsController):
         logger.info("generate_check_in_report(included_date={})"
             .format(included_date.isoformat(' ')))
 
-        try:
-            check_ins = self.query_check_ins(included_date=included_date)
-        except orm.exc.NoResultFound:
-            check_ins = []
+        week_map, prev_map = self.get_week_check_ins(included_date)
 
         ci_map = {}  # members with checkins
-        for c in check_ins:
-            m = self.server.get_member(c.user.discord_id)
+        for discord_id, c in week_map.items():
+            m = self.server.get_member(discord_id)
             if m is not None:  # filter members who left the server
                 ci_map[m] = c
-        nci_map = {m: None for m in self.server.members if m not in ci_map}  # members w/o checkins
-
-        # Remove exempt users from the non-checked-in map
-        for user in self.session.query(User).filter_by(is_exempt=True).all():
-            try:
-                del nci_map[self.server.get_member(user.discord_id)]
-            except KeyError:
-                pass
-
-        # get the last checkins of users who did not check in during the reporting week
-        try:
-            start, _ = self.get_check_in_week(included_date)
-            prev_map = self.query_latest_check_ins(members=list(nci_map.keys()), before=start)
-            for m, c in prev_map.items():
-                nci_map[m] = c
-        except orm.exc.NoResultFound:
-            pass
 
+        # members w/o checkins (except exempt users), with their last checkin before that week
+        exempt_ids = self._get_exempt_ids()
+        nci_map = {m: prev_map.get(m.id) for m in self.server.members
+                   if m not in ci_map and m.id not in exempt_ids}
         return ci_map, nci_map
 
     def generate_check_in_deltas(self, included_date: datetime=None)\
@@ -277,41 +403,22 @@ class CheckInController(BlotsController):
         logger.info("generate_check_in_deltas(included_date={})"
             .format(included_date.isoformat(' ')))
 
-        ci_map = {}
-        prev_map = {}
-        diffs_map = {m: None for m in self.server.members}  # users to report
+        week_map, prev_map = self.get_week_check_ins(included_date)
 
-        # Remove exempt users from users to report
-        for user in self.session.query(User).filter_by(is_exempt=True).all():
-            try:
-                del diffs_map[self.server.get_member(user.discord_id)]
-            except KeyError:
-                pass
+        ci_map = {}
+        for discord_id, c in week_map.items():
+            m = self.server.get_member(discord_id)
+            if m is not None:  # filter members who left the server
+                ci_map[m] = c
 
-        # get this week's checkins
-        try:
-            check_ins = self.query_check_ins(included_date=included_date)
-            for c in check_ins:
-                m = self.server.get_member(c.user.discord_id)
-                if m is not None:  # filter members who left the server
-                    ci_map[m] = c
-        except orm.exc.NoResultFound:
-            pass
-
-        # get prev checkin for all users
-        try:
-            start, _ = self.get_check_in_week(included_date)
-            prev_map = self.query_latest_check_ins(members=list(diffs_map.keys()), before=start)
-            for m, c in prev_map.items():
-                if m is not None:
-                    prev_map[m] = c
-        except orm.exc.NoResultFound:
-            pass
-
-        # calculate diffs
-        for m in diffs_map.keys():
-            if m in ci_map and m in prev_map:
-                diffs_map[m] = ci_map[m].word_count - prev_map[m].word_count
+        # calculate diffs (except exempt users)
+        exempt_ids = self._get_exempt_ids()
+        diffs_map = {}  # users to report
+        for m in self.server.members:
+            if m.id in exempt_ids:
+                continue
+            if m in ci_map and m.id in prev_map:
+                diffs_map[m] = ci_map[m].word_count - prev_map[m.id].word_count
             elif m in ci_map:
                 diffs_map[m] = ci_map[m].word_count
             else:
@@ -396,6 +503,8 @@ class CheckInController(BlotsController):
                 "Message too long (max {:d} chars)".format(CheckIn.MAX_MESSAGE_LEN))
 
         logger.info("Inserting check-in by {}...".format(member.nick or member.name))
+        # a late check-in changes the reports for its own week and every week after it
+        self._drop_week_reports(CheckInWeek.end >= timestamp)
         user = self.get_user(member)
         check_in = CheckIn(timestamp=timestamp, user_id=user.user_id, word_count=word_count,
             project_type=user.project_type, message=message[:CheckIn.MAX_MESSAGE_LEN])
@@ -501,6 +610,57 @@ class BlotsBadgeController(BlotsController):
         self.session.commit()
         return badge_row
 
+    @on_error_rollback
+    def save_badges(self, badges: Sequence[Dict[str, Any]]) -> int:
+        """
+        Insert or update many badges in a single transaction. Users are resolved, and existing
+        badges looked up, once for the whole batch rather than once per badge.
+
+        :param badges: Badges to save, as dicts of :meth:`save_badge` keyword arguments.
+        :return: Number of badges inserted or updated. Badges with a reason that is too long are
+            skipped.
+        """
+        valid = []
+        for b in badges:
+            if len(b['reason']) > Badge.MAX_MESSAGE_LEN:
+                logger.warning("save_badges: skipping message {}: reason too long"
+                    .format(b['message_id']))
+            else:
+                valid.append(b)
+        if not valid:
+            return 0
+
+        users = self._get_users([b['member'].id for b in valid] +
+                                [b['from_member'].id for b in valid])
+        existing = {}  # type: Dict[str, int]
+        for chunk in chunked([b['message_id'] for b in valid], db.SQLITE_MAX_VARIABLES):
+            existing.update(self.session.query(Badge.message_id, Badge.id)
+                            .filter(Badge.message_id.in_(chunk)))
+
+        inserts = {}  # type: Dict[str, Dict[str, Any]]
+        updates = {}  # type: Dict[str, Dict[str, Any]]
+        for b in valid:
+            row = {
+                'user_id': users[b['member'].id].user_id,
+                'badge': b['badge'],
+                'reason': b['reason']
+            }
+            if b['message_id'] in existing:
+                row['id'] = existing[b['message_id']]
+                updates[b['message_id']] = row
+            else:
+                row['message_id'] = b['message_id']
+                row['timestamp'] = b['timestamp']
+                row['from_id'] = users[b['from_member'].id].user_id
+                inserts[b['message_id']] = row
+
+        self.session.bulk_insert_mappings(Badge, list(inserts.values()))
+        self.session.bulk_update_mappings(Badge, list(updates.values()))
+        self.session.commit()
+        logger.info("save_badges: inserted {:d}, updated {:d} badges"
+            .format(len(inserts), len(updates)))
+        return len(inserts) + len(updates)
+
     @on_error_rollback
     def delete_badge(self, message_id: str):
         # noinspection PyTypeChecker
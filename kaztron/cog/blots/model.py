@@ -81,6 +81,48 @@ class CheckIn(Base):
         raise NotImplementedError()
 
 
+check_in_user_index = db.Index('check_in_user_index', CheckIn.user_id, CheckIn.timestamp)
+
+
+class CheckInWeek(Base):
+    """
+    A closed check-in week whose report data has been materialised. Each user who had checked in
+    by the end of the week has a :class:`CheckInWeekEntry`.
+    """
+    __tablename__ = 'check_in_weeks'
+
+    start = db.Column(db.TIMESTAMP, primary_key=True)
+    end = db.Column(db.TIMESTAMP, nullable=False, index=True)
+    generated = db.Column(db.TIMESTAMP, nullable=False)
+    entries = db.relationship('CheckInWeekEntry', back_populates='week',
+                              cascade='all, delete-orphan')
+
+    def __repr__(self):
+        return "<CheckInWeek(start={}, end={}, generated={})>".format(
+            self.start.isoformat(' '), self.end.isoformat(' '), self.generated.isoformat(' '))
+
+
+class CheckInWeekEntry(Base):
+    """
+    A user's last check-in during a closed check-in week (if any), and their last check-in before
+    that week (if any).
+    """
+    __tablename__ = 'check_in_week_entries'
+
+    week_start = db.Column(db.TIMESTAMP, db.ForeignKey('check_in_weeks.start'), primary_key=True)
+    week = db.relationship('CheckInWeek', back_populates='entries')
+    user_id = db.Column(db.Integer, db.ForeignKey('users.user_id'), primary_key=True)
+    check_in_id = db.Column(db.Integer, db.ForeignKey('check_ins.id'), nullable=True)
+    check_in = db.relationship('CheckIn', lazy='joined', foreign_keys=[check_in_id])
+    prev_check_in_id = db.Column(db.Integer, db.ForeignKey('check_ins.id'), nullable=True)
+    prev_check_in = db.relationship('CheckIn', lazy='joined', foreign_keys=[prev_check_in_id])
+
+    def __repr__(self):
+        return "<CheckInWeekEntry(week_start={}, user_id={:d}, check_in_id={}, " \
+               "prev_check_in_id={})>".format(self.week_start.isoformat(' '), self.user_id,
+                                             self.check_in_id, self.prev_check_in_id)
+
+
 class Badge(Base):
     __tablename__ = 'badges'
 
@@ -1,17 +1,21 @@
+import asyncio
 import functools
-from datetime import timedelta
+import heapq
+from collections import namedtuple
+from datetime import datetime, timedelta
 import logging
-from typing import List, Tuple
+from typing import Tuple, Dict, Set, Optional, Sequence, Iterable, List, Union
 
 import discord
 from discord.ext import commands
 
 from kaztron import KazCog, task
-from kaztron.cog.modnotes.model import RecordType, User
+from kaztron.cog.modnotes.model import RecordType, User, Record
 from kaztron.cog.modnotes.modnotes import ModNotes
 from kaztron.cog.modnotes import controller, ModNotesConfig
 from kaztron.errors import BotCogError
 from kaztron.kazcog import ready_only
+from kaztron.scheduler import TaskInstance
 from kaztron.utils.checks import mod_only, mod_channels
 from kaztron.utils.datetime import format_timedelta
 from kaztron.utils.discord import get_named_role
@@ -40,6 +44,102 @@ class BanToolsConfig(ModNotesConfig):
     ban_perma_enforce: bool
 
 
+#: Snapshot of an active ban record. Has the ``discord_id`` and ``user_id`` attributes needed by
+#: :meth:`ModNotes.format_display_user`.
+BanEntry = namedtuple('BanEntry', 'record_id type discord_id user_id expires')
+
+
+class ActiveBans:
+    """
+    In-memory index of active (not removed, unexpired) ban records, kept up to date from modnotes
+    record changes. Expiry times are kept in a min-heap, so that the next expiry can be found
+    without scanning all bans. Heap entries are invalidated lazily: an entry whose record was
+    removed or whose expiry changed is discarded when it reaches the top of the heap.
+    """
+    TYPES = (RecordType.temp, RecordType.perma)
+
+    def __init__(self):
+        self.entries = {}  # type: Dict[int, BanEntry]
+        self._by_discord_id = {}  # type: Dict[str, Set[int]]
+        self._expiry_heap = []  # type: List[Tuple[datetime, int]]
+
+    def __len__(self):
+        return len(self.entries)
+
+    def load(self, records: Iterable[Record]):
+        """ Replace the contents of the index with the passed records. """
+        self.entries.clear()
+        self._by_discord_id.clear()
+        self._expiry_heap.clear()
+        for record in records:
+            self.update(record)
+
+    def update(self, record: Record) -> bool:
+        """
+        Add, update or remove a record from the index according to its current state.
+
+        :return: True if the index changed.
+        """
+        if record.type not in self.TYPES:
+            return False
+        old = self._remove(record.record_id)
+        if record.is_removed or (record.expires is not None and
+                                 record.expires <= datetime.utcnow()):
+            return old is not None
+
+        entry = BanEntry(record.record_id, record.type, record.user.discord_id,
+                         record.user.user_id, record.expires)
+        self.entries[entry.record_id] = entry
+        self._by_discord_id.setdefault(entry.discord_id, set()).add(entry.record_id)
+        if entry.expires is not None and (old is None or old.expires != entry.expires):
+            heapq.heappush(self._expiry_heap, (entry.expires, entry.record_id))
+        return entry != old
+
+    def _remove(self, record_id: int) -> Optional[BanEntry]:
+        entry = self.entries.pop(record_id, None)
+        if entry is not None:
+            ids = self._by_discord_id[entry.discord_id]
+            ids.discard(record_id)
+            if not ids:
+                del self._by_discord_id[entry.discord_id]
+        return entry
+
+    def _is_stale(self, expires: datetime, record_id: int) -> bool:
+        entry = self.entries.get(record_id)
+        return entry is None or entry.expires != expires
+
+    def next_expiry(self) -> Optional[datetime]:
+        """ The earliest expiry time of any ban in the index, or None if no bans expire. """
+        while self._expiry_heap and self._is_stale(*self._expiry_heap[0]):
+            heapq.heappop(self._expiry_heap)
+        return self._expiry_heap[0][0] if self._expiry_heap else None
+
+    def pop_expired(self, now: datetime=None) -> List[BanEntry]:
+        """ Remove and return all bans that expired as of ``now`` (default: current time). """
+        now = now or datetime.utcnow()
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] <= now:
+            expires, record_id = heapq.heappop(self._expiry_heap)
+            if not self._is_stale(expires, record_id):
+                expired.append(self._remove(record_id))
+        return expired
+
+    def get_banned(self, type_: RecordType, discord_id: str=None) -> Dict[str, BanEntry]:
+        """
+        Get active bans of a given type.
+
+        :param discord_id: If specified, only get bans for this Discord user.
+        :return: Dict of Discord ID to ban entry.
+        """
+        if discord_id is not None:
+            entries = (self.entries[i] for i in self._by_discord_id.get(discord_id, ()))
+        else:
+            entries = self.entries.values()
+        now = datetime.utcnow()
+        return {e.discord_id: e for e in entries
+                if e.type == type_ and (e.expires is None or e.expires > now)}
+
+
 class BanTools(KazCog):
     """!kazhelp
     category: Moderator
@@ -49,13 +149,16 @@ class BanTools(KazCog):
         {{%ModNotes}} module.
 
         This module can automatically enforce modnotes of type 'temp' and 'perma', at startup and
-        every {{check_interval}} hence.
+        every {{check_interval}} hence. Tempbans are also lifted as soon as they expire.
     contents:
         - tempban:
             - enforce
     """
     cog_config: BanToolsConfig
 
+    #: Maximum number of concurrent role edits when applying/removing bans
+    ROLE_EDIT_CONCURRENCY = 5
+
     #####
     # Lifecycle
     #####
@@ -73,6 +176,9 @@ class BanTools(KazCog):
         self.cog_config.set_converters('channel_mod', self.get_channel, None)
         self.cog_modnotes: ModNotes = None
         self.modnotes_patch_applied = False
+        self.active_bans = ActiveBans()
+        self._expiry_task = None  # type: TaskInstance
+        self._expiry_task_at = None  # type: datetime
 
     async def on_ready(self):
         await super().on_ready()
@@ -81,12 +187,18 @@ class BanTools(KazCog):
         _ = self.cog_config.ban_role  # validate that it is set and exists
         _ = self.cog_config.channel_mod  # validate that it is set and exists
 
+        # load active bans; the index is kept up to date by the record listener afterwards
+        self.active_bans.load(controller.query_unexpired_records(types=ActiveBans.TYPES))
+        controller.add_record_listener(self._on_record_changed)
+        logger.info("Loaded {:d} active bans".format(len(self.active_bans)))
+
         # schedule tempban update tick (unless already done i.e. reconnects)
         if self.cog_config.ban_temp_enforce or self.cog_config.ban_perma_enforce:
             if self.cog_modnotes and not self.scheduler.get_instances(self.task_update_tempbans):
                 self.scheduler.schedule_task_in(
                     self.task_update_tempbans, 0, every=self.cog_config.ban_check_interval
                 )
+            self._schedule_next_expiry()
 
         # ensure modnote changes trigger a reevaluation of bans
         # TODO: hacky, we should use cog_after_invoke after discord.py 1.0.0 transition
@@ -112,36 +224,85 @@ class BanTools(KazCog):
         }
 
     def unload_kazcog(self):
+        controller.remove_record_listener(self._on_record_changed)
         self.scheduler.cancel_all(self.task_update_tempbans)
+        self.scheduler.cancel_all(self.task_expire_bans)
 
     #####
     # Core
     #####
 
-    @staticmethod
-    def _get_tempbanned_members_db(server: discord.Server) -> List[Tuple[User, discord.Member]]:
-        records = controller.query_unexpired_records(types=RecordType.temp)
-        members_raw = ((r.user, server.get_member(r.user.discord_id)) for r in records)
-        return [m for m in members_raw if m[1] is not None]
+    def _on_record_changed(self, record: Record):
+        if self.active_bans.update(record) and self.cog_config.ban_temp_enforce:
+            self._schedule_next_expiry()
 
-    def _get_tempbanned_members_server(self, server: discord.Server) -> List[discord.Member]:
-        return [m for m in server.members if self.cog_config.ban_role in m.roles]
+    def _schedule_next_expiry(self):
+        """
+        Schedule :meth:`~.task_expire_bans` for the next ban expiry, replacing any previously
+        scheduled instance if the next expiry time changed.
+        """
+        next_expiry = self.active_bans.next_expiry()
+        if self._expiry_task is not None and self._expiry_task.is_active():
+            if next_expiry == self._expiry_task_at:
+                return
+            try:
+                self._expiry_task.cancel()
+            except asyncio.InvalidStateError:
+                pass
+        self._expiry_task = None
+        self._expiry_task_at = None
+
+        if next_expiry is not None:
+            logger.debug("Next ban expiry at {}".format(next_expiry.isoformat(' ')))
+            self._expiry_task = self.scheduler.schedule_task_at(self.task_expire_bans, next_expiry)
+            self._expiry_task_at = next_expiry
+
+    def _get_tempbanned_db(self, member: discord.Member=None) -> Dict[str, BanEntry]:
+        """
+        Get all users with active tempbans in modnotes.
 
-    @staticmethod
-    def _get_permabanned_members_db(server: discord.Server) -> List[Tuple[User, discord.Member]]:
-        records = controller.query_unexpired_records(types=RecordType.perma)
-        members_raw = ((r.user, server.get_member(r.user.discord_id)) for r in records)
-        return [m for m in members_raw if m[1] is not None]
+        :param member: If specified, only check this member.
+        :return: Dict of Discord ID to ban entry.
+        """
+        return self.active_bans.get_banned(RecordType.temp, member.id if member else None)
 
-    async def _update_tempbans(self):
+    def _get_tempbanned_ids_server(self, server: discord.Server, member: discord.Member=None)\
+            -> Set[str]:
+        """
+        Get the Discord IDs of all members who currently have the ban role.
+
+        :param member: If specified, only check this member.
+        """
+        members = server.members if member is None else (member,)
+        return {m.id for m in members if self.cog_config.ban_role in m.roles}
+
+    def _get_permabanned_db(self, member: discord.Member=None) -> Dict[str, BanEntry]:
+        """
+        Get all users with active permabans in modnotes.
+
+        :param member: If specified, only check this member.
+        :return: Dict of Discord ID to ban entry.
+        """
+        return self.active_bans.get_banned(RecordType.perma, member.id if member else None)
+
+    def _format_user(self, user: Optional[Union[User, BanEntry]], member: discord.Member):
+        if user is not None:
+            return self.cog_modnotes.format_display_user(user)
+        else:
+            return member.mention
+
+    async def _update_tempbans(self, member: discord.Member=None):
         """
         Check and update all current tempbans in modnotes. Unexpired tempbans will be applied and
         expired tempbans will be removed, when needed.
+
+        :param member: If specified, only check and update this member (e.g. on join).
         """
         if not self.cog_config.ban_temp_enforce:
             return
 
-        logger.info("Checking all tempbans.")
+        logger.info("Checking {}.".format('tempbans for {}'.format(member) if member else
+                                          'all tempbans'))
         try:
             server = self.cog_config.channel_mod.server  # type: discord.Server
         except AttributeError:  # get_channel failed
@@ -149,44 +310,83 @@ class BanTools(KazCog):
             await self.send_output("**ERROR**: update_tempbans: can't find mod channel")
             return
 
-        bans_db = self._get_tempbanned_members_db(server)
-        bans_server = self._get_tempbanned_members_server(server)
+        bans_db = self._get_tempbanned_db(member)
+        bans_server = self._get_tempbanned_ids_server(server, member)
+
+        # members who need to be banned
+        to_ban = []
+        for discord_id in bans_db.keys() - bans_server:
+            ban_member = server.get_member(discord_id)
+            if ban_member is not None:
+                to_ban.append((bans_db[discord_id], ban_member))
+
+        # members who need to be unbanned
+        unban_ids = bans_server - bans_db.keys()
+        unban_users = controller.query_users_by_discord_ids(unban_ids) if unban_ids else {}
+        to_unban = [(unban_users.get(discord_id), server.get_member(discord_id))
+                    for discord_id in unban_ids]
+
+        if to_ban or to_unban:
+            logger.info("Tempbans: {:d} to apply, {:d} to remove"
+                .format(len(to_ban), len(to_unban)))
+        await self._edit_ban_roles(to_ban, to_unban, "tempbanned")
+
+    async def _edit_ban_roles(self,
+                              to_ban: Sequence[Tuple[Optional[Union[User, BanEntry]],
+                                                     discord.Member]],
+                              to_unban: Sequence[Tuple[Optional[Union[User, BanEntry]],
+                                                       discord.Member]],
+                              reason: str):
+        """
+        Apply the ban role to, and remove it from, the passed members. Role edits are made
+        concurrently, up to ``ROLE_EDIT_CONCURRENCY`` at a time.
 
-        # check if any members who need to be banned
-        for user, member in bans_db:
-            user_formatted = self.cog_modnotes.format_display_user(user)
-            if member not in bans_server:
-                logger.info("Applying ban role '{role}' to {user!s} (tempbanned)...".format(
-                    role=self.cog_config.ban_role.name,
-                    user=user_formatted
-                ))
-                await self.bot.add_roles(member, self.cog_config.ban_role)
-                await self.bot.send_message(self.cog_config.channel_mod,
-                    "Tempbanned {}".format(user_formatted))
-
-        # check if any members who need to be unbanned
-        bans_db_members = tuple(u[1] for u in bans_db)
-        for member in bans_server:
-            if member not in bans_db_members:
-                user = await controller.get_user_by_discord_id(member.id, self.bot)
-                user_formatted = self.cog_modnotes.format_display_user(user)
+        :raise Exception: The first error that occurred, after all edits have been attempted.
+        """
+        role = self.cog_config.ban_role
+        semaphore = asyncio.Semaphore(self.ROLE_EDIT_CONCURRENCY)
+
+        async def ban(user: Optional[Union[User, BanEntry]], member: discord.Member):
+            user_formatted = self._format_user(user, member)
+            async with semaphore:
+                logger.info("Applying ban role '{role}' to {user!s} ({reason})...".format(
+                    role=role.name, user=user_formatted, reason=reason))
+                await self.bot.add_roles(member, role)
+            await self.send_message(self.cog_config.channel_mod,
+                "Tempbanned {}".format(user_formatted), coalesce=True)
+
+        async def unban(user: Optional[Union[User, BanEntry]], member: discord.Member):
+            user_formatted = self._format_user(user, member)
+            async with semaphore:
                 logger.info("Removing ban role '{role}' from {user!s}...".format(
-                    role=self.cog_config.ban_role.name,
-                    user=user_formatted
-                ))
-                await self.bot.remove_roles(member, self.cog_config.ban_role)
-                await self.bot.send_message(self.cog_config.channel_mod,
-                    "Unbanned {}".format(user_formatted))
-
-    async def _check_permabans(self):
+                    role=role.name, user=user_formatted))
+                await self.bot.remove_roles(member, role)
+            await self.send_message(self.cog_config.channel_mod,
+                "Unbanned {}".format(user_formatted), coalesce=True)
+
+        results = await asyncio.gather(
+            *(ban(user, member) for user, member in to_ban),
+            *(unban(user, member) for user, member in to_unban),
+            return_exceptions=True
+        )
+        errors = [r for r in results if isinstance(r, Exception)]
+        for e in errors:
+            logger.error("Error editing ban role: {!r}".format(e))
+        if errors:
+            raise errors[0]
+
+    async def _check_permabans(self, member: discord.Member=None):
         """
         Check all current permabans in modnotes. Unexpired permabans will raise a notification to
         mods.
+
+        :param member: If specified, only check this member (e.g. on join).
         """
         if not self.cog_config.ban_perma_enforce:
             return
 
-        logger.info("Checking all permabans.")
+        logger.info("Checking {}.".format('permabans for {}'.format(member) if member else
+                                          'all permabans'))
         try:
             server = self.cog_config.channel_mod.server  # type: discord.Server
         except AttributeError:  # get_channel failed
@@ -194,37 +394,51 @@ class BanTools(KazCog):
             await self.send_output("**ERROR**: update_tempbans: can't find mod channel")
             return
 
-        bans_db = self._get_permabanned_members_db(server)
+        bans_db = self._get_permabanned_db(member)
+        bans = [(user, server.get_member(discord_id)) for discord_id, user in bans_db.items()]
+        bans = [(user, ban_member) for user, ban_member in bans if ban_member is not None]
 
         # check if any members who need to be banned
-        for user, member in bans_db:
-            user_formatted = self.cog_modnotes.format_display_user(user)
-            if self.cog_config.ban_temp_enforce:
-                logger.info("Applying ban role '{role}' to {user!s} (permabanned)...".format(
-                    role=self.cog_config.ban_role.name,
-                    user=user_formatted
-                ))
-                await self.bot.add_roles(member, self.cog_config.ban_role)
-                await self.bot.send_message(self.cog_config.channel_mod,
-                    "Tempbanned {}".format(user_formatted))
-            await self.bot.send_message(self.cog_config.channel_mod,
+        if self.cog_config.ban_temp_enforce:
+            role = self.cog_config.ban_role
+            await self._edit_ban_roles([b for b in bans if role not in b[1].roles], (),
+                                       "permabanned")
+        for user, ban_member in bans:
+            await self.send_message(self.cog_config.channel_mod,
                 "**BAN CHECK**: User {} is permabanned but currently on the server!"
-                    .format(user_formatted))
+                    .format(self._format_user(user, ban_member)), coalesce=True)
 
     #####
     # Discord
     #####
 
     @ready_only
-    async def on_member_join(self, _: discord.Member):
-        await self._update_tempbans()
-        await self._check_permabans()
+    async def on_member_join(self, member: discord.Member):
+        await self._update_tempbans(member)
+        await self._check_permabans(member)
 
     @task(is_unique=True)
     async def task_update_tempbans(self):
         await self._update_tempbans()
         await self._check_permabans()
 
+    @task(is_unique=False)
+    async def task_expire_bans(self):
+        self._expiry_task = None  # this instance is done: don't let rescheduling cancel it
+        expired = self.active_bans.pop_expired()
+        try:
+            server = self.cog_config.channel_mod.server  # type: discord.Server
+        except AttributeError:  # get_channel failed
+            server = None
+        try:
+            for entry in expired:
+                logger.info("Ban record {:d} expired".format(entry.record_id))
+                member = server.get_member(entry.discord_id) if server else None
+                if entry.type == RecordType.temp and member is not None:
+                    await self._update_tempbans(member)
+        finally:
+            self._schedule_next_expiry()
+
     @commands.group(invoke_without_command=True, pass_context=True)
     @mod_only()
     @mod_channels()
@@ -1,6 +1,8 @@
+import asyncio
 import logging
 from datetime import datetime
-from typing import List, Union, Tuple, Optional, Iterable, Sequence
+from typing import List, Union, Tuple, Optional, Iterable, Sequence, Dict, Callable, Set, \
+    Awaitable
 
 import discord
 
@@ -8,8 +10,10 @@ import discord
 from kaztron.driver import database as db
 from kaztron.cog.modnotes.model import *
 from kaztron.driver.database import make_error_handler_decorator, format_like
+from kaztron.utils.containers import TtlLruCache
 from kaztron.utils.discord import extract_user_id
 from kaztron.utils.datetime import format_timestamp
+from kaztron.utils.itertools import chunked
 
 logger = logging.getLogger(__name__)
 
@@ -19,6 +23,17 @@ engine = None
 Session = db.sessionmaker()
 session = None
 
+_record_listeners = []  # type: List[Callable[[Record], None]]
+
+#: Cache of Discord ID to database User. User objects stay attached to the session, so in-place
+#: changes are always reflected; entries are invalidated on name, alias and group changes.
+user_cache = TtlLruCache(maxsize=1024, ttl=600)
+
+#: Pending name/alias updates (user ID -> (user, Discord name, nickname)), flushed in one commit by
+#: :func:`flush_nickname_updates`.
+_pending_nicknames = {}  # type: Dict[int, Tuple[User, str, Optional[str]]]
+_alias_dedup_done = set()  # type: Set[int]
+
 
 class UserNotFound(RuntimeError):
     pass
@@ -35,6 +50,31 @@ def init_db():
 on_error_rollback = make_error_handler_decorator(lambda *args, **kwargs: session, logger)
 
 
+def add_record_listener(listener: Callable[[Record], None]):
+    """
+    Add a listener called whenever a record is inserted or changed (including being marked removed
+    or restored) via this controller. Called with the record, after the change is committed.
+    """
+    if listener not in _record_listeners:
+        _record_listeners.append(listener)
+
+
+def remove_record_listener(listener: Callable[[Record], None]):
+    try:
+        _record_listeners.remove(listener)
+    except ValueError:
+        pass
+
+
+def _notify_record_changed(record: Record):
+    for listener in _record_listeners:
+        # noinspection PyBroadException
+        try:
+            listener(record)
+        except Exception:
+            logger.exception("Error in record listener {!r}".format(listener))
+
+
 async def create_user(discord_id: str, bot: discord.Client) -> User:
     """
     Create a database user
@@ -76,6 +116,7 @@ async def create_user(discord_id: str, bot: discord.Client) -> User:
         raise
     else:
         logger.debug('Created user: {!r}'.format(db_user))
+        user_cache.put(discord_id, db_user)
 
     return db_user
 
@@ -107,13 +148,10 @@ async def query_user(bot: discord.Client, id_: str):
         db_user = await get_user_by_db_id(db_id, bot)
     elif id_[-5] == '#':   # name#discriminator lookup
         id_ = id_.lstrip('@')  # stray @ from an attempted mention
-        for server in bot.servers:
-            member = server.get_member_named(id_)
-            if member:
-                db_user = await get_user_by_discord_id(member.id, bot)
-                break
-        else:
+        member = bot.member_index.get_member_named(id_)
+        if not member:
             raise ValueError('Invalid Discord user ID format')
+        db_user = await get_user_by_discord_id(member.id, bot)
     else:  # mention/ID lookup
         try:
             discord_id = extract_user_id(id_)
@@ -124,7 +162,7 @@ async def query_user(bot: discord.Client, id_: str):
     for server in bot.servers:
         member = server.get_member(db_user.discord_id)  # type: discord.Member
         if member:
-            update_nicknames(db_user, member)
+            queue_nickname_update(db_user, member)
             break
     else:
         logger.warning("Can't find Discord member to update nicknames for {!r}".format(db_user))
@@ -140,6 +178,10 @@ async def get_user_by_discord_id(discord_id: str, bot: discord.Client) -> User:
     :return: The database User object
     """
     logger.debug('get_user_by_discord_id: passed Discord ID: {}'.format(discord_id))
+    db_user = user_cache.get(discord_id)
+    if db_user is not None:
+        return db_user
+
     # Try to find discord_id in database
     try:
         db_user = session.query(User).filter_by(discord_id=discord_id).one_or_none()
@@ -150,12 +192,44 @@ async def get_user_by_discord_id(discord_id: str, bot: discord.Client) -> User:
 
     if db_user:
         logger.debug('get_user_by_discord_id: found user: {!r}'.format(db_user))
+        user_cache.put(discord_id, db_user)
     else:  # If does not exist - make a new user in database
         logger.debug('get_user_by_discord_id: user not found, creating record')
         db_user = await create_user(discord_id, bot)
     return db_user
 
 
+def query_users_by_discord_ids(discord_ids: Iterable[str]) -> Dict[str, User]:
+    """
+    Find existing database users by Discord ID. Does not create users: Discord IDs not in the
+    database are omitted from the result.
+
+    :param discord_ids: The Discord IDs, as numeric strings.
+    :return: Dict of Discord ID to database User object.
+    """
+    users = {}
+    misses = []
+    for discord_id in discord_ids:
+        db_user = user_cache.get(discord_id)
+        if db_user is not None:
+            users[discord_id] = db_user
+        else:
+            misses.append(discord_id)
+    for id_chunk in chunked(misses, db.SQLITE_MAX_VARIABLES):
+        for db_user in session.query(User).filter(User.discord_id.in_(id_chunk)):
+            users[db_user.discord_id] = db_user
+            user_cache.put(db_user.discord_id, db_user)
+    return users
+
+
+def invalidate_user_cache(*users: User):
+    """ Invalidate cached users. If no users are passed, invalidate the whole cache. """
+    if not users:
+        user_cache.clear()
+    for user in users:
+        user_cache.invalidate(user.discord_id)
+
+
 async def get_user_by_db_id(user_id: int, bot: discord.Client) -> User:
     """
     Find a database user by the database user ID.
@@ -180,25 +254,72 @@ async def get_user_by_db_id(user_id: int, bot: discord.Client) -> User:
 @on_error_rollback
 def update_nicknames(user: User, member: discord.Member):
     """
-    Update a user's nicknames and usernames.
+    Update a user's nicknames and usernames immediately. See also :func:`queue_nickname_update`.
     """
-    # to fix a previous bug that added duplicates...
-    fix_alias_duplicates(user)
+    _update_nicknames(user, member.name, member.nick)
+    _pending_nicknames.pop(user.user_id, None)
+    session.commit()
+
+
+def _update_nicknames(user: User, name: str, nick: Optional[str]):
+    # to fix a previous bug that added duplicates... only needed once per user
+    if user.user_id not in _alias_dedup_done:
+        fix_alias_duplicates(user)
+        _alias_dedup_done.add(user.user_id)
 
     # actual nickname update
     logger.debug("update_nicknames: Updating names: {!r}...".format(user))
     # noinspection PyTypeChecker
     alias_names = [a.name for a in user.aliases]
-    if member.nick and member.nick != user.name and member.nick not in alias_names:
+    if nick and nick != user.name and nick not in alias_names:
         # noinspection PyUnresolvedReferences
-        user.aliases.append(UserAlias(user=user, name=member.nick))
-        logger.debug("update_nicknames: Added name {!r}".format(member.nick))
-    if member.name != user.name and member.name not in alias_names:
+        user.aliases.append(UserAlias(user=user, name=nick))
+        logger.debug("update_nicknames: Added name {!r}".format(nick))
+    if name != user.name and name not in alias_names:
         # noinspection PyUnresolvedReferences
-        user.aliases.append(UserAlias(user=user, name=member.name))
-        logger.debug("update_nicknames: Added name {!r}".format(member.name))
+        user.aliases.append(UserAlias(user=user, name=name))
+        logger.debug("update_nicknames: Added name {!r}".format(name))
+
+
+def queue_nickname_update(user: User, member: discord.Member):
+    """
+    Queue an update of a user's nicknames and usernames, to be written in the next
+    :func:`flush_nickname_updates`. No effect if the member's current names are already known.
+    """
+    # noinspection PyTypeChecker
+    known_names = {user.name} | {a.name for a in user.aliases}
+    if member.name in known_names and (not member.nick or member.nick in known_names):
+        _pending_nicknames.pop(user.user_id, None)
+        return
+    _pending_nicknames[user.user_id] = (user, member.name, member.nick)
+
+
+def queue_member_nickname_update(member: discord.Member):
+    """
+    Queue a nickname update for a member if their database user is cached (e.g. on member update).
+    Members who are not cached are updated the next time they are looked up.
+    """
+    db_user = user_cache.get(member.id, count=False)
+    if db_user is not None:
+        queue_nickname_update(db_user, member)
+
 
+@on_error_rollback
+def flush_nickname_updates() -> int:
+    """
+    Write all queued nickname updates in a single commit.
+
+    :return: Number of users updated.
+    """
+    if not _pending_nicknames:
+        return 0
+    pending = list(_pending_nicknames.values())
+    _pending_nicknames.clear()
+    for user, name, nick in pending:
+        _update_nicknames(user, name, nick)
     session.commit()
+    logger.info("flush_nickname_updates: Updated names for {:d} users".format(len(pending)))
+    return len(pending)
 
 
 @on_error_rollback
@@ -227,6 +348,40 @@ def query_user_group(user: User) -> List[User]:
         return [user]
 
 
+def _user_records_query(user_group: Union[User, Sequence[User], None], removed=False) -> db.Query:
+    user_list = [user_group] if isinstance(user_group, User) else user_group
+    query = session.query(Record).filter_by(is_removed=removed)
+    if user_list:
+        # noinspection PyUnresolvedReferences
+        query = query.filter(Record.user_id.in_(u.user_id for u in user_list))
+    return query
+
+
+def _unexpired_records_query(users: Union[User, Iterable[User]]=None,
+                             types: Union[RecordType, Iterable[RecordType]]=None) -> db.Query:
+    user_list = [users] if isinstance(users, User) else users  # type: Optional[List[User]]
+    rtypes = [types] if isinstance(types, RecordType) else types  # type: Optional[List[RecordType]]
+
+    # noinspection PyComparisonWithNone,PyPep8
+    query = session.query(Record).filter_by(is_removed=False) \
+                   .filter(db.or_(datetime.utcnow() < Record.expires, Record.expires == None))
+    if user_list:
+        # noinspection PyUnresolvedReferences
+        query = query.filter(Record.user_id.in_(u.user_id for u in user_list))
+    if rtypes:
+        query = query.filter(Record.type.in_(rtypes))
+    return query
+
+
+def _user_joins_query(user_group: Union[User, Sequence[User], None]) -> db.Query:
+    user_list = [user_group] if isinstance(user_group, User) else user_group
+    query = session.query(JoinRecord)
+    if user_list:
+        # noinspection PyUnresolvedReferences
+        query = query.filter(JoinRecord.user_id.in_(u.user_id for u in user_list))
+    return query
+
+
 def query_user_records(user_group: Union[User, Sequence[User], None], removed=False)\
         -> List[Record]:
     """
@@ -234,15 +389,7 @@ def query_user_records(user_group: Union[User, Sequence[User], None], removed=Fa
     :param removed: Whether to search for non-removed or removed records.
     :return:
     """
-    # Input validation
-    user_list = [user_group] if isinstance(user_group, User) else user_group
-
-    # Query
-    query = session.query(Record).filter_by(is_removed=removed)
-    if user_list:
-        # noinspection PyUnresolvedReferences
-        query = query.filter(Record.user_id.in_(u.user_id for u in user_list))
-    results = query.order_by(Record.timestamp).all()
+    results = _user_records_query(user_group, removed).order_by(Record.timestamp).all()
     logger.info("query_user_records: "
                 "Found {:d} records for user group: {!r}".format(len(results), user_group))
     return results
@@ -256,25 +403,117 @@ def query_unexpired_records(*,
     :param users: User or user group as a list of users.
     :param types: type of record, or an iterable of them
     """
-    # Input validation
-    user_list = [users] if isinstance(users, User) else users  # type: Optional[List[User]]
-    rtypes = [types] if isinstance(types, RecordType) else types  # type: Optional[List[RecordType]]
-
-    # Query
-    # noinspection PyComparisonWithNone,PyPep8
-    query = session.query(Record).filter_by(is_removed=False) \
-                   .filter(db.or_(datetime.utcnow() < Record.expires, Record.expires == None))
-    if user_list:
-        # noinspection PyUnresolvedReferences
-        query = query.filter(Record.user_id.in_(u.user_id for u in user_list))
-    if rtypes:
-        query = query.filter(Record.type.in_(rtypes))
-    results = query.order_by(Record.timestamp).all()
+    results = _unexpired_records_query(users, types).order_by(Record.timestamp).all()
     logger.info("query_unexpired_records: "
-                "Found {:d} records for users={!r} types={!r}".format(len(results), users, rtypes))
+                "Found {:d} records for users={!r} types={!r}".format(len(results), users, types))
     return results
 
 
+class RecordStream:
+    """
+    Query-backed stream of records, optionally merged with join/part records, in chronological
+    order. The stream can be counted and paged through in the database, without loading all of it.
+
+    Items are ordered by (timestamp, kind, id), so that records sort before joins with the same
+    timestamp. Pages are retrieved by offset from either end of the stream.
+
+    Use :func:`query_user_records_stream` or :func:`query_unexpired_records_stream` to create.
+    """
+    KIND_RECORD = 0
+    KIND_JOIN = 1
+
+    def __init__(self, record_query: db.Query, join_query: db.Query=None):
+        self.record_query = record_query
+        self.join_query = join_query
+        self._count = None  # type: int
+
+    def _keys(self):
+        query = self.record_query.with_entities(
+            Record.timestamp.label('timestamp'),
+            db.literal(self.KIND_RECORD).label('kind'),
+            Record.record_id.label('id'))
+        if self.join_query is not None:
+            query = query.union_all(self.join_query.with_entities(
+                JoinRecord.timestamp, db.literal(self.KIND_JOIN), JoinRecord.join_id))
+        return query.subquery()
+
+    def __len__(self):
+        if self._count is None:
+            self._count = session.query(db.func.count()).select_from(self._keys()).scalar()
+        return self._count
+
+    def page(self, limit: int, *, offset=0, from_end=False) -> List[Union[Record, JoinRecord]]:
+        """
+        Retrieve a page of the stream, in chronological order.
+
+        :param limit: Maximum number of items to retrieve.
+        :param offset: Number of items to skip, counting from the start of the stream (or from the
+            end, if ``from_end`` is True).
+        :param from_end: If True, retrieve the last ``limit`` items (after ``offset``) instead of
+            the first.
+        """
+        if limit <= 0:
+            return []
+        keys = self._keys()
+        query = session.query(keys.c.timestamp, keys.c.kind, keys.c.id)
+        if from_end:
+            order = (keys.c.timestamp.desc(), keys.c.kind.desc(), keys.c.id.desc())
+        else:
+            order = (keys.c.timestamp, keys.c.kind, keys.c.id)
+        page_keys = query.order_by(*order).offset(offset).limit(limit).all()
+        if from_end:
+            page_keys.reverse()
+
+        record_ids = [i for _, k, i in page_keys if k == self.KIND_RECORD]
+        join_ids = [i for _, k, i in page_keys if k == self.KIND_JOIN]
+        items = {}
+        if record_ids:
+            # noinspection PyUnresolvedReferences
+            for r in session.query(Record).filter(Record.record_id.in_(record_ids)):
+                items[(self.KIND_RECORD, r.record_id)] = r
+        if join_ids:
+            # noinspection PyUnresolvedReferences
+            for j in session.query(JoinRecord).filter(JoinRecord.join_id.in_(join_ids)):
+                items[(self.KIND_JOIN, j.join_id)] = j
+        return [items[(k, i)] for _, k, i in page_keys]
+
+    def slice(self, start: int, end: int) -> List[Union[Record, JoinRecord]]:
+        """
+        Retrieve items by index, as ``stream[start:end]`` (non-negative indices only). The offset
+        is counted from whichever end of the stream is nearer, so the latest pages are cheap.
+        """
+        total = len(self)
+        end = min(end, total)
+        if start >= end:
+            return []
+        if total - end < start:
+            return self.page(end - start, offset=total - end, from_end=True)
+        else:
+            return self.page(end - start, offset=start)
+
+
+def query_user_records_stream(user_group: Union[User, Sequence[User], None], removed=False,
+                              joins=False) -> RecordStream:
+    """
+    Query-backed equivalent of :func:`query_user_records`, optionally merged with
+    :func:`query_user_joins`.
+
+    :param user_group: User or user group as an iterable of users.
+    :param removed: Whether to search for non-removed or removed records.
+    :param joins: Whether to include the user group's join/part records in the stream.
+    """
+    return RecordStream(_user_records_query(user_group, removed),
+                        _user_joins_query(user_group) if joins else None)
+
+
+def query_unexpired_records_stream(*,
+                                   users: Union[User, Iterable[User]]=None,
+                                   types: Union[RecordType, Iterable[RecordType]]=None
+                                   ) -> RecordStream:
+    """ Query-backed equivalent of :func:`query_unexpired_records`. """
+    return RecordStream(_unexpired_records_query(users, types))
+
+
 def search_users(search_term: str) -> List[User]:
     """
     Search for users.
@@ -301,6 +540,7 @@ def set_user_name(user: User, new_name: str) -> User:
     logger.info("Updating user {0!r} name from {0.name!r} to {1!r}".format(user, new_name))
     user.name = new_name
     session.commit()
+    invalidate_user_cache(user)
     return user
 
 
@@ -322,6 +562,7 @@ def add_user_alias(user: User, alias: str) -> UserAlias:
     # noinspection PyUnresolvedReferences
     user.aliases.append(db_alias)
     session.commit()
+    invalidate_user_cache(user)
     return db_alias
 
 
@@ -341,6 +582,7 @@ def remove_user_alias(user: User, alias: str):
     logger.info("Updating user {0!r} - removing alias {1!r}".format(user, alias))
     session.delete(alias)
     session.commit()
+    invalidate_user_cache(user)
 
 
 @on_error_rollback
@@ -371,6 +613,7 @@ def group_users(user1: User, user2: User) -> Tuple[User, User]:
         user1.group_id = user2.group_id = user1.user_id
 
     session.commit()
+    invalidate_user_cache(user1, user2)
     return user1, user2
 
 
@@ -379,6 +622,7 @@ def ungroup_user(user: User) -> User:
     logger.info("Updating user {!r} - remove from group".format(user))
     user.group_id = None
     session.commit()
+    invalidate_user_cache(user)
     return user
 
 
@@ -401,6 +645,7 @@ def insert_note(*, user: User, author: User, type_: RecordType,
                  timestamp=timestamp, expires=expires, body=body)
     session.add(rec)
     session.commit()
+    _notify_record_changed(rec)
     return rec
 
 
@@ -418,6 +663,7 @@ def mark_removed_record(record_id: int, removed=True) -> Record:
     logger.info("Marking record {!r} as {}removed".format(record, '' if removed else 'not '))
     record.is_removed = removed
     session.commit()
+    _notify_record_changed(record)
     return record
 
 
@@ -437,6 +683,7 @@ def update_record(record_id: int, **kwargs) -> Record:
     for k, v in kwargs.items():
         setattr(record, k, v)
     session.commit()
+    _notify_record_changed(record)
     return record
 
 
@@ -462,42 +709,88 @@ def query_user_joins(user_group: Union[User, Sequence[User], None]) \
     :param user_group: User or user group as an iterable of users.
     :return:
     """
-    # Input validation
-    user_list = [user_group] if isinstance(user_group, User) else user_group
-
-    # Query
-    query = session.query(JoinRecord)
-    if user_list:
-        # noinspection PyUnresolvedReferences
-        query = query.filter(JoinRecord.user_id.in_(u.user_id for u in user_list))
-    results = query.order_by(JoinRecord.timestamp).all()
+    results = _user_joins_query(user_group).order_by(JoinRecord.timestamp).all()
     logger.info("query_user_joins: "
                 "Found {:d} records for user group: {!r}".format(len(results), user_group))
     return results
 
 
-def purge_joins(before: datetime) -> Sequence[Tuple[str, int]]:
+#: Progress callback for :func:`purge_joins`: called with (users scanned, total users, join
+#: records deleted so far).
+PurgeProgressCallback = Callable[[int, int, int], Awaitable[None]]
+
+
+async def purge_joins(before: datetime, *, chunk_size=500, progress: PurgeProgressCallback=None)\
+        -> Sequence[Tuple[str, int]]:
     """
     Purge all records that a) have no modnotes; b) user last seen LEAVING before this date
     (and has not rejoined).
+
+    Users are scanned in chunks of ``chunk_size``, ordered by user ID. Each chunk is deleted and
+    committed in its own short transaction, and control is yielded to the event loop between
+    chunks.
+
+    :param before: Purge users last seen before this time.
+    :param chunk_size: Number of users to scan per chunk.
+    :param progress: Optional coroutine called after each chunk.
+    :return: Sequence of (name, user_id) for the purged users.
     """
-    latest_joins = session.query(JoinRecord, db.func.max(JoinRecord.timestamp).label('latest')) \
-        .group_by(JoinRecord.user_id).subquery(name='latest_joins')  # type: db.Query
+    total_users = session.query(db.func.count(User.user_id)).scalar()
+    purge_user_pairs = []
+    n_users = 0
+    n_deleted = 0
+    last_id = None
+    while True:
+        chunk_q = session.query(User.user_id).order_by(User.user_id)
+        if last_id is not None:
+            chunk_q = chunk_q.filter(User.user_id > last_id)
+        chunk_ids = [row[0] for row in chunk_q.limit(chunk_size)]
+        if not chunk_ids:
+            break
+        first_id, last_id = chunk_ids[0], chunk_ids[-1]
+        n_users += len(chunk_ids)
+
+        try:
+            chunk_pairs = _query_purge_users(first_id, last_id, before)
+            if chunk_pairs:
+                # noinspection PyUnresolvedReferences
+                n_deleted += session.query(JoinRecord) \
+                    .filter(JoinRecord.user_id.in_([u[1] for u in chunk_pairs])) \
+                    .delete(synchronize_session=False)
+            session.commit()
+        except Exception:
+            session.rollback()
+            raise
+        purge_user_pairs.extend(chunk_pairs)
+
+        logger.debug("purge_joins: scanned {:d}/{:d} users, purged {:d} records"
+            .format(n_users, total_users, n_deleted))
+        if progress:
+            await progress(n_users, total_users, n_deleted)
+        await asyncio.sleep(0)
+
+    logger.info("purge_joins: Purged {:d} records from {:d} users"
+        .format(n_deleted, len(purge_user_pairs)))
+    logger.debug("purge_joins: {}".format('; '.join(f'{u[0]} *{u[1]}' for u in purge_user_pairs)))
+    return purge_user_pairs
+
+
+def _query_purge_users(first_id: int, last_id: int, before: datetime) -> List[Tuple[str, int]]:
+    """ Find users in the given user ID range whose join records can be purged. """
+    latest_joins = session \
+        .query(JoinRecord.user_id, db.func.max(JoinRecord.timestamp).label('latest')) \
+        .filter(JoinRecord.user_id.between(first_id, last_id)) \
+        .group_by(JoinRecord.user_id).subquery(name='latest_joins')
 
-    purge_users_q = session.query(User) \
+    # noinspection PyComparisonWithNone,PyPep8
+    query = session.query(User.name, User.user_id) \
         .join(latest_joins, User.user_id == latest_joins.c.user_id) \
+        .join(JoinRecord, db.and_(JoinRecord.user_id == latest_joins.c.user_id,
+                                  JoinRecord.timestamp == latest_joins.c.latest)) \
         .outerjoin(Record, Record.user_id == User.user_id) \
         .filter(Record.record_id == None) \
-        .filter(latest_joins.c.direction == JoinDirection.part) \
-        .filter(latest_joins.c.latest <= before)
-    purge_users = purge_users_q.all()
-    purge_user_pairs = tuple((u.name, u.user_id) for u in purge_users)
-
-    n = session.query(JoinRecord) \
-        .filter(JoinRecord.user_id.in_(u.user_id for u in purge_users)) \
-        .delete(synchronize_session='fetch')
-    session.commit()
-    logger.info("purge_joins: Purged {:d} records from {:d} users".format(n, len(purge_user_pairs)))
-    logger.debug("purge_joins: {}".format('; '.join(f'{u[0]} *{u[1]}' for u in purge_user_pairs)))
-    return purge_user_pairs
+        .filter(JoinRecord.direction == JoinDirection.part) \
+        .filter(latest_joins.c.latest <= before) \
+        .distinct()
+    return [(name, user_id) for name, user_id in query]
 
@@ -33,6 +33,9 @@ class JoinTools(KazCog):
     """
     cog_config: ModNotesConfig
 
+    #: Minimum interval (in seconds) between progress updates during a purge
+    PURGE_PROGRESS_INTERVAL = 5.0
+
     #####
     # Lifecycle
     #####
@@ -91,7 +94,20 @@ class JoinTools(KazCog):
             no modnotes.
         """
         limit_time = datetime.utcnow() - timedelta(days=30)
-        purge_list = controller.purge_joins(before=limit_time)
+        status_msg = await self.bot.send_message(ctx.message.channel, "Purging join records...")
+        last_update = self.bot.loop.time()
+
+        async def progress(n_users: int, total_users: int, n_deleted: int):
+            nonlocal last_update
+            now = self.bot.loop.time()
+            if now - last_update >= self.PURGE_PROGRESS_INTERVAL:
+                last_update = now
+                await self.bot.edit_message(status_msg,
+                    "Purging join records... {:d}/{:d} users checked, {:d} records purged"
+                    .format(n_users, total_users, n_deleted))
+
+        purge_list = await controller.purge_joins(before=limit_time, progress=progress)
+        await self.bot.edit_message(status_msg, "Purging join records... done.")
         await self.send_message(ctx.message.channel, ctx.message.author.mention +
          " Purged {} records".format(len(purge_list)))
 
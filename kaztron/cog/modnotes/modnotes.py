@@ -7,11 +7,12 @@ from typing import Optional, Sequence, Union
 import discord
 from discord.ext import commands
 
-from kaztron import KazCog
+from kaztron import KazCog, task
 from kaztron import theme
 from kaztron.config import SectionView
 from kaztron.driver import database as db
-from kaztron.driver.pagination import Pagination
+from kaztron.driver.pagination import Pagination, QueryPagination
+from kaztron.kazcog import ready_only
 from kaztron.utils.converter import NaturalInteger
 from kaztron.utils.datetime import parse as dt_parse
 from kaztron.utils.checks import mod_only, mod_channels, admin_only, admin_channels
@@ -69,6 +70,9 @@ class ModNotes(KazCog):
     NOTES_PAGE_SIZE = 10
     USEARCH_PAGE_SIZE = 20
 
+    #: Interval (in seconds) at which queued user name/alias updates are written to the database
+    NICKNAME_SYNC_INTERVAL = 60
+
     EMBED_SEPARATOR = '\n{}'.format('\\_'*16)
     EMBED_FIELD_LEN = Limits.EMBED_FIELD_VALUE - len(EMBED_SEPARATOR)
 
@@ -96,6 +100,22 @@ class ModNotes(KazCog):
         await super().on_ready()
         _ = self.cog_config.channel_log  # validate set and exists
         _ = self.cog_config.channel_mod  # validate set and exists
+        if not self.scheduler.get_instances(self.task_flush_nicknames):
+            self.scheduler.schedule_task_in(self.task_flush_nicknames,
+                self.NICKNAME_SYNC_INTERVAL, every=self.NICKNAME_SYNC_INTERVAL)
+
+    def unload_kazcog(self):
+        self.scheduler.cancel_all(self.task_flush_nicknames)
+        c.flush_nickname_updates()
+
+    @task(is_unique=True)
+    async def task_flush_nicknames(self):
+        c.flush_nickname_updates()
+
+    @ready_only
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        if before.name != after.name or before.nick != after.nick:
+            c.queue_member_nickname_update(after)
 
     @staticmethod
     def format_display_user(db_user: User):
@@ -239,6 +259,27 @@ class ModNotes(KazCog):
             rmerged.append(DummyRecord(text='\n'.join(join_strings)))
         return rmerged
 
+    def paginate_records(self, stream: c.RecordStream, page: int=None) -> QueryPagination:
+        """
+        Lazily paginate a record stream for :meth:`show_record_page`, with the latest records on
+        the last page. Join/part records on a page are merged into display strings.
+
+        :param page: The page to select (1-indexed), clamped to the valid range. Defaults to the
+            last page.
+        """
+        def fetch(start: int, end: int):
+            items = stream.slice(start, end)
+            joins = [item for item in items if isinstance(item, JoinRecord)]
+            if not joins:
+                return items
+            records = [item for item in items if not isinstance(item, JoinRecord)]
+            return self.merge_records_joins(records, joins)
+
+        records_pages = QueryPagination(len(stream), fetch, self.NOTES_PAGE_SIZE, align_end=True)
+        if page is not None:
+            records_pages.page = max(0, min(records_pages.total_pages - 1, page - 1))
+        return records_pages
+
     @commands.group(aliases=['note'], invoke_without_command=True, pass_context=True,
         ignore_extra=False)
     @mod_only()
@@ -265,14 +306,8 @@ class ModNotes(KazCog):
         """
         db_user = await c.query_user(self.bot, user)
         db_group = c.query_user_group(db_user)
-        db_records = c.query_user_records(db_group)
-        db_joins = c.query_user_joins(db_group)
-        if db_joins:
-            db_records = self.merge_records_joins(db_records, db_joins)
-
-        records_pages = Pagination(db_records, self.NOTES_PAGE_SIZE, align_end=True)
-        if page is not None:
-            records_pages.page = max(0, min(records_pages.total_pages - 1, page - 1))
+        records_pages = self.paginate_records(
+            c.query_user_records_stream(db_group, joins=True), page)
 
         await self.show_record_page(
             ctx.message.channel,
@@ -297,11 +332,8 @@ class ModNotes(KazCog):
               description: The page number to show, if there are more than 1 page of notes.
         """
         watch_types = (RecordType.watch, RecordType.int, RecordType.warn)
-        db_records = c.query_unexpired_records(types=watch_types)
-
-        records_pages = Pagination(db_records, self.NOTES_PAGE_SIZE, True)
-        if page is not None:
-            records_pages.page = max(1, min(records_pages.total_pages, page)) - 1
+        records_pages = self.paginate_records(
+            c.query_unexpired_records_stream(types=watch_types), page)
 
         await self.show_record_page(
             ctx.message.channel,
@@ -324,11 +356,8 @@ class ModNotes(KazCog):
               type: number
               description: The page number to show, if there are more than 1 page of notes.
         """
-        db_records = c.query_unexpired_records(types=RecordType.temp)
-
-        records_pages = Pagination(db_records, self.NOTES_PAGE_SIZE, True)
-        if page is not None:
-            records_pages.page = max(1, min(records_pages.total_pages, page)) - 1
+        records_pages = self.paginate_records(
+            c.query_unexpired_records_stream(types=RecordType.temp), page)
 
         await self.show_record_page(
             ctx.message.channel,
@@ -351,11 +380,8 @@ class ModNotes(KazCog):
               type: number
               description: The page number to show, if there are more than 1 page of notes.
         """
-        db_records = c.query_unexpired_records(types=RecordType.perma)
-
-        records_pages = Pagination(db_records, self.NOTES_PAGE_SIZE, True)
-        if page is not None:
-            records_pages.page = max(1, min(records_pages.total_pages, page)) - 1
+        records_pages = self.paginate_records(
+            c.query_unexpired_records_stream(types=RecordType.perma), page)
 
         await self.show_record_page(
             ctx.message.channel,
@@ -575,15 +601,13 @@ class ModNotes(KazCog):
         if user != 'all':
             db_user = await c.query_user(self.bot, user)
             db_group = c.query_user_group(db_user)
-            db_records = c.query_user_records(db_group, removed=True)
+            db_records = c.query_user_records_stream(db_group, removed=True)
         else:
             db_user = None
             db_group = None
-            db_records = c.query_user_records(None, removed=True)
+            db_records = c.query_user_records_stream(None, removed=True)
 
-        records_pages = Pagination(db_records, self.NOTES_PAGE_SIZE, True)
-        if page is not None:
-            records_pages.page = max(1, min(records_pages.total_pages, page))
+        records_pages = self.paginate_records(db_records, page)
 
         await self.show_record_page(
             ctx.message.channel,
@@ -250,12 +250,9 @@ class ModTools(KazCog):
         except commands.BadArgument:
             return None
 
-    @staticmethod
-    def _whois_search(ctx, user: str):
+    def _whois_search(self, ctx, user: str):
         logger.info("whois: searching for name match")
-        search = user.lower()
-        members = [m for m in ctx.message.server.members
-                   if (m.nick and search in m.nick.lower()) or search in m.name.lower()]
+        members = self.member_index.search(user, ctx.message.server)
         if members:
             member_list_str = ', '.join(str(m) for m in members)
             logger.debug("Found {:d} users: {}".format(len(members), member_list_str))
@@ -1,9 +1,13 @@
+import asyncio
+import hashlib
+import json
 import logging
-from typing import Sequence
+from typing import Sequence, Dict, Set, Tuple, Optional
 
 import discord
 from discord.ext import commands
 
+from kaztron.sendqueue import RateLimitBucket
 from kaztron.theme import solarized
 from . import model as m, query as q
 from kaztron.utils.discord import extract_role_id, get_named_role, user_mention, role_mention
@@ -11,11 +15,19 @@ from kaztron.utils.discord import extract_role_id, get_named_role, user_mention,
 logger = logging.getLogger(__name__)
 
 
-__all__ = ['get_role', 'update_user_roles',
-           'update_project_message', 'delete_project_message', 'get_project_embed']
+__all__ = ['get_role', 'update_user_roles', 'invalidate_role_cache',
+           'update_project_message', 'sync_project_messages', 'delete_project_message',
+           'get_project_embed']
 
 EMBED_COLOUR = solarized.orange
 
+#: Maximum number of concurrent role update requests in :func:`update_user_roles`.
+MAX_ROLE_UPDATES = 5
+#: Maximum number of concurrent project message updates in :func:`sync_project_messages`.
+MAX_MESSAGE_UPDATES = 5
+
+_role_cache = None  # type: Optional[Tuple[str, Dict[str, discord.Role]]]
+
 
 def get_project_embed(project: m.Project, user_info=True, desc=True) -> discord.Embed:
     em = discord.Embed(
@@ -75,29 +87,109 @@ def get_role(server: discord.Server, role_arg: str) -> discord.Role:
     return role
 
 
-async def update_user_roles(bot: discord.Client, server: discord.Server, users: Sequence[m.User]):
-    # noinspection PyTypeChecker
-    role_ids = [o.role_id for o in q.query_genres() + q.query_project_types()]
-    project_roles = set(get_role(server, role_id) for role_id in role_ids if role_id is not None)
+def invalidate_role_cache():
+    """
+    Clear the cached genre and project type roles. Must be called whenever genres or project types
+    are added, changed or removed, or server roles are changed.
+    """
+    global _role_cache
+    _role_cache = None
+
+
+def _get_project_roles(server: discord.Server) -> Dict[str, discord.Role]:
+    """ Get all genre and project type roles, by role ID. Cached until invalidated. """
+    global _role_cache
+    if _role_cache is None or _role_cache[0] != server.id:
+        server_roles = {role.id: role for role in server.roles}
+        roles = {}
+        # noinspection PyTypeChecker
+        for o in q.query_genres() + q.query_project_types():
+            if o.role_id is None:
+                continue
+            try:
+                roles[o.role_id] = server_roles[o.role_id]
+            except KeyError:
+                logger.warning("Role for {!r} not found on server".format(o))
+        _role_cache = (server.id, roles)
+        logger.debug("Cached {:d} project roles".format(len(roles)))
+    return _role_cache[1]
+
+
+async def update_user_roles(bot: discord.Client, server: discord.Server, users: Sequence[m.User],
+                            max_concurrency=MAX_ROLE_UPDATES):
+    """
+    Update users' genre and project type roles. Members whose roles are already correct are
+    skipped; the remaining updates are sent concurrently, up to ``max_concurrency`` at a time.
+
+    If any updates fail, the other updates still complete, and then the first error is raised.
+
+    :return: Number of members updated.
+    """
+    try:
+        project_roles = _get_project_roles(server)
+        project_roles_set = set(project_roles.values())
+
+        updates = []
+        for u in users:
+            member = server.get_member(u.discord_id)
+            if member is None:
+                logger.warning("update_user_roles: member {} not on server".format(u.discord_id))
+                continue
+            desired_roles = set()
+            for taxon in {u.genre, u.type} - {None}:
+                if taxon.role_id is not None and taxon.role_id in project_roles:
+                    desired_roles.add(project_roles[taxon.role_id])
+            old_roles = set(member.roles)
+            new_roles = (old_roles - project_roles_set) | desired_roles
+            if new_roles != old_roles:
+                updates.append((member, new_roles))
+    except Exception:
+        invalidate_role_cache()  # may have been built from changes that are about to roll back
+        raise
+
+    if not updates:
+        return 0
 
-    for u in users:
-        member = server.get_member(u.discord_id)
-        desired_roles = set()
-        for taxon in {u.genre, u.type} - {None}:
-            if taxon.role_id is not None:
-                desired_roles.add(get_role(server, taxon.role_id))
-        new_roles = (set(member.roles) - project_roles) | desired_roles
-        await bot.replace_roles(member, *new_roles)
+    logger.info("update_user_roles: updating {:d} of {:d} users"
+        .format(len(updates), len(users)))
+    semaphore = asyncio.Semaphore(max_concurrency)
 
+    async def update(member_: discord.Member, roles: Set[discord.Role]):
+        async with semaphore:
+            await bot.replace_roles(member_, *roles)
 
-async def update_project_message(bot: discord.Client, dest: discord.Channel, project: m.Project):
+    results = await asyncio.gather(*(update(member, roles) for member, roles in updates),
+                                   return_exceptions=True)
+    errors = [r for r in results if isinstance(r, Exception)]
+    if errors:
+        invalidate_role_cache()
+        logger.error("update_user_roles: {:d} of {:d} updates failed"
+            .format(len(errors), len(updates)))
+        raise errors[0]
+    return len(updates)
+
+
+def get_embed_hash(embed: discord.Embed) -> str:
+    """ Hash an embed's content, to detect whether a posted embed needs updating. """
+    return hashlib.sha1(json.dumps(embed.to_dict(), sort_keys=True).encode()).hexdigest()
+
+
+async def update_project_message(bot: discord.Client, dest: discord.Channel, project: m.Project,
+                                 force=False) -> bool:
     """
-    Send or update a project's Discord message entry.
+    Send or update a project's Discord message entry. If the project's message was already posted
+    with the same content, nothing is sent (unless ``force`` is True).
 
     Should be executed in a :func:`~q.transaction()` context, as the ``project`` object may be
     modified by this function.
+
+    :return: True if the message was sent or edited, False if it was unchanged.
     """
     new_embed = get_project_embed(project, user_info=False, desc=False)
+    embed_hash = get_embed_hash(new_embed)
+    if not force and project.whois_message_id and project.whois_embed_hash == embed_hash:
+        logger.debug("Project whois message unchanged (for project {!r})".format(project))
+        return False
 
     # check for/find the message
     whois_msg = None
@@ -113,6 +205,95 @@ async def update_project_message(bot: discord.Client, dest: discord.Channel, pro
     else:  # no message exists yet
         new_msg = await bot.send_message(dest, embed=new_embed)
         project.whois_message_id = new_msg.id
+    project.whois_embed_hash = embed_hash
+    return True
+
+
+class SyncStats:
+    """
+    Results of :func:`sync_project_messages`.
+
+    :ivar updated: Number of messages sent or edited.
+    :ivar unchanged: Number of messages skipped because they were already up to date.
+    :ivar failed: Number of messages that could not be updated.
+    :ivar elapsed: Total time taken, in seconds.
+    """
+    def __init__(self):
+        self.updated = 0
+        self.unchanged = 0
+        self.failed = 0
+        self.elapsed = 0.0
+
+    @property
+    def total(self) -> int:
+        return self.updated + self.unchanged + self.failed
+
+    @property
+    def rate(self) -> float:
+        """ Projects processed per second. """
+        return self.total / self.elapsed if self.elapsed > 0 else 0.0
+
+    def __str__(self):
+        return ("{0.total:d} projects in {0.elapsed:.1f}s ({0.rate:.1f}/s): {0.updated:d} updated, "
+                "{0.unchanged:d} unchanged, {0.failed:d} failed").format(self)
+
+
+async def sync_project_messages(bot: discord.Client, dest: discord.Channel,
+                                projects: Sequence[m.Project], *, force=False,
+                                max_concurrency=MAX_MESSAGE_UPDATES,
+                                rate_limit: RateLimitBucket=None,
+                                commit_each=False) -> SyncStats:
+    """
+    Send or update many projects' Discord message entries concurrently. Unchanged projects are
+    skipped without any API calls, unless ``force`` is True. Failed updates are logged and counted,
+    and don't stop the other updates.
+
+    Should be executed in a :func:`~q.transaction()` context, as the ``project`` objects may be
+    modified by this function.
+
+    :param max_concurrency: Maximum number of projects being updated at once.
+    :param rate_limit: Budget for project updates (each may take up to two API calls). Default:
+        5 updates per 5 seconds, Discord's per-channel message rate limit.
+    :param commit_each: If True, commit the session after each message is sent or edited, so that
+        the message IDs of messages already sent are kept even if a later update raises an error
+        (otherwise, they would be rolled back and those projects posted again on the next sync).
+    """
+    loop = asyncio.get_event_loop()
+    rate_limit = rate_limit or RateLimitBucket(limit=5, per=5.0)
+    semaphore = asyncio.Semaphore(max_concurrency)
+    stats = SyncStats()
+    start = loop.time()
+
+    async def sync(project: m.Project):
+        async with semaphore:
+            delay = rate_limit.delay(loop.time())
+            while delay > 0:
+                await asyncio.sleep(delay)
+                delay = rate_limit.delay(loop.time())
+            rate_limit.record(loop.time())
+            try:
+                updated = await update_project_message(bot, dest, project, force=True)
+            except discord.HTTPException:
+                logger.exception("Failed to update project whois message (for project {!r})"
+                    .format(project))
+                stats.failed += 1
+            else:
+                stats.updated += int(updated)
+                if updated and commit_each:
+                    q.session.commit()
+
+    pending = []
+    for p in projects:
+        if force or not p.whois_message_id or \
+                p.whois_embed_hash != get_embed_hash(get_project_embed(p, False, False)):
+            pending.append(p)
+        else:
+            stats.unchanged += 1
+    await asyncio.gather(*(sync(p) for p in pending))
+
+    stats.elapsed = loop.time() - start
+    logger.info("sync_project_messages: {!s}".format(stats))
+    return stats
 
 
 async def delete_project_message(bot: discord.Client, dest: discord.Channel, project: m.Project):
@@ -122,9 +303,10 @@ async def delete_project_message(bot: discord.Client, dest: discord.Channel, pro
             logger.info("Deleting project whois message (for project {!r})".format(project))
             await bot.delete_message(whois_msg)
             project.whois_message_id = None
+            project.whois_embed_hash = None
     except discord.NotFound:
         logger.warning("Cannot delete project whois message: not found (for project {!r})"
             .format(project))
         logger.warning("Removing whois message ID (for project {!r})".format(project))
         project.whois_message_id = None
-        pass
+        project.whois_embed_hash = None
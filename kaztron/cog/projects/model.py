@@ -1,3 +1,5 @@
+from sqlalchemy.ext.associationproxy import association_proxy
+
 from kaztron.driver import database as db
 from kaztron.utils.discord import user_mention, role_mention
 
@@ -90,6 +92,12 @@ class Project(Base):
     pitch = db.Column(db.String(MAX_FIELD), nullable=False)
     description = db.Column(db.String(MAX_FIELD), nullable=True)
 
+    whois_hash = db.relationship('ProjectWhoisHash', uselist=False, lazy='joined',
+        cascade='all, delete-orphan')
+    #: Hash of the last embed posted to the whois message, or None if not known.
+    whois_embed_hash = association_proxy('whois_hash', 'embed_hash',
+        creator=lambda embed_hash: ProjectWhoisHash(embed_hash=embed_hash))
+
     def __repr__(self):
         return 'Project<{:d}, user_id={:d}, title={!r}>'\
             .format(self.project_id, self.user_id, self.title)
@@ -102,6 +110,17 @@ class Project(Base):
         return query.lower() in self.title.lower()
 
 
+class ProjectWhoisHash(Base):
+    """ Hash of a project's last posted whois embed, to skip updating unchanged messages. """
+    __tablename__ = 'project_whois_hash'
+
+    project_id = db.Column(db.Integer, db.ForeignKey('projects.project_id'), primary_key=True)
+    embed_hash = db.Column(db.String(40), nullable=True)
+
+    def __repr__(self):
+        return 'ProjectWhoisHash<{}, {}>'.format(self.project_id, self.embed_hash)
+
+
 class Genre(Base):
     __tablename__ = 'genre'
     MAX_NAME = 32
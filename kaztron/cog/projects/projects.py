@@ -9,7 +9,7 @@ from discord.ext import commands
 from kaztron import KazCog
 from kaztron.cog.projects.model import Project
 from kaztron.config import SectionView
-from kaztron.utils.converter import MemberConverter2
+from kaztron.utils.converter import MemberConverter2, BooleanConverter
 from kaztron.utils.datetime import format_timedelta
 from . import model as m, query as q, wizard as w
 from .discord import *
@@ -130,6 +130,7 @@ class ProjectsManager(KazCog):
                 - followable
                 - delete
                 - purge
+                - resync
     """
     cog_config: ProjectsConfig  # for IDE autocomplete
     cog_state: ProjectsState
@@ -288,6 +289,7 @@ class ProjectsManager(KazCog):
         self.channel = self.get_channel(self.channel_id)
         await self._update_unsent_projects()
         self.wizard_manager = self.cog_state.wizards
+        self._save_wizards()
 
     def export_kazhelp_vars(self):
         return {
@@ -298,15 +300,30 @@ class ProjectsManager(KazCog):
         }
 
     def unload_kazcog(self):
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
+
+    def _save_wizards(self):
+        """ Store changes to open wizards in the state. Only changed wizards are re-serialised. """
+        for path, wizard_data in self.wizard_manager.pop_changes().items():
+            if wizard_data is not None:
+                self.cog_state.set_item('wizards', path, wizard_data)
+            else:
+                self.cog_state.delete_item('wizards', path)
+
+    async def on_server_role_update(self, before: discord.Role, after: discord.Role):
+        invalidate_role_cache()
+
+    async def on_server_role_delete(self, role: discord.Role):
+        invalidate_role_cache()
 
     async def _update_unsent_projects(self):
-        unsent_projects = q.query_unsent_projects()
-        if unsent_projects:
-            logger.info("Posting projects without whois message...")
-        for project in unsent_projects:
-            logger.debug("Posting project: {!r}".format(project))
-            await update_project_message(self.bot, self.channel, project)
+        with q.transaction():
+            unsent_projects = q.query_unsent_projects()
+            if unsent_projects:
+                logger.info("Posting projects without whois message...")
+                # one at a time, to keep posting order
+                await sync_project_messages(self.bot, self.channel, unsent_projects,
+                                            max_concurrency=1, commit_each=True)
 
     @staticmethod
     def check_active_project(member: discord.Member) -> m.Project:
@@ -475,7 +492,7 @@ class ProjectsManager(KazCog):
             - command: .project select Gale
         """
         await self.wizard_manager.cancel_wizards(ctx.message.author)
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
         with q.transaction():
             user = q.get_or_make_user(ctx.message.author)
@@ -640,7 +657,7 @@ class ProjectsManager(KazCog):
 
         await self.bot.reply("I've sent you a PM! Answer my questions to create your project.")
         await self.wizard_manager.create_new_wizard(ctx.message.author, ctx.message.timestamp)
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
     @project.command(pass_context=True, ignore_extra=False)
     async def edit(self, ctx: commands.Context):
@@ -677,7 +694,7 @@ class ProjectsManager(KazCog):
         await self.wizard_manager.create_edit_wizard(
             ctx.message.author, ctx.message.timestamp, user.active_project
         )
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
     @project.command(pass_context=True, ignore_extra=False)
     async def aboutme(self, ctx: commands.Context):
@@ -698,7 +715,7 @@ class ProjectsManager(KazCog):
 
         await self.bot.reply("I've sent you a PM! Answer my questions to set up your user profile.")
         await self.wizard_manager.create_author_wizard(ctx.message.author, ctx.message.timestamp)
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
     @project.command(pass_context=True, ignore_extra=False)
     async def cancel(self, ctx: commands.Context):
@@ -712,7 +729,7 @@ class ProjectsManager(KazCog):
             - command: .project cancel
         """
         await self.wizard_manager.cancel_wizards(ctx.message.author)
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
     @project.command(pass_context=True, ignore_extra=False)
     async def delete(self, ctx: commands.Context, name: str=None):
@@ -856,7 +873,7 @@ class ProjectsManager(KazCog):
                     q.update_user_from_projects(project.user)
                     await update_user_roles(self.bot, self.server, [project.user])
 
-        self.cog_state.wizards = self.wizard_manager
+        self._save_wizards()
 
     @project.group(pass_context=True, ignore_extra=True, invoke_without_command=True)
     async def set(self, ctx: commands.Context):
@@ -927,6 +944,7 @@ class ProjectsManager(KazCog):
             session.add(genre)
             await self.bot.say("Genre added: {}".format(name))
             await self.send_output("[Projects] Genre added: {}".format(genre.discord_str()))
+        invalidate_role_cache()
 
     @admin_genre.command(name='edit', pass_context=True, ignore_extra=False)
     @mod_only()
@@ -967,6 +985,7 @@ class ProjectsManager(KazCog):
             genre.name = new_name
             genre.role_id = get_role(self.server, new_role).id if new_role else None
 
+            invalidate_role_cache()
             await update_user_roles(self.bot, self.server, q.query_users(genre=genre))
 
         await self.bot.say("Genre '{}' edited to '{}'".format(old_name, new_name))
@@ -1006,6 +1025,7 @@ class ProjectsManager(KazCog):
                 raise commands.UserInputError(
                     "Can't delete this genre: there are still users or projects using it! "
                     "Make sure no users/projects are using the genre, or provide a replacement.")
+            invalidate_role_cache()
             await update_user_roles(self.bot, self.server, users)
         await self.bot.say("Genre deleted: {}".format(name))
         await self.send_output("[Projects] Genre deleted: {}".format(name))
@@ -1061,6 +1081,7 @@ class ProjectsManager(KazCog):
             logger.info("Adding new project type: name={!r} role={!r}".format(name, role))
             pt = m.ProjectType(name=name, role_id=get_role(self.server, role).id if role else None)
             session.add(pt)
+        invalidate_role_cache()
         await self.bot.say("Project type added: {}".format(name))
         await self.send_output("[Projects] Project type added: {}".format(pt.discord_str()))
 
@@ -1104,6 +1125,7 @@ class ProjectsManager(KazCog):
             p_type.name = new_name
             p_type.role_id = get_role(self.server, new_role).id if new_role else None
 
+            invalidate_role_cache()
             await update_user_roles(self.bot, self.server, q.query_users(type_=p_type))
 
         await self.bot.say("Project type '{}' edited to '{}'".format(old_name, new_name))
@@ -1144,6 +1166,7 @@ class ProjectsManager(KazCog):
                 raise commands.UserInputError(
                     "Can't delete this project type: there are still users or projects using it! "
                     "Make sure no users/projects are using the genre, or provide a replacement.")
+            invalidate_role_cache()
             await update_user_roles(self.bot, self.server, users)
         await self.bot.say("Project type deleted: {}".format(name))
         await self.send_output("[Projects] Project type deleted: {}".format(name))
@@ -1254,7 +1277,8 @@ class ProjectsManager(KazCog):
                 .format(member.mention, role.name))
         else:
             await self.bot.reply("removed {}'s project follow role".format(member.mention))
-        await update_project_message(self.bot, self.channel, project)
+        with q.transaction():
+            await update_project_message(self.bot, self.channel, project)
 
     @admin_followable.error
     async def admin_followable_error(self, exc, ctx):
@@ -1291,3 +1315,29 @@ class ProjectsManager(KazCog):
                         session.delete(project)
                     session.delete(user)
         await self.bot.reply("{:d} user(s) purged".format(n_deleted))
+
+    @admin.command(name='resync', pass_context=True, ignore_extra=False)
+    @mod_only()
+    async def admin_resync(self, ctx: commands.Context, force: BooleanConverter=False):
+        """!kazhelp
+        description: |
+            Update all projects' messages in {{out_channel}}, and post any missing ones.
+
+            Messages whose project info hasn't changed since they were last posted are skipped,
+            unless `force` is specified.
+        parameters:
+            - name: force
+              type: '"yes" or "no"'
+              optional: true
+              default: no
+              description: If yes, update every message, even if unchanged. Use this if messages
+                were deleted or edited outside of {{name}}.
+        examples:
+            - command: .projects admin resync
+            - command: .projects admin resync yes
+        """
+        await self.bot.reply("Resyncing project messages. This might take a while...")
+        with q.transaction():
+            stats = await sync_project_messages(self.bot, self.channel, q.query_projects(),
+                                                force=force, commit_each=True)
+        await self.bot.reply("Resynced {!s}.".format(stats))
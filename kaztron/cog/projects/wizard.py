@@ -1,6 +1,7 @@
+import heapq
 import logging
 from datetime import datetime, timedelta
-from typing import Dict, Tuple, Union
+from typing import Dict, Tuple, Union, List, Optional
 
 import discord
 from discord.ext import commands
@@ -113,22 +114,35 @@ UserWizardMap = Dict[str, ProjectWizard]
 
 
 class WizardManager:
+    """
+    Manages the open wizards for all users.
+
+    Changes to wizards are tracked per wizard: instead of re-serialising every open wizard, use
+    :meth:`pop_changes` to get only the wizards that were changed, started or closed since the last
+    call. Timeouts are tracked in a heap ordered by deadline, so that :meth:`purge` doesn't need to
+    scan all open wizards.
+    """
+    wizard_classes = {
+        'new': ProjectWizard,
+        'edit': ProjectWizard,
+        'author': AuthorWizard,
+    }
+
     @classmethod
     def from_dict(cls, bot: commands.Bot, server: discord.Server, data: dict, timeout=None):
         obj = cls(bot, server, timeout)
-        for uid, d in data.get('new', {}).items():
-            try:
-                obj.wizards['new'][uid] = ProjectWizard.from_dict(d)
-            except ValueError:
-                pass
-
-        obj.edit_wizards = {}
-        for uid, d in data.get('edit', {}).items():
-            try:
-                obj.wizards['edit'][uid] = ProjectWizard.from_dict(d)
-                obj.wizards['edit'][uid].opts = ProjectWizard.question_keys
-            except ValueError:
-                pass
+        invalid = set()
+        for name, wizard_cls in cls.wizard_classes.items():
+            for uid, d in data.get(name, {}).items():
+                try:
+                    wizard = wizard_cls.from_dict(d)
+                except ValueError:
+                    invalid.add((name, uid))
+                    continue
+                if name == 'edit':
+                    wizard.opts = ProjectWizard.question_keys
+                obj._add(name, uid, wizard)
+        obj._changed = invalid  # loaded wizards are unchanged; invalid ones will be removed
         return obj
 
     def __init__(self, bot: commands.Bot, server: discord.Server, timeout: int=None):
@@ -146,6 +160,37 @@ class WizardManager:
             'author': {},
         }
         self.timeout = timedelta(seconds=timeout)
+        self._changed = set()  # (wizard name, user ID) changed since last pop_changes()
+        # heap of (deadline, sequence, wizard name, user ID, wizard). Entries for closed wizards are
+        # left in the heap and skipped when popped.
+        self._deadlines = []  # type: List[Tuple[datetime, int, str, str, ProjectWizard]]
+        self._seq = 0
+
+    def _add(self, name: str, uid: str, wizard: Union[ProjectWizard, AuthorWizard]):
+        self.wizards[name][uid] = wizard
+        self._changed.add((name, uid))
+        self._seq += 1
+        heapq.heappush(self._deadlines,
+                       (wizard.timestamp + self.timeout, self._seq, name, uid, wizard))
+
+    def _remove(self, name: str, uid: str):
+        """ :raise KeyError: no open wizard of this kind """
+        del self.wizards[name][uid]
+        self._changed.add((name, uid))
+
+    def pop_changes(self) -> Dict[Tuple[str, str], Optional[dict]]:
+        """
+        Get the wizards changed since the last call, and reset the change tracking.
+
+        :return: Map of (wizard name, user ID) to the wizard's :meth:`to_dict` representation, or
+            None if the wizard was closed.
+        """
+        changes = {}
+        for name, uid in self._changed:
+            wizard = self.wizards[name].get(uid, None)
+            changes[(name, uid)] = wizard.to_dict() if wizard is not None else None
+        self._changed.clear()
+        return changes
 
     def has_open_wizard(self, member: discord.Member):
         return any(member.id in w for w in self.wizards.values())
@@ -172,7 +217,7 @@ class WizardManager:
             raise commands.CommandError("You already have an ongoing wizard!")
 
         logger.info("Starting 'new' wizard for {}".format(member))
-        self.wizards['new'][member.id] = ProjectWizard(member.id, timestamp)
+        self._add('new', member.id, ProjectWizard(member.id, timestamp))
 
         try:
             await self.bot.send_message(member, start_msg)
@@ -190,7 +235,7 @@ class WizardManager:
         logger.info("Starting 'edit' wizard for for {}".format(member))
         w = ProjectWizard(member.id, timestamp)
         w.opts = ProjectWizard.question_keys
-        self.wizards['edit'][member.id] = w
+        self._add('edit', member.id, w)
 
         try:
             await self.bot.send_message(member, start_edit_msg_fmt.format(proj))
@@ -206,7 +251,7 @@ class WizardManager:
 
         logger.info("Starting 'author' wizard for {}".format(member))
         w = AuthorWizard(member.id, timestamp)
-        self.wizards['author'][member.id] = w
+        self._add('author', member.id, w)
 
         try:
             await self.bot.send_message(member, aboutme_start_msg)
@@ -223,13 +268,14 @@ class WizardManager:
         logger.debug(message_log_str(message))
 
         wizard.answer(message.content)
+        self._changed.add((wiz_name, message.author.id))
 
     async def close_wizard(self, member: discord.Member) -> Tuple[str, ProjectWizard]:
         await self.purge()
         wiz_name, wizard = self.get_wizard_for(member)
         if wizard.is_done:
             logger.info("Closing '{}' wizard for {}".format(wiz_name, member))
-            del self.wizards[wiz_name][member.id]
+            self._remove(wiz_name, member.id)
             await self.bot.send_message(
                 member, end_msg if wiz_name != 'author' else aboutme_end_msg
             )
@@ -239,9 +285,9 @@ class WizardManager:
 
     async def cancel_wizards(self, member: discord.Member):
         await self.purge()
-        for name, user_wizard_map in self.wizards.items():
+        for name in self.wizards.keys():
             try:
-                del user_wizard_map[member.id]
+                self._remove(name, member.id)
             except KeyError:
                 pass  # no open wizard of this kind
             else:
@@ -256,26 +302,24 @@ class WizardManager:
     async def purge(self):
         """ Purge any timed-out wizards. """
         now = datetime.utcnow()
-        for name, user_wizard_map in self.wizards.items():
-            delete_keys = []
-            for uid, wizard in user_wizard_map.items():
-                if now - wizard.timestamp >= self.timeout:
-                    delete_keys.append(uid)
-            for uid in delete_keys:
-                member = self.server.get_member(uid)
-                logger.info("{} wizard for {!r} timed out"
-                    .format(name.capitalize(), member if member else uid))
-                del user_wizard_map[uid]
-                if name == 'new':
-                    await self.bot.send_message(member,
-                        "New project wizard has timed out. You will need to restart the wizard "
-                        "with `.project new`.")
-                elif name == 'edit':
-                    await self.bot.send_message(member,
-                        "Editing your project has timed out. You will need to restart the wizard "
-                        "with `.project wizard`.")
-                else:
-                    await self.bot.send_message(member, "Wizard has timed out (generic msg).")
+        while self._deadlines and self._deadlines[0][0] <= now:
+            _, _, name, uid, wizard = heapq.heappop(self._deadlines)
+            if self.wizards[name].get(uid, None) is not wizard:
+                continue  # already closed (or replaced by a newer wizard)
+            member = self.server.get_member(uid)
+            logger.info("{} wizard for {!r} timed out"
+                .format(name.capitalize(), member if member else uid))
+            self._remove(name, uid)
+            if name == 'new':
+                await self.bot.send_message(member,
+                    "New project wizard has timed out. You will need to restart the wizard "
+                    "with `.project new`.")
+            elif name == 'edit':
+                await self.bot.send_message(member,
+                    "Editing your project has timed out. You will need to restart the wizard "
+                    "with `.project wizard`.")
+            else:
+                await self.bot.send_message(member, "Wizard has timed out (generic msg).")
 
     def to_dict(self) -> dict:
         ret = {}
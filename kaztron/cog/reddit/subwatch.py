@@ -1,6 +1,10 @@
+import asyncio
+from collections import deque
 from datetime import timedelta, datetime
 import logging
-from typing import List, Dict, Sequence, Set, Iterable, Tuple, AsyncGenerator
+import time
+from itertools import islice
+from typing import List, Dict, Sequence, Set, Iterable, Tuple, AsyncGenerator, Deque
 
 import discord
 from discord.ext import commands
@@ -8,8 +12,9 @@ from discord.ext import commands
 from kaztron import KazCog, task
 from kaztron.config import SectionView
 from kaztron.driver import reddit
+from kaztron.sendqueue import Priority
 from kaztron.utils.checks import mod_only
-from kaztron.utils.containers import FifoCache
+from kaztron.utils.containers import FifoCache, TtlLruCache
 from kaztron.utils.datetime import format_timedelta, utctimestamp
 
 from kaztron.utils.embeds import EmbedSplitter
@@ -54,16 +59,16 @@ class SubwatchConfig(SectionView):
 class SubwatchChannel:
     def __init__(self, *,
                  subreddits: Sequence[str],
-                 queue: List[str]=tuple(),
+                 queue: Iterable[str]=tuple(),
                  last_posted: datetime):
         self.subreddits = tuple(subreddits)
-        self.queue = list(queue)
+        self.queue = deque(queue)  # type: Deque[str]
         self.last_posted = last_posted
 
     def to_dict(self):
         return {
             'subreddits': self.subreddits,
-            'queue': self.queue,
+            'queue': list(self.queue),
             'last_posted': utctimestamp(self.last_posted)
         }
 
@@ -101,85 +106,301 @@ class SubwatchState(SectionView):
         return {ch.id: sub.to_dict() for ch, sub in data.items()}
 
 
+class RedditStream:
+    """
+    A single submissions stream for a set of subreddits (one shard of a
+    :class:`~.RedditStreamManager`). Manages stream failures (e.g. when the last retrieved post is
+    deleted, the stream may return no results instead of the latest results since the last query).
+
+    :param reddit_: Reddit instance to use
+    :param subreddits: Subreddit names for this stream
+    :param last_checked: Timestamp of the latest submission already processed for these
+        subreddits. When the stream is fresh, older submissions are skipped.
+    :param renewal_threshold: Number of times the stream is checked with no results before
+        automatically refreshing (i.e. assumed stream failure).
+    """
+    def __init__(self,
+                 reddit_: reddit.Reddit,
+                 subreddits: Sequence[str],
+                 last_checked: float,
+                 renewal_threshold=5):
+        self.reddit = reddit_
+        self.subreddits = tuple(subreddits)
+        self.last_checked = last_checked
+        self.renewal_threshold = renewal_threshold
+        self.no_result_count = 0
+        self._stream = None
+
+    @property
+    def is_fresh(self):
+        """ True if the stream is fresh, i.e., the next :meth:`~.poll` will load a backlog. """
+        return self._stream is None
+
+    def refresh(self):
+        self._stream = None
+
+    async def poll(self) -> List[reddit.models.Submission]:
+        """
+        Get new submissions since the last poll, oldest first. After a :meth:`~.refresh()` or
+        hitting the :attr:`~.renewal_threshold`, this will load recent posts newer than
+        :attr:`~.last_checked` instead of restarting from the latest post.
+        """
+        is_fresh = self.is_fresh
+        if is_fresh:
+            sr = await self.reddit.subreddit(display_name='+'.join(self.subreddits))
+            self._stream = sr.stream.submissions(pause_after=0)
+
+        results = []
+        async for submission in self._stream:
+            if submission is None:
+                break
+            if is_fresh and submission.created_utc <= self.last_checked:
+                continue
+            results.append(submission)
+
+        if results:
+            self.no_result_count = 0
+            self.last_checked = max(self.last_checked, max(s.created_utc for s in results))
+        else:
+            self.no_result_count += 1
+            if self.no_result_count >= self.renewal_threshold:
+                self.no_result_count = 0
+                self.refresh()
+        return results
+
+
 class RedditStreamManager:
     """
-    Helps manage and cache the submissions stream. Also manages stream failures (e.g. when the
-    last retrieved post is deleted, the stream may return no results instead of the latest results
-    since the last query).
+    Helps manage and cache the submissions stream.
+
+    Subreddits are split into shards, each polled as a separate multireddit stream
+    (:class:`~.RedditStream`), concurrently. Shards are sized from the observed number of posts
+    per poll in each subreddit, so that no shard gets close to the reddit listing limit; busy
+    subreddits get smaller shards, and quiet subreddits are packed together.
 
     :param reddit: Reddit instance to use
     :param subreddits: List of subreddit names to check
-    :param renewal_threshold: Number of times the stream is checked with no results before
+    :param last_checked: Timestamp of the latest submission already processed. Older submissions
+        are not returned when first loading the streams.
+    :param renewal_threshold: Number of times a stream is checked with no results before
         automatically refreshing (i.e. assumed stream failure).
+    :param cache_expiry: Time in seconds after which a cached submission is reloaded.
+    :param cache_size: Maximum number of submissions to cache.
+    :param refresh_margin: Time in seconds before expiry at which :meth:`~.prefetch` refreshes a
+        cached submission.
+    :param shard_volume: Target maximum number of posts per poll for each shard.
+    :param max_shard_size: Maximum number of subreddits in each shard (limits the URL length).
+    :param poll_timeout: Time in seconds after which a stalled shard is abandoned for this poll
+        (and refreshed), so that it doesn't delay the other shards.
     """
+    #: Maximum number of posts returned by one listing request
+    LISTING_LIMIT = 100
+    #: Weight of the latest poll in each subreddit's volume estimate
+    VOLUME_WEIGHT = 0.2
+    #: Fraction of shard_volume to fill when (re)sharding, to avoid resharding on small changes
+    SHARD_FILL = 0.75
+
     def __init__(self,
                  reddit_: reddit.Reddit,
                  subreddits: Iterable[str],
+                 last_checked: float = 0,
                  renewal_threshold=5,
-                 cache_expiry=180):
+                 cache_expiry=180,
+                 cache_size=512,
+                 refresh_margin=60,
+                 shard_volume=40,
+                 max_shard_size=50,
+                 poll_timeout=30):
         self.reddit = reddit_
-
-        self._subreddits = tuple(subreddits)
-        self._stream = None
-        self._is_fresh = True
-        self.no_result_count = 0
         self.renewal_threshold = renewal_threshold
+        self.shard_volume = shard_volume
+        self.max_shard_size = max_shard_size
+        self.poll_timeout = poll_timeout
+
+        self._subreddits = ()  # type: Tuple[str, ...]
+        self._shards = []  # type: List[RedditStream]
+        self._volumes = {}  # type: Dict[str, float]  # lowercase subreddit name -> posts per poll
+        self._last_checked = last_checked
+        self._seen = FifoCache(maxsize=1024)  # recently returned submission IDs (as a set)
 
-        self.submission_cache = FifoCache()  # type: Dict[str, Tuple[reddit.models.Submission, int]]
-        self.cache_expiry_delta = cache_expiry
+        self.submission_cache = TtlLruCache(maxsize=cache_size, ttl=cache_expiry)
+        self.refresh_margin = refresh_margin
+
+        self.subreddits = subreddits
 
     @property
     def subreddits(self):
         """
-        List of subreddit names for this stream. If this list is modified, the stream is refreshed.
+        List of subreddit names for this stream. If this list is modified, the streams are
+        resharded; unchanged shards keep their stream.
         """
         return self._subreddits
 
     @subreddits.setter
     def subreddits(self, subreddits: Iterable[str]):
         self._subreddits = tuple(subreddits)
-        self.refresh()
+        self._reshard()
+
+    @property
+    def shards(self) -> Sequence[RedditStream]:
+        return tuple(self._shards)
+
+    @property
+    def last_checked(self) -> float:
+        """ Timestamp of the latest submission returned by any shard. """
+        return max([self._last_checked] + [shard.last_checked for shard in self._shards])
 
     @property
     def is_fresh(self):
-        """
-        True if the stream is fresh, i.e., will return a backlog. This property remains true until
-        the stream has iterated through the first set of responses from the API, i.e.,
-        :meth:`~.stream` has iterated through to its end.
-        """
-        return self._is_fresh
+        """ True if any shard is fresh, i.e., will load a backlog on the next poll. """
+        return any(shard.is_fresh for shard in self._shards)
+
+    def _plan_shards(self) -> List[Tuple[str, ...]]:
+        """ Pack subreddits into shards by estimated volume (first fit decreasing). """
+        capacity = self.shard_volume * self.SHARD_FILL
+        plan = []  # type: List[Tuple[float, List[str]]]
+        for subreddit in sorted(self._subreddits, key=self._volume, reverse=True):
+            volume = self._volume(subreddit)
+            for i, (shard_volume, shard) in enumerate(plan):
+                if shard_volume + volume <= capacity and len(shard) < self.max_shard_size:
+                    shard.append(subreddit)
+                    plan[i] = (shard_volume + volume, shard)
+                    break
+            else:
+                plan.append((volume, [subreddit]))
+        return [tuple(shard) for _, shard in plan]
+
+    def _volume(self, subreddit: str) -> float:
+        return self._volumes.get(subreddit.lower(), 0.0)
+
+    def _shard_volume(self, shard: RedditStream) -> float:
+        return sum(self._volume(subreddit) for subreddit in shard.subreddits)
+
+    def _needs_reshard(self) -> bool:
+        # a single subreddit over shard_volume can't be split further: don't replan every poll
+        if any(len(shard.subreddits) > 1 and self._shard_volume(shard) > self.shard_volume
+               for shard in self._shards):
+            return True
+        return len(self._plan_shards()) < len(self._shards)
+
+    def _reshard(self):
+        last_checked = {}  # type: Dict[str, float]
+        old_shards = {}  # type: Dict[Tuple[str, ...], RedditStream]
+        for shard in self._shards:
+            old_shards[shard.subreddits] = shard
+            for subreddit in shard.subreddits:
+                last_checked[subreddit] = shard.last_checked
+        # newly added subreddits: skip posts older than anything already processed
+        default_last_checked = self.last_checked
+
+        self._shards = []
+        for subreddits in self._plan_shards():
+            try:
+                shard = old_shards[subreddits]
+            except KeyError:
+                shard = RedditStream(
+                    self.reddit,
+                    subreddits,
+                    min(last_checked.get(s, default_last_checked) for s in subreddits),
+                    self.renewal_threshold
+                )
+            self._shards.append(shard)
+        logger.info("Watching {:d} subreddits in {:d} streams: shard sizes {}".format(
+            len(self._subreddits), len(self._shards),
+            ', '.join(str(len(shard.subreddits)) for shard in self._shards)))
+
+    async def _poll_shard(self, shard: RedditStream) -> List[reddit.models.Submission]:
+        try:
+            results = await asyncio.wait_for(shard.poll(), self.poll_timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stream timed out: {}".format('+'.join(shard.subreddits)))
+            shard.refresh()
+            raise
+        except Exception:
+            logger.exception("Error polling stream: {}".format('+'.join(shard.subreddits)))
+            shard.refresh()
+            raise
+        if len(results) >= self.LISTING_LIMIT:
+            logger.warning("Stream returned {:d} posts; some posts may have been missed: {}"
+                .format(len(results), '+'.join(shard.subreddits)))
+        return results
+
+    def _update_volumes(self, shard: RedditStream, results: List[reddit.models.Submission]):
+        counts = {subreddit.lower(): 0 for subreddit in shard.subreddits}
+        for submission in results:
+            key = submission.subreddit.display_name.lower()
+            counts[key] = counts.get(key, 0) + 1
+        w = self.VOLUME_WEIGHT
+        for key, count in counts.items():
+            self._volumes[key] = w * count + (1 - w) * self._volumes.get(key, count)
 
     async def stream(self) -> AsyncGenerator[reddit.models.Submission, None]:
         """
-        Generator of new reddit posts. Should be async iterated.
+        Generator of new reddit posts from all shards, oldest first. Should be async iterated.
 
-        After a :meth:`~.refresh()`, setting :attr:`~.subreddits`, or hitting the
-        :attr:`~.renewal_threshold`, this will load a number of recent posts instead of restarting
-        from the latest post.
-        """
-        has_results = False
-        if self.is_fresh:
-            sr = await self.reddit.subreddit(display_name='+'.join(self.subreddits))
-            self._stream = sr.stream.submissions(pause_after=0)
+        After a :meth:`~.refresh()` or hitting the :attr:`~.renewal_threshold` on a shard, that
+        shard will load recent posts since its last result instead of restarting from the latest
+        post.
 
-        async for submission in self._stream:
-            if submission is None:
-                if has_results:
-                    self.no_result_count = 0
-                else:
-                    self.no_result_count += 1
-                break
-            has_results = True
-            self.submission_cache[submission.id] = (submission, utctimestamp(datetime.utcnow()))
+        :raise Exception: If every shard failed, the first error.
+        """
+        if not self._shards:
+            return
+        shards = list(self._shards)
+        # a fresh shard's backlog isn't representative of its volume
+        was_fresh = [shard.is_fresh for shard in shards]
+        all_results = await asyncio.gather(*(self._poll_shard(shard) for shard in shards),
+                                           return_exceptions=True)
+
+        merged = []
+        errors = []
+        for shard, is_fresh, results in zip(shards, was_fresh, all_results):
+            if isinstance(results, BaseException):
+                errors.append(results)
+                continue
+            if not is_fresh:
+                self._update_volumes(shard, results)
+            merged.extend(results)
+        if len(errors) == len(shards):
+            raise errors[0]
+
+        if self._needs_reshard():
+            self._reshard()
+
+        merged.sort(key=lambda s: s.created_utc)
+        for submission in merged:
+            if submission.id in self._seen:
+                continue
+            self._seen[submission.id] = True
+            self.submission_cache.put(submission.id, submission)
             yield submission
 
-        self._is_fresh = False
-        if self.no_result_count >= self.renewal_threshold:
-            self.refresh()
-
     def refresh(self):
-        self._stream = None
-        self._is_fresh = True
+        for shard in self._shards:
+            shard.refresh()
+
+    async def prefetch(self, reddit_ids: Iterable[str]) -> int:
+        """
+        Load submissions into the cache in bulk, using reddit's "info" endpoint (100 submissions
+        per API request). Submissions already cached are skipped, unless they expire within
+        :attr:`~.refresh_margin` seconds, in which case they are refreshed.
+
+        Submissions that reddit does not return are not cached: :meth:`~.get_submission` will try
+        to load them individually.
+
+        :param reddit_ids: Reddit IDs of the submissions (without the ``t3_`` prefix).
+        :return: Number of submissions loaded.
+        """
+        fullnames = ['t3_' + reddit_id for reddit_id in dict.fromkeys(reddit_ids)
+                     if self.submission_cache.ttl_remaining(reddit_id) <= self.refresh_margin]
+        if not fullnames:
+            return 0
+        count = 0
+        async for s in self.reddit.info(fullnames=fullnames):
+            self.submission_cache.put(s.id, s)
+            count += 1
+        logger.debug("Prefetched {:d} of {:d} submissions".format(count, len(fullnames)))
+        return count
 
     async def get_submission(self, reddit_id: str) -> reddit.models.Submission:
         """
@@ -188,14 +409,10 @@ class RedditStreamManager:
         :return:
         :raise reddit.DeletedError: submission is removed/deleted
         """
-        try:
-            s, load_time = self.submission_cache[reddit_id]
-            if utctimestamp(datetime.utcnow()) - load_time > self.cache_expiry_delta:
-                await s.load()
-                self.submission_cache[reddit_id] = (s, utctimestamp(datetime.utcnow()))
-        except KeyError:
+        s = self.submission_cache.get(reddit_id)
+        if s is None:
             s = await self.reddit.submission(reddit_id)
-            self.submission_cache[reddit_id] = (s, utctimestamp(datetime.utcnow()))
+            self.submission_cache.put(reddit_id, s)
 
         if getattr(s, 'removed_by_category', None) is not None:
             raise reddit.DeletedError(s, s.removed_by_category)
@@ -214,12 +431,25 @@ class QueueManager:
 
     def __init__(self, state: SubwatchState):
         self.state = state
+        self._routes = {}  # type: Dict[str, List[discord.Channel]]
+        self.rebuild_index()
+
+    def rebuild_index(self):
+        """
+        Rebuild the index of subreddits to the channels watching them. Must be called after the
+        channel configuration changes.
+        """
+        routes = {}
+        for ch, ch_info in self.state.channels.items():
+            for subreddit in ch_info.subreddits:
+                routes.setdefault(subreddit.lower(), []).append(ch)
+        self._routes = routes
 
     def add(self, submission: reddit.models.Submission):
         """ Add a submission to the queue. """
-        for ch, ch_info in self.state.channels.items():
-            if submission.subreddit.display_name.lower() in ch_info.subreddits:
-                ch_info.queue.append(submission.id)
+        channels = self.state.channels
+        for ch in self._routes.get(submission.subreddit.display_name.lower(), ()):
+            channels[ch].queue.append(submission.id)
 
     def pop(self, channel: discord.Channel) -> str:
         """
@@ -227,7 +457,14 @@ class QueueManager:
         :raise IndexError: Nothing in queue
         :raise KeyError: Channel is not configured for SubWatch
         """
-        return self.state.channels[channel].queue.pop(0)
+        return self.state.channels[channel].queue.popleft()
+
+    def peek(self, channel: discord.Channel, n: int) -> List[str]:
+        """
+        Get up to the next n reddit IDs in the channel's queue, without removing them.
+        :raise KeyError: Channel is not configured for SubWatch
+        """
+        return list(islice(self.state.channels[channel].queue, n))
 
     def queue_length(self, channel: discord.Channel) -> int:
         """
@@ -252,10 +489,14 @@ class Subwatch(KazCog):
             - add
             - reset
             - rem
+            - apistats
     """
     cog_config: SubwatchConfig
     cog_state: SubwatchState
 
+    #: Number of queued posts to load from reddit ahead of posting them (one API request).
+    PREFETCH_SIZE = 100
+
     #####
     # Lifecycle
     #####
@@ -282,7 +523,8 @@ class Subwatch(KazCog):
         self.cog_state.set_cog(self)
         _ = self.cog_state.channels  # convert and validate
         self.reddit = reddit.RedditLoginManager().get_reddit(self.cog_config.reddit_username)
-        self.stream_manager = RedditStreamManager(self.reddit, self._get_all_subreddits())
+        self.stream_manager = RedditStreamManager(self.reddit, self._get_all_subreddits(),
+            last_checked=utctimestamp(self.cog_state.last_checked))
         self.queue_manager = QueueManager(self.cog_state)
 
         logger.info("Using reddit account: {}".format((await self.reddit.user.me()).name))
@@ -364,6 +606,7 @@ class Subwatch(KazCog):
             return
 
         ch_info = self.cog_state.channels[channel]
+        await self.stream_manager.prefetch(self.queue_manager.peek(channel, self.PREFETCH_SIZE))
         count = 0
         try:
             while count < self.cog_config.max_posts_per_interval:
@@ -422,7 +665,7 @@ class Subwatch(KazCog):
                       url='https://reddit.com/u/{}'.format(submission.author.name))
         if submission.thumbnail.startswith('http://') or submission.thumbnail.startswith('https://'):
             es.set_thumbnail(url=submission.thumbnail)
-        await self.send_message(channel, embed=es)
+        await self.send_message(channel, embed=es, priority=Priority.BULK)
 
     #####
     # Discord
@@ -438,14 +681,8 @@ class Subwatch(KazCog):
 
         with self.cog_state as state:
             count = 0
-            last_checked = utctimestamp(state.last_checked)
-            last_timestamp = last_checked  # last processed submission timestamp
             async for submission in self.stream_manager.stream():
-                # if an old submission / already checked, skip it
-                if self.stream_manager.is_fresh and submission.created_utc <= last_checked:
-                    continue
                 self.queue_manager.add(submission)
-                last_timestamp = submission.created_utc
                 logger.debug("Found post: {}".format(self.log_submission(submission)))
                 count += 1
             if count > 0:
@@ -453,8 +690,10 @@ class Subwatch(KazCog):
             else:
                 logger.debug("Found 0 posts in subreddits: {}".format(', '.join(sub_set)))
             # issue #339: if an older post is un-removed and detected, we want to avoid
-            # re-posting posts that came after that older post
-            if last_timestamp > last_checked:
+            # re-posting posts that came after that older post (each shard tracks its own latest
+            # post; this is the latest across all shards)
+            last_timestamp = self.stream_manager.last_checked
+            if last_timestamp > utctimestamp(state.last_checked):
                 state.last_checked = datetime.utcfromtimestamp(last_timestamp)
             await self._post_all_channels()
 
@@ -512,6 +751,7 @@ class Subwatch(KazCog):
                 last_posted=datetime.utcnow()  # issue #340: don't process old posts on new config
             )
         self.stream_manager.subreddits = self._get_all_subreddits()
+        self.queue_manager.rebuild_index()
         logger.info("Set channel #{} for subwatch: {}"
             .format(channel.name, ', '.join('/r/' + s for s in subreddits_list)))
         await self.send_message(ctx.message.channel, ctx.message.author.mention + ' ' +
@@ -543,6 +783,7 @@ class Subwatch(KazCog):
                 subreddits=subreddits, last_posted=datetime.utcnow()
             )
         self.stream_manager.subreddits = self._get_all_subreddits()
+        self.queue_manager.rebuild_index()
         logger.info("Reset channel #{} subwatch: {}"
             .format(channel.name, ', '.join('/r/' + s for s in subreddits)))
         await self.send_message(ctx.message.channel, ctx.message.author.mention + ' ' +
@@ -577,10 +818,38 @@ class Subwatch(KazCog):
                 if task_instance.args[0] == channel:
                     task_instance.cancel()
             self.stream_manager.subreddits = self._get_all_subreddits()
+            self.queue_manager.rebuild_index()
             logger.info(f'Removed subwatches in #{channel.name}.')
             await self.send_message(ctx.message.channel,
                 ctx.message.author.mention + ' ' + f'Removed subwatches in {channel.mention}.')
 
+    @subwatch.command(pass_context=True, ignore_extra=False)
+    @mod_only()
+    async def apistats(self, ctx: commands.Context):
+        """!kazhelp
+
+        brief: Show reddit API usage.
+        description: |
+            Show the reddit API requests made by the bot since startup (by all modules), by
+            account and endpoint, with the mean response time and number of errors. Also shows the
+            remaining API rate limit for each account.
+        """
+        login_manager = reddit.RedditLoginManager()
+        stats = login_manager.stats
+        elapsed = timedelta(seconds=int(time.time() - stats.since))
+        header = "{:d} reddit API requests in {}".format(stats.total, format_timedelta(elapsed))
+        lines = []
+        for username, endpoint, count, mean, errors in stats.summary():
+            lines.append("{} {}: {:d} ({:.0f} ms){}".format(
+                username, endpoint, count, mean * 1000,
+                ', {:d} errors'.format(errors) if errors else ''))
+        for username, limits in login_manager.get_rate_limits().items():
+            if limits.get('remaining') is not None:
+                lines.append("{} rate limit: {:.0f} remaining, {:.0f} used".format(
+                    username, limits['remaining'], limits['used']))
+        await self.send_message(ctx.message.channel,
+            ctx.message.author.mention + ' ' + header + '\n' + format_list(lines))
+
 
 def setup(bot):
     bot.add_cog(Subwatch(bot))
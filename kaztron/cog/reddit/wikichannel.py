@@ -1,15 +1,16 @@
-from datetime import datetime
+from datetime import datetime, timedelta
 import logging
-from typing import List, Dict, Iterable, Optional, Union
+from typing import List, Dict, Iterable, Optional, Union, Tuple, Set
 
 import discord
 from discord.ext import commands
 
-from kaztron import KazCog
+from kaztron import KazCog, task
 from kaztron.config import SectionView
 from kaztron.driver import reddit
 from kaztron.utils.checks import mod_only
-from kaztron.utils.datetime import utctimestamp
+from kaztron.utils.containers import FifoCache
+from kaztron.utils.datetime import utctimestamp, format_timedelta
 
 from kaztron.utils.embeds import EmbedSplitter, Limits
 from kaztron.utils.logging import exc_log_str, tb_log_str
@@ -30,19 +31,21 @@ def get_reddit_scopes():
 class WikiChannelConfig(SectionView):
     """
     :ivar reddit_username: Username to use. If not specified, will use the first logged-in user.
+    :ivar check_interval: How often to check wiki pages for new revisions, in seconds.
     """
     reddit_username: str
+    check_interval: int
 
 
 class WikiChannelData:
     """
     :ivar subreddit: Subreddit containing the wiki page
     :ivar wikipage: URL to the Reddit wiki page to mirror in channel
-    :ivar last_revision: The revision last posted to channel
+    :ivar last_revision: The ID of the revision last posted to channel (0 if not known)
     :ivar channel: The Discord channel to post to
     :ivar messages: List of IDs to messages already posted
     """
-    def __init__(self, *, subreddit: str, wikipage: str, last_revision: int,
+    def __init__(self, *, subreddit: str, wikipage: str, last_revision: Union[str, int],
                  channel: discord.Channel, messages: Iterable[str]):
         self.subreddit = subreddit
         self.wikipage = wikipage
@@ -142,7 +145,8 @@ class WikiChannel(KazCog):
     brief: Maintain a wiki page in a Discord channel.
     description: |
         This module mirrors one or more wiki pages in a Discord channel. Pages are updated upon a
-        call to `.wikichannel refresh`.
+        call to `.wikichannel refresh`. After that, the bot checks for new revisions of the wiki
+        page every {{check_interval}} and updates the channel automatically when the page is edited.
 
         The raw wiki contents are interpreted as Discord message input, including Markdown.
         Any Markdown supported by Discord is supported by this module.
@@ -184,6 +188,10 @@ class WikiChannel(KazCog):
             last_checked=0
         )
         self.reddit = None  # type: reddit.Reddit
+        # (subreddit, page name, revision ID) -> parsed page
+        self.parsed_cache = FifoCache(maxsize=16)  # type: Dict[Tuple[str, str, str], list]
+        # (subreddit, page name) whose revision list this account isn't permitted to read
+        self.revisions_forbidden = set()  # type: Set[Tuple[str, str]]
 
     async def on_ready(self):
         await super().on_ready()
@@ -192,22 +200,111 @@ class WikiChannel(KazCog):
         self.reddit = reddit.RedditLoginManager().get_reddit(self.cog_config.reddit_username)
         logger.info("Using reddit account: {}".format((await self.reddit.user.me()).name))
 
+        if not self.scheduler.get_instances(self.task_check_wiki):
+            interval = timedelta(seconds=self.cog_config.check_interval)
+            self.scheduler.schedule_task_in(
+                self.task_check_wiki, timedelta(seconds=30), every=interval)
+
+    def export_kazhelp_vars(self):
+        return {
+            'check_interval': format_timedelta(timedelta(seconds=self.cog_config.check_interval))
+        }
+
+    def unload_kazcog(self):
+        self.scheduler.cancel_all(self.task_check_wiki)
+
     #####
     # Reddit
     #####
 
-    async def _update_wiki(self, channel: discord.Channel):
+    async def _get_latest_revision(self, data: WikiChannelData) -> Optional[str]:
+        """
+        Get the ID of the latest revision of a wiki page. This only loads the revision list (one
+        entry), not the page content.
+
+        :return: The revision ID, or None if the revision list is not available (e.g. not permitted
+            for this account). If not permitted, the revision list isn't requested again for that
+            page until the channel is refreshed with :meth:`~.refresh`.
+        """
+        key = (data.subreddit.lower(), data.wikipage.lower())
+        if key in self.revisions_forbidden:
+            return None
+        sr = await self.reddit.subreddit(data.subreddit)  # type: reddit.models.Subreddit
+        page = WikiPage(self.reddit, sr, data.wikipage)
+        try:
+            async for revision in page.revisions(limit=1):
+                return revision['id']
+        except reddit.Forbidden:
+            logger.warning("Cannot read revisions for /r/{}/wiki/{}: will load the full page"
+                .format(data.subreddit, data.wikipage))
+            self.revisions_forbidden.add(key)
+        return None
+
+    async def _get_wiki(self, data: WikiChannelData, revision_id: Optional[str]) \
+            -> Tuple[str, List[WikiStructure]]:
+        """
+        Get the parsed contents of a wiki page. Parsed pages are cached by revision.
+
+        :param revision_id: The latest revision ID (see :meth:`~._get_latest_revision`). If None,
+            always loads the page.
+        :return: Tuple of (revision ID, parsed page)
+        """
+        key = (data.subreddit.lower(), data.wikipage.lower(), revision_id)
+        if revision_id is not None and key in self.parsed_cache:
+            return revision_id, self.parsed_cache[key]
+
+        sr = await self.reddit.subreddit(data.subreddit)  # type: reddit.models.Subreddit
+        page = await sr.wiki.get_page(data.wikipage)  # type: reddit.models.WikiPage
+        parsed = self._parse_wiki(page.content_md)
+        self.parsed_cache[key[:2] + (page.revision_id,)] = parsed
+        return page.revision_id, parsed
+
+    async def _update_wiki(self, channel: discord.Channel, force=True) -> bool:
         """
         Checks wiki pages configured for the specified channel and update them if needed.
+
+        :param force: If False, only update if there is a new revision of the wiki page.
+        :return: True if updated, False if the wiki page was unchanged.
         """
         data = self.cog_state.channels[channel]
+        revision_id = await self._get_latest_revision(data)
+        if not force and revision_id is not None and revision_id == data.last_revision:
+            logger.debug("Wiki page {} in channel #{} is unchanged (revision {})"
+                .format(data.wikipage, channel.name, revision_id))
+            return False
+        revision_id, parsed = await self._get_wiki(data, revision_id)
+        if not force and revision_id == data.last_revision:
+            return False
+
         with self.cog_state as state:
             data = state.channels[channel]
-            logger.info("Updating wiki page {} in channel #{}".format(data.wikipage, channel.name))
+            logger.info("Updating wiki page {} in channel #{} to revision {}"
+                .format(data.wikipage, channel.name, revision_id))
             await self._delete_messages(data)
             # end of this context so that the deletion is written/persisted in case of later errors
         with self.cog_state as state:
-            await self._post_wikichannel(state.channels[channel])
+            data = state.channels[channel]
+            await self._post_wikichannel(data, parsed=parsed)
+            data.last_revision = revision_id
+        return True
+
+    @task(is_unique=True)
+    async def task_check_wiki(self):
+        """
+        Update wiki channels whose pages have a new revision. Channels that have not yet been
+        refreshed with a known revision are skipped.
+        """
+        for channel, data in list(self.cog_state.channels.items()):
+            if not data.last_revision:
+                continue
+            try:
+                await self._update_wiki(channel, force=False)
+            except (reddit.NotFound, reddit.OAuthException,
+                    reddit.RequestException, reddit.ResponseException) as e:
+                logger.warning("Error checking wiki page /r/{}/wiki/{} for #{}: {}".format(
+                    data.subreddit, data.wikipage, channel.name, exc_log_str(e)))
+        with self.cog_state as state:
+            state.last_checked = datetime.utcnow()
 
     async def _delete_messages(self, data: WikiChannelData):
         """ Delete Discord messages for a WikiChannel. Modifies the :param:`data` structure. """
@@ -227,13 +324,16 @@ class WikiChannel(KazCog):
                 logger.warning("No valid messages to delete.")
             data.messages.clear()
 
-    async def _post_wikichannel(self, data: WikiChannelData, channel: discord.Channel=None):
+    async def _post_wikichannel(self, data: WikiChannelData, channel: discord.Channel=None,
+                                parsed: List[WikiStructure]=None):
         """
         Post wikichannel messages to a channel. If channel isn't specified, defaults to the
         channel configured by :param:`data`.
 
         If channel is specified, posts to that channel and does not update the `data` structure's
         message list (preview mode).
+
+        :param parsed: The parsed wiki page. If not specified, gets the latest revision.
         """
         if channel is None:
             channel = data.channel
@@ -241,10 +341,9 @@ class WikiChannel(KazCog):
         else:
             is_preview = True
 
-        sr = await self.reddit.subreddit(data.subreddit)  # type: reddit.models.Subreddit
-        page = await sr.wiki.get_page(data.wikipage)  # type: reddit.models.WikiPage
-        page_parsed = self._parse_wiki(page.content_md)
-        page_embed = self._render_embed(page_parsed)
+        if parsed is None:
+            _, parsed = await self._get_wiki(data, await self._get_latest_revision(data))
+        page_embed = self._render_embed(parsed)
         messages = []  # type: List[discord.Message]
         for embed in page_embed:
             if isinstance(embed, EmbedSplitter):
@@ -424,6 +523,9 @@ class WikiChannel(KazCog):
             - command: ".wikichannel preview #rules"
               description: Update the wiki page in #rules.
         """
+        data = self.cog_state.channels[channel]
+        # retry reading the revision list, in case the account's permissions have changed
+        self.revisions_forbidden.discard((data.subreddit.lower(), data.wikipage.lower()))
         await self._update_wiki(channel)
         data = self.cog_state.channels[channel]
         await self.send_message(ctx.message.channel, ctx.message.author.mention + " " +
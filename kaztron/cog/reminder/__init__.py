@@ -0,0 +1,7 @@
+from .reminder import Reminders
+from .controller import init_db
+
+
+def setup(bot):
+    init_db()
+    bot.add_cog(Reminders(bot))
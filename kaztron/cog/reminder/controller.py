@@ -0,0 +1,106 @@
+import logging
+from datetime import datetime
+from typing import List, Iterable
+
+# noinspection PyUnresolvedReferences
+from kaztron.driver import database as db
+from kaztron.cog.reminder.model import *
+from kaztron.driver.database import make_error_handler_decorator
+
+logger = logging.getLogger(__name__)
+
+db_file = 'reminders.sqlite'
+
+engine = None
+Session = db.sessionmaker()
+session = None
+
+
+def init_db():
+    global engine, session
+    engine = db.make_sqlite_engine(db_file)
+    Session.configure(bind=engine)
+    session = Session()
+    Base.metadata.create_all(engine)
+
+
+on_error_rollback = make_error_handler_decorator(lambda *args, **kwargs: session, logger)
+
+
+def _query_matching(user_id: str=None, channel_id: str=None) -> db.Query:
+    """ See :meth:`kaztron.cog.reminder.ReminderData.is_match` for matching rules. """
+    query = session.query(Reminder).filter(Reminder.channel_id == channel_id)
+    if user_id is not None:
+        query = query.filter(Reminder.user_id == user_id)
+    return query
+
+
+def query_reminders(user_id: str=None, channel_id: str=None) -> List[Reminder]:
+    """
+    Get reminders matching criteria, in ascending order of remind time. If channel_id is not
+    specified, gets personal reminders.
+    """
+    return _query_matching(user_id, channel_id).order_by(Reminder.remind_time).all()
+
+
+def count_reminders(user_id: str=None, channel_id: str=None) -> int:
+    return _query_matching(user_id, channel_id).count()
+
+
+def query_saylaters() -> List[Reminder]:
+    """ Get all channel reminders, in ascending order of remind time. """
+    return session.query(Reminder).filter(Reminder.channel_id.isnot(None))\
+        .order_by(Reminder.remind_time).all()
+
+
+def reminder_exists(values: dict) -> bool:
+    """ Whether a reminder with exactly these :class:`Reminder` column values exists. """
+    return session.query(Reminder).filter_by(**values).count() > 0
+
+
+def query_due(before: datetime) -> List[Reminder]:
+    """ Get all reminders due before a given time, in ascending order of remind time. """
+    return session.query(Reminder).filter(Reminder.remind_time < before)\
+        .order_by(Reminder.remind_time).all()
+
+
+@on_error_rollback
+def add_reminders(values: Iterable[dict]) -> List[Reminder]:
+    """ Add reminders. Each element is a dict of :class:`Reminder` column values. """
+    reminders = [Reminder(**v) for v in values]
+    session.add_all(reminders)
+    session.commit()
+    return reminders
+
+
+@on_error_rollback
+def update_reminder(reminder_id: int, **values) -> bool:
+    """ Update a reminder's column values. Returns False if the reminder does not exist. """
+    count = session.query(Reminder).filter(Reminder.reminder_id == reminder_id)\
+        .update(values, synchronize_session=False)
+    session.commit()
+    return count > 0
+
+
+@on_error_rollback
+def delete_reminder(reminder_id: int):
+    """ Delete a reminder. No effect if the reminder does not exist. """
+    session.query(Reminder).filter(Reminder.reminder_id == reminder_id)\
+        .delete(synchronize_session=False)
+    session.commit()
+
+
+@on_error_rollback
+def delete_reminders(user_id: str=None, channel_id: str=None, saylaters=False) -> List[int]:
+    """
+    Delete reminders matching criteria (see :func:`query_reminders`), or all channel reminders if
+    ``saylaters`` is True. Returns the IDs of deleted reminders.
+    """
+    if saylaters:
+        query = session.query(Reminder).filter(Reminder.channel_id.isnot(None))
+    else:
+        query = _query_matching(user_id, channel_id)
+    reminder_ids = [reminder_id for reminder_id, in query.with_entities(Reminder.reminder_id)]
+    query.delete(synchronize_session=False)
+    session.commit()
+    return reminder_ids
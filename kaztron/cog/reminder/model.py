@@ -0,0 +1,28 @@
+from kaztron.driver import database as db
+from kaztron.utils.discord import Limits
+
+Base = db.declarative_base()
+
+
+class Reminder(Base):
+    __tablename__ = 'reminders'
+
+    MAX_MESSAGE_LEN = Limits.MESSAGE
+
+    reminder_id = db.Column(db.Integer, db.Sequence('reminder_id_seq'), primary_key=True)
+    user_id = db.Column(db.String(24), nullable=False, index=True)
+    #: NULL for personal reminders
+    channel_id = db.Column(db.String(24), nullable=True, index=True)
+    timestamp = db.Column(db.TIMESTAMP, nullable=False)
+    remind_time = db.Column(db.TIMESTAMP, nullable=False, index=True)
+    #: Recurrence interval in seconds. NULL for non-recurring reminders.
+    renew_interval = db.Column(db.Float, nullable=True)
+    renew_limit = db.Column(db.Integer, nullable=True)
+    renew_limit_time = db.Column(db.TIMESTAMP, nullable=True)
+    pin = db.Column(db.Boolean, nullable=False, default=False)
+    message = db.Column(db.String(MAX_MESSAGE_LEN), nullable=False)
+
+    def __repr__(self):
+        return "<Reminder(reminder_id={:d}, user_id={}, channel_id={}, remind_time={})>" \
+            .format(self.reminder_id, self.user_id, self.channel_id,
+                    self.remind_time.isoformat(' '))
@@ -2,13 +2,14 @@ import asyncio
 import logging
 import re
 from datetime import datetime, timedelta
-from functools import reduce
 from typing import List, Tuple, Dict
 
 import discord
 from discord.ext import commands
 
 from kaztron import KazCog, TaskInstance, task
+from kaztron.cog.reminder import controller as c
+from kaztron.cog.reminder.model import Reminder
 from kaztron.config import SectionView
 from kaztron.errors import DiscordErrorCodes
 from kaztron.utils.checks import mod_channels, mod_only
@@ -39,7 +40,8 @@ class RenewData:
         return cls(
             interval=timedelta(seconds=data['interval']),
             limit=data.get('limit', 0),
-            limit_time=data.get('limit_time', None)
+            limit_time=datetime.utcfromtimestamp(data['limit_time'])
+                if data.get('limit_time', None) else None
         )
 
     def __repr__(self):
@@ -65,8 +67,10 @@ class ReminderData:
                  remind_time: datetime,
                  renew_data: RenewData,
                  pin: bool,
-                 msg: str
+                 msg: str,
+                 reminder_id: int = None
                  ):
+        self.reminder_id = reminder_id
         self.user_id = user_id
         self.channel_id = channel_id
         self.timestamp = timestamp
@@ -100,10 +104,42 @@ class ReminderData:
             msg=data['message']
         )
 
+    def to_row(self) -> dict:
+        """ Column values for a :class:`~kaztron.cog.reminder.model.Reminder` row. """
+        return {
+            'user_id': self.user_id,
+            'channel_id': self.channel_id,
+            'timestamp': self.timestamp,
+            'remind_time': self.remind_time,
+            'renew_interval': self.renew_data.interval.total_seconds() if self.renew_data else None,
+            'renew_limit': self.renew_data.limit if self.renew_data else None,
+            'renew_limit_time': self.renew_data.limit_time if self.renew_data else None,
+            'pin': self.pin,
+            'message': self.message
+        }
+
+    @classmethod
+    def from_row(cls, row: Reminder):
+        if row.renew_interval is not None:
+            renew_data = RenewData(interval=timedelta(seconds=row.renew_interval),
+                                   limit=row.renew_limit or 0, limit_time=row.renew_limit_time)
+        else:
+            renew_data = None
+        return cls(
+            reminder_id=row.reminder_id,
+            user_id=row.user_id,
+            channel_id=row.channel_id,
+            timestamp=row.timestamp,
+            remind_time=row.remind_time,
+            renew_data=renew_data,
+            pin=row.pin,
+            msg=row.message
+        )
+
     def __repr__(self):
-        return "<ReminderData(user_id={}, channel_id={}, " \
+        return "<ReminderData(reminder_id={}, user_id={}, channel_id={}, " \
                "timestamp={}, remind_time={}, renew={!r}, {}message={!r})>" \
-            .format(self.user_id, self.channel_id,
+            .format(self.reminder_id, self.user_id, self.channel_id,
                     self.timestamp.isoformat(' '),
                     self.remind_time.isoformat(' '),
                     self.renew_data,
@@ -212,7 +248,7 @@ class ReminderParser:
 
 
 class ReminderState(SectionView):
-    reminders: List[ReminderData]
+    reminders: List[ReminderData]  # legacy (<= v2.2): migrated to the database on load
 
 
 class ReminderConfig(SectionView):
@@ -249,6 +285,11 @@ class Reminders(KazCog):
     MAX_RETRIES = 10
     RETRY_INTERVAL = 90
 
+    #: Reminders due within this time are loaded into the scheduler.
+    LOAD_HORIZON = timedelta(hours=1)
+    #: How often to load reminders. Must be shorter than LOAD_HORIZON.
+    LOAD_INTERVAL = timedelta(minutes=15)
+
     ###
     # LIFECYCLE
     ###
@@ -264,12 +305,21 @@ class Reminders(KazCog):
             lambda l: [ReminderData.from_dict(r) for r in l],
             lambda l: [r.to_dict() for r in l]
         )
-        self.reminders = []  # type: List[ReminderData]
+        # reminders currently in the scheduler, by reminder_id
+        self.loaded = {}  # type: Dict[int, ReminderData]
+        # all reminders due before this time are in the scheduler
+        self.horizon = datetime.utcfromtimestamp(0)
 
     async def on_ready(self):
         await super().on_ready()
-        if not self.reminders:
-            self._load_reminders()
+        self._migrate_state()
+        if not self.scheduler.get_instances(self.task_load_reminders):
+            self._unload_reminders()
+            self.scheduler.schedule_task_in(self.task_load_reminders, 0, every=self.LOAD_INTERVAL)
+
+    def unload_kazcog(self):
+        self.scheduler.cancel_all(self.task_load_reminders)
+        self._unload_reminders()
 
     def export_kazhelp_vars(self):
         interval_s = format_timedelta(timedelta(seconds=self.cog_config.renew_interval_min))
@@ -279,23 +329,59 @@ class Reminders(KazCog):
             "renew_interval_min": interval_s
         }
 
-    def _load_reminders(self):
-        logger.info("Loading reminders from persisted state...")
+    def _migrate_state(self):
+        """ Move reminders persisted in the state file (v2.2 and earlier) to the database. """
+        reminders = self.cog_state.reminders
+        if reminders:
+            logger.info("Migrating {:d} reminders from state file to database..."
+                .format(len(reminders)))
+            # skip rows already migrated, if a previous migration was interrupted before the state
+            # file was cleared
+            rows = [r.to_row() for r in reminders]
+            c.add_reminders([row for row in rows if not c.reminder_exists(row)])
+            self.cog_state.reminders = []
+            self.state.write()
+
+    def _load_reminders(self, horizon: datetime):
+        """ Schedule all reminders due before ``horizon`` that are not already scheduled. """
+        count = 0
+        for row in c.query_due(horizon):
+            if row.reminder_id not in self.loaded:
+                self._schedule_reminder(ReminderData.from_row(row))
+                count += 1
+        self.horizon = horizon
+        logger.debug("Loaded {:d} reminders due before {} ({:d} scheduled)"
+            .format(count, horizon.isoformat(' '), len(self.loaded)))
+
+    def _unload_reminders(self):
         try:
             self.scheduler.cancel_all(self.task_reminder_expired)
         except asyncio.InvalidStateError:
             pass
-        self.reminders.clear()
-        for reminder in self.cog_state.reminders:
-            self.add_reminder(reminder)
+        self.loaded.clear()
+        self.horizon = datetime.utcfromtimestamp(0)
 
-    def _save_reminders(self):
-        if not self.is_ready:
-            logger.debug("_save_reminders: not ready, skipping")
+    def _schedule_reminder(self, r: ReminderData):
+        self.loaded[r.reminder_id] = r
+        self.scheduler.schedule_task_at(self.task_reminder_expired, r.remind_time, args=(r,),
+            every=self.RETRY_INTERVAL)
+
+    def _unschedule_reminder(self, reminder_id: int):
+        """ Cancel a scheduled reminder. No effect if the reminder is not scheduled. """
+        r = self.loaded.pop(reminder_id, None)
+        if r is None:
             return
-        logger.debug("_save_reminders")
-        self.cog_state.reminders = self.reminders
-        self.state.write()
+        for inst in self.scheduler.get_instances(self.task_reminder_expired):  # type: TaskInstance
+            if inst.args[0] is r:
+                try:
+                    inst.cancel()
+                except asyncio.InvalidStateError:
+                    pass
+                break
+
+    @task(is_unique=True)
+    async def task_load_reminders(self):
+        self._load_reminders(datetime.utcnow() + self.LOAD_HORIZON)
 
     ###
     # GENERAL UTILITY FUNCTIONS
@@ -303,21 +389,15 @@ class Reminders(KazCog):
 
     def get_count(self, user_id: str = None, channel_id: str = None):
         """ Get number of reminders matching criteria. """
-        return reduce(lambda c, r: c+1 if r.is_match(user_id, channel_id) else c, self.reminders, 0)
+        return c.count_reminders(user_id, channel_id)
 
     def get_matching(self, user_id: str = None, channel_id: str = None):
         """ Get list of reminders matching criteria, in ascending order of remind time. """
-        return sorted(filter(lambda r: r.is_match(user_id, channel_id), self.reminders),
-                      key=lambda r: r.remind_time)
+        return [ReminderData.from_row(row) for row in c.query_reminders(user_id, channel_id)]
 
     @property
     def saylaters(self):
-        return sorted(filter(lambda r: r.channel_id, self.reminders), key=lambda r: r.remind_time)
-
-    @property
-    def personal_reminders(self):
-        return sorted(filter(lambda r: not r.channel_id, self.reminders),
-                      key=lambda r: r.remind_time)
+        return [ReminderData.from_row(row) for row in c.query_saylaters()]
 
     def make_reminder(self, ctx: commands.Context, args: str, channel: discord.Channel = None):
         """
@@ -352,23 +432,15 @@ class Reminders(KazCog):
         return reminder
 
     def add_reminder(self, r: ReminderData):
-        self.reminders.append(r)
-        self.scheduler.schedule_task_at(self.task_reminder_expired, r.remind_time, args=(r,),
-            every=self.RETRY_INTERVAL)
-        self._save_reminders()
+        r.reminder_id = c.add_reminders([r.to_row()])[0].reminder_id
+        if r.remind_time < self.horizon:
+            self._schedule_reminder(r)
         logger.info("Set reminder: {!r}".format(r))
 
     def remove_reminder(self, r: ReminderData):
-        """ Remove reminder. Parameter must be exact object. """
-        for inst in self.scheduler.get_instances(self.task_reminder_expired):  # type: TaskInstance
-            if inst.args[0] is r:
-                try:
-                    inst.cancel()
-                except asyncio.InvalidStateError:
-                    pass
-                self.reminders.remove(r)
-                break
-        self._save_reminders()
+        """ Remove reminder. """
+        c.delete_reminder(r.reminder_id)
+        self._unschedule_reminder(r.reminder_id)
 
     @staticmethod
     def format_list(reminders: List[ReminderData]) -> str:
@@ -620,22 +692,10 @@ class Reminders(KazCog):
                 await self.send_output("Error trying to pin reminder/saylater message: {!r}."
                     .format(reminder))
 
-        # stop scheduled retries and remove the reminder
-        try:
-            for instance in self.scheduler.get_instances(self.task_reminder_expired):
-                if instance.args[0] is reminder:
-                    instance.cancel()
-                    break
-        except asyncio.InvalidStateError:
-            pass
+        # stop scheduled retries
+        self._unschedule_reminder(reminder.reminder_id)
 
-        try:
-            self.reminders.remove(reminder)
-        except ValueError:
-            logger.warning("task_reminder_expired: Reminder not in list of reminders - "
-                           "already removed? {!r}".format(reminder))
-
-        # set up recurring reminder
+        # set up recurring reminder, or remove the reminder
         if reminder.renew_data and reminder.renew_data.interval:
             reminder.remind_time += reminder.renew_data.interval
             reminder.renew_data.limit -= 1
@@ -646,9 +706,15 @@ class Reminders(KazCog):
                 logger.debug("Recurring reminder has reached time limit")
             else:
                 logger.debug("Setting up recurrence")
-                self.add_reminder(reminder)
+                if not c.update_reminder(reminder.reminder_id, remind_time=reminder.remind_time,
+                                         renew_limit=reminder.renew_data.limit):
+                    logger.warning("task_reminder_expired: Reminder not in database - "
+                                   "already removed? {!r}".format(reminder))
+                elif reminder.remind_time < self.horizon:
+                    self._schedule_reminder(reminder)
+                return
 
-        self._save_reminders()
+        c.delete_reminder(reminder.reminder_id)
 
     @task_reminder_expired.error
     async def on_reminder_expired_error(self, e: Exception, t: TaskInstance):
@@ -678,8 +744,8 @@ class Reminders(KazCog):
 
         if not retry:
             t.cancel()
-            self.reminders.remove(r)
-            self._save_reminders()
+            self.loaded.pop(r.reminder_id, None)
+            c.delete_reminder(r.reminder_id)
 
     @reminder.command(ignore_extra=False, pass_context=True, name='list')
     async def reminder_list(self, ctx: commands.Context):
@@ -723,14 +789,8 @@ class Reminders(KazCog):
 
             WARNING: This command cannot be undone.
         """
-        for inst in self.scheduler.get_instances(self.task_reminder_expired):  # type: TaskInstance
-            if inst.args[0].is_match(user_id=ctx.message.author.id):
-                try:
-                    inst.cancel()
-                except asyncio.InvalidStateError:
-                    pass
-                self.reminders.remove(inst.args[0])
-        self._save_reminders()
+        for reminder_id in c.delete_reminders(user_id=ctx.message.author.id):
+            self._unschedule_reminder(reminder_id)
         await self.bot.say("All your reminders have been cleared.")
 
     @saylater.command(pass_context=True, ignore_extra=False, name='clear')
@@ -746,14 +806,8 @@ class Reminders(KazCog):
 
             WARNING: This command cannot be undone.
         """
-        for inst in self.scheduler.get_instances(self.task_reminder_expired):  # type: TaskInstance
-            if inst.args[0].channel_id:
-                try:
-                    inst.cancel()
-                except asyncio.InvalidStateError:
-                    pass
-                self.reminders.remove(inst.args[0])
-        self._save_reminders()
+        for reminder_id in c.delete_reminders(saylaters=True):
+            self._unschedule_reminder(reminder_id)
         await self.bot.say("All scheduled messages have been cleared.")
 
     @reminder.command(pass_context=True, ignore_extra=False, name='remove', aliases=['rem'])
@@ -817,12 +871,13 @@ class Reminders(KazCog):
             await self.send_message(ctx.message.channel, ctx.message.author.mention +
                 " Oops, that scheduled message doesn't exist!")
             return
+        saylaters = self.saylaters
         try:
-            reminder = self.saylaters[index-1]
+            reminder = saylaters[index-1]
         except IndexError:
             await self.send_message(ctx.message.channel, ctx.message.author.mention +
                  " Oops, that message doesn't exist! You only have {:d} messages scheduled."
-                 .format(len(self.saylaters)))
+                 .format(len(saylaters)))
             return
 
         desc = "Removed scheduled message "\
@@ -833,7 +888,3 @@ class Reminders(KazCog):
 
         self.remove_reminder(reminder)
         await self.send_message(ctx.message.channel, ctx.message.author.mention + " " + desc)
-
-
-def setup(bot):
-    bot.add_cog(Reminders(bot))
@@ -1,9 +1,9 @@
 import asyncio
+import bisect
 import random
-import re
 import time
 import logging
-from typing import List, Union, Optional
+from typing import List, Union, Optional, Dict, Iterable, Tuple
 from collections import deque
 
 import discord
@@ -17,199 +17,262 @@ from kaztron.utils.checks import mod_only, mod_or_has_role, in_channels_cfg
 from kaztron.utils.converter import NaturalDateConverter
 from kaztron.utils.datetime import utctimestamp, parse as dt_parse, parse_daterange, \
     get_month_offset, truncate, format_timedelta
-from kaztron.utils.decorators import error_handler, natural_truncate
 from kaztron.utils.discord import get_named_role, Limits, remove_role_from_all, \
     extract_user_id, user_mention, get_member, get_group_help, get_members_with_role
 from kaztron.utils.embeds import EmbedSplitter
 from kaztron.utils.logging import message_log_str, tb_log_str, exc_log_str
-from kaztron.utils.strings import format_list, split_chunks_on
+from kaztron.utils.strings import format_list, split_chunks_on, natural_truncate
 
 logger = logging.getLogger(__name__)
 
 
 class SpotlightApp:
     """
-    Should only be instantiated once the bot is ready (as it attempts to retrieve user data from
-    the server).
+    A Spotlight application, parsed from a row of the applications spreadsheet. All fields are
+    parsed (stripped and truncated) once on creation.
+
+    :param data: The spreadsheet row.
+    :param index: The index of the application in the spreadsheet (zero-indexed), or -1 if none.
     """
     TRUNC_LEN = 3*Limits.EMBED_FIELD_VALUE
-    SHORT_TRUNC_LEN = 0.5 * Limits.EMBED_FIELD_VALUE
-
-    def __init__(self, data: List[str], bot: commands.Bot):
-        self._data = data
-        self.bot = bot
-        self._cached_user = None
-        self._is_user_cached = False
-
-    @staticmethod
-    def is_filled(str_property: str) -> bool:
-        return str_property and str_property.strip().lower() != 'n/a'
-
-    @property
-    @error_handler(IndexError, datetime.utcfromtimestamp(0))
-    def timestamp(self) -> datetime:
-        return dt_parse(self._data[0], future=False)
-
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def user_name(self) -> str:
-        return self._data[1].strip()
-
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def user_name_only(self) -> str:
-        """ User name without discriminator (if provided in the field). """
-        return self._data[1].split('#', maxsplit=1)[0].strip()
-
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def user_discriminator(self) -> str:
-        """ Discriminator (the #xxxx part of an @mention in the client, if provided). """
-        return self._data[1].split('#', maxsplit=1)[1].strip()
-
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def user_disp(self) -> str:
-        """ Displayed user: either a mention if possible, else their user_name_only. """
+    SHORT_TRUNC_LEN = Limits.EMBED_FIELD_VALUE // 2
+
+    #: Text fields: (attribute name, spreadsheet column, truncation length)
+    FIELDS = (
+        ('user_name', 1, SHORT_TRUNC_LEN),
+        ('user_id', 2, SHORT_TRUNC_LEN),
+        ('user_reddit', 3, SHORT_TRUNC_LEN),
+        ('project', 4, SHORT_TRUNC_LEN),
+        ('keywords', 5, TRUNC_LEN),
+        ('favorite', 6, TRUNC_LEN),
+        ('talking_point', 7, TRUNC_LEN),
+        ('mature', 8, TRUNC_LEN),
+        ('inspirations', 9, TRUNC_LEN),
+        ('prompt', 10, TRUNC_LEN),
+        ('pitch', 11, TRUNC_LEN),
+        ('nsfw_info', 13, TRUNC_LEN),
+        ('art_url', 14, SHORT_TRUNC_LEN),
+        ('additional_info_url', 15, SHORT_TRUNC_LEN),
+        ('unnamed', 17, TRUNC_LEN),
+        ('genre', 27, SHORT_TRUNC_LEN),
+        ('project_type', 28, SHORT_TRUNC_LEN),
+        ('language', 29, SHORT_TRUNC_LEN),
+    )
+
+    __slots__ = ('index', '_timestamp', 'user_name_only', 'user_discriminator', 'discord_id',
+                 'user_disp', 'is_nsfw', 'is_ready', 'is_valid', '_discord_str') \
+        + tuple(name for name, _, _ in FIELDS)
+
+    def __init__(self, data: List[str], index: int):
+        self.index = index
+        self._timestamp = self._get(data, 0)
+        for name, column, max_len in self.FIELDS:
+            setattr(self, name, self._get(data, column, max_len))
+
+        user_name = self._get(data, 1).split('#', maxsplit=1)
+        #: User name without discriminator (if provided in the field).
+        self.user_name_only = self._truncate(user_name[0].strip(), self.SHORT_TRUNC_LEN)
+        #: Discriminator (the #xxxx part of an @mention in the client, if provided).
+        self.user_discriminator = self._truncate(user_name[1].strip(), self.SHORT_TRUNC_LEN) \
+            if len(user_name) > 1 else ""
         try:
-            s_user_id = extract_user_id(self.user_id)
+            #: The user's discord ID, or None if the user_id field is not valid.
+            self.discord_id = extract_user_id(self.user_id)
         except discord.InvalidArgument:
-            return self.user_name_only.strip()
+            self.discord_id = None
+        #: Displayed user: either a mention if possible, else their user_name_only.
+        self.user_disp = self._truncate(
+            user_mention(self.discord_id) if self.discord_id else self.user_name_only,
+            self.SHORT_TRUNC_LEN)
+
+        self.is_nsfw = self._get(data, 12).lower() == 'yes'
+        self.is_ready = self._get(data, 16).lower() == 'yes'
+        self.is_valid = bool(self.user_name and self.project
+                             and not self.project.upper() == 'DELETED')
+
+        if self.discord_id:
+            author_value = "{} ({})".format(self.user_name_only, user_mention(self.discord_id))
         else:
-            return user_mention(s_user_id)
+            author_value = "{} (invalid ID)".format(self.user_name_only)
+        self._discord_str = "{} - *{}*".format(author_value, self.project.replace('*', '\\*'))
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(ValueError, "")
-    @error_handler(IndexError, "")
-    def user_id(self) -> str:
-        return self._data[2].strip()
+    @staticmethod
+    def _truncate(value: str, max_len) -> str:
+        return natural_truncate(value, max_len, '[...]')
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def user_reddit(self) -> str:
-        return self._data[3].strip()
+    @classmethod
+    def _get(cls, data: List[str], column: int, max_len=None) -> str:
+        try:
+            value = data[column].strip()
+        except IndexError:
+            return ""
+        return cls._truncate(value, max_len) if max_len else value
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def project(self) -> str:
-        return self._data[4].strip()
+    @staticmethod
+    def is_filled(str_property: str) -> bool:
+        return str_property and str_property.strip().lower() != 'n/a'
 
     @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def keywords(self) -> str:
-        return self._data[5].strip()
+    def timestamp(self) -> datetime:
+        if not self._timestamp:
+            return datetime.utcfromtimestamp(0)
+        return dt_parse(self._timestamp, future=False)
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def favorite(self) -> str:
-        return self._data[6].strip()
+    def __str__(self):
+        return "{} - {}".format(self.user_name, self.project)
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def talking_point(self) -> str:
-        return self._data[7].strip()
+    def discord_str(self):
+        return self._discord_str
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def mature(self) -> str:
-        return self._data[8].strip()
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def inspirations(self) -> str:
-        return self._data[9].strip()
+class SpotlightApplications:
+    """
+    The list of Spotlight applications, indexed by validity, readiness, genre and project type.
+    Index keys for genre and type are case-insensitive (lowercase).
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def prompt(self) -> str:
-        return self._data[10].strip()
+    :param rows: The spreadsheet rows.
+    """
+    def __init__(self, rows: List[List[str]]=()):
+        self._apps = [SpotlightApp(row, i) for i, row in enumerate(rows)]
+        self.valid = []  # type: List[SpotlightApp]
+        self.ready = []  # type: List[SpotlightApp]
+        self.by_genre = {}  # type: Dict[str, List[SpotlightApp]]
+        self.by_type = {}  # type: Dict[str, List[SpotlightApp]]
+        for app in self._apps:
+            if app.is_valid:
+                self.valid.append(app)
+            if app.is_ready:
+                self.ready.append(app)
+            if app.genre:
+                self.by_genre.setdefault(app.genre.lower(), []).append(app)
+            if app.project_type:
+                self.by_type.setdefault(app.project_type.lower(), []).append(app)
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def pitch(self) -> str:
-        return self._data[11].strip()
+    def __getitem__(self, index: int) -> SpotlightApp:
+        return self._apps[index]
 
-    @property
-    @error_handler(IndexError, False)
-    def is_nsfw(self) -> bool:
-        return self._data[12].strip().lower() == 'yes'
+    def __len__(self):
+        return len(self._apps)
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def nsfw_info(self) -> str:
-        return self._data[13].strip()
+    def __iter__(self):
+        return iter(self._apps)
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def art_url(self) -> str:
-        return self._data[14].strip()
+    def get_valid(self, category: str=None) -> List[SpotlightApp]:
+        """
+        Get valid (non-deleted) applications.
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def additional_info_url(self) -> str:
-        return self._data[15].strip()
+        :param category: If specified, only return applications with this genre or project type.
+        """
+        if not category:
+            return self.valid
+        return [app for app in self._get_category(category) if app.is_valid]
 
-    @property
-    @error_handler(IndexError, False)
-    def is_ready(self) -> bool:
-        return self._data[16].strip().lower() == 'yes'
+    def get_ready(self, category: str=None) -> List[SpotlightApp]:
+        """
+        Get applications ready for Spotlight.
 
-    @property
-    @natural_truncate(TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def unnamed(self) -> str:
-        return self._data[17].strip()
+        :param category: If specified, only return applications with this genre or project type.
+        """
+        if not category:
+            return self.ready
+        return [app for app in self._get_category(category) if app.is_ready]
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def genre(self) -> str:
-        return self._data[27].strip()
+    def _get_category(self, category: str) -> List[SpotlightApp]:
+        category = category.lower()
+        apps = self.by_genre.get(category, []) + self.by_type.get(category, [])
+        return sorted(set(apps), key=lambda app: app.index)
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def project_type(self) -> str:
-        return self._data[28].strip()
 
-    @property
-    @natural_truncate(SHORT_TRUNC_LEN)
-    @error_handler(IndexError, "")
-    def language(self) -> str:
-        return self._data[29].strip()
+class SpotlightQueue:
+    """
+    Queue of upcoming Spotlights, sorted by start date. Items with the same start date are kept in
+    the order they were added.
 
-    @property
-    def is_valid(self) -> bool:
-        return self.user_name and self.project and not self.project.upper() == 'DELETED'
+    Queue items are dicts with keys ``'id'`` (unique, assigned by :meth:`add` if not set),
+    ``'index'`` (application index), ``'start'``, ``'end'`` (UTC timestamps) and
+    ``'reminder_sent'``. Do not modify the start date or reminder flag of items directly: use
+    :meth:`reschedule` and :meth:`set_reminder_sent`.
 
-    def __str__(self):
-        return "{} - {}".format(self.user_name, self.project)
+    :param items: Initial queue items, in any order.
+    """
+    def __init__(self, items: Iterable[dict]=()):
+        self._keys = []  # type: List[Tuple[float, int]]
+        self._items = []  # type: List[dict]
+        self._pending = []  # type: List[Tuple[float, int]]  # keys of items awaiting a reminder
+        self._next_id = 0
+        for item in items:
+            self.add(item)
 
-    def discord_str(self):
-        try:
-            s_user_id = extract_user_id(self.user_id)
-        except discord.InvalidArgument:
-            author_value = "{} (invalid ID)".format(self.user_name_only)
-        else:
-            author_value = "{} ({})".format(self.user_name_only, user_mention(s_user_id))
-        return "{} - *{}*".format(author_value, self.project.replace('*', '\\*'))
+    @staticmethod
+    def _key(item: dict) -> Tuple[float, int]:
+        return item['start'], item['id']
+
+    def _insort(self, item: dict) -> int:
+        key = self._key(item)
+        i = bisect.bisect_left(self._keys, key)
+        self._keys.insert(i, key)
+        self._items.insert(i, item)
+        if not item['reminder_sent']:
+            bisect.insort(self._pending, key)
+        return i
+
+    def _delete(self, i: int) -> dict:
+        key = self._keys.pop(i)
+        item = self._items.pop(i)
+        if not item['reminder_sent']:
+            del self._pending[bisect.bisect_left(self._pending, key)]
+        return item
+
+    def __getitem__(self, i: int) -> dict:
+        return self._items[i]
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def add(self, item: dict) -> int:
+        """ Add an item to the queue. Returns its new position. """
+        if item.get('id') is None:
+            item['id'] = self._next_id
+        self._next_id = max(self._next_id, item['id'] + 1)
+        return self._insort(item)
+
+    def remove(self, i: int) -> dict:
+        """ Remove and return the item at position ``i``. """
+        return self._delete(i)
+
+    def popleft(self) -> dict:
+        """ Remove and return the first item. Raises IndexError if the queue is empty. """
+        if not self._items:
+            raise IndexError("pop from an empty queue")
+        return self._delete(0)
+
+    def reschedule(self, i: int, start: float, end: float) -> int:
+        """ Change the dates of the item at position ``i``. Returns its new position. """
+        item = self._delete(i)
+        item['start'] = start
+        item['end'] = end
+        return self._insort(item)
+
+    def index(self, item: dict) -> int:
+        """ Position of an item in the queue. Raises ValueError if not in the queue. """
+        i = bisect.bisect_left(self._keys, self._key(item))
+        if i < len(self._items) and self._items[i] is item:
+            return i
+        raise ValueError("item not in queue")
+
+    def set_reminder_sent(self, item: dict):
+        if not item['reminder_sent']:
+            del self._pending[bisect.bisect_left(self._pending, self._key(item))]
+            item['reminder_sent'] = True
+
+    def next_reminder(self) -> Optional[dict]:
+        """ The earliest item whose reminder has not yet been sent, or None. """
+        if not self._pending:
+            return None
+        return self._items[bisect.bisect_left(self._keys, self._pending[0])]
 
 
 class Spotlight(KazCog):
@@ -293,7 +356,7 @@ class Spotlight(KazCog):
 
     def __init__(self, bot):
         super().__init__(bot)
-        self.state.set_defaults('spotlight', current=-1, queue=[], start_time=None, reminders=[])
+        self.state.set_defaults('spotlight', current=-1, queue={}, start_time=None, reminders=[])
 
         # discord stuff
         self.channel_spotlight = None
@@ -308,13 +371,12 @@ class Spotlight(KazCog):
         self.user_agent = self.config.get("core", "name")
         self.gsheet_id = self.config.get("spotlight", "spreadsheet_id")
         self.gsheet_range = self.config.get("spotlight", "spreadsheet_range")
-        self.applications = []
+        self.applications = SpotlightApplications()
         self.applications_last_refresh = 0
 
         # queues
         self.current_app_index = int(self.state.get('spotlight', 'current', -1))
-        # deque contains dicts with keys ('index', 'start', 'end')
-        self.queue_data = deque(self.state.get('spotlight', 'queue', []))
+        self.queue_data = self._load_queue()
         self.queue_reminder_offset = timedelta(
             seconds=self.config.get('spotlight', 'queue_reminder_offset')
         )
@@ -337,7 +399,7 @@ class Spotlight(KazCog):
         if time.monotonic() - self.applications_last_refresh > self.APPLICATIONS_CACHE_EXPIRES_S:
             logger.debug("Cache miss: Loading Spotlight applications from Google Sheets")
             apps_data = gsheets.get_sheet_rows(self.gsheet_id, self.gsheet_range, self.user_agent)
-            self.applications = [SpotlightApp(app, self.bot) for app in apps_data]
+            self.applications = SpotlightApplications(apps_data)
             self.applications_last_refresh = time.monotonic()
         else:
             logger.debug("Cache hit: Using Spotlight applications cache")
@@ -345,19 +407,45 @@ class Spotlight(KazCog):
     def _write_db(self):
         """ Write all data to the dynamic configuration file. """
         self.state.set('spotlight', 'current', self.current_app_index)
-        self.state.set('spotlight', 'queue', list(self.queue_data))
         self.state.set('spotlight', 'start_time',
             utctimestamp(self.start_time) if self.start_time is not None else None)
         self.state.set('spotlight', 'reminders', [utctimestamp(t) for t in self.reminders])
         self.state.write()
 
-    def _upgrade_queue_v21(self):
-        new_queue = deque()
+    def _write_queue_item(self, queue_item: dict):
+        """
+        Update a single queue item in the state file. Does not write the file: call
+        :meth:`_write_db` after.
+        """
+        self.state.set_item('spotlight', 'queue', [str(queue_item['id'])],
+            {k: v for k, v in queue_item.items() if k != 'id'})
+
+    def _delete_queue_item(self, queue_item: dict):
+        """
+        Delete a single queue item from the state file. Does not write the file: call
+        :meth:`_write_db` after.
+        """
+        self.state.delete_item('spotlight', 'queue', [str(queue_item['id'])])
+
+    def _load_queue(self) -> SpotlightQueue:
+        queue_data = self.state.get('spotlight', 'queue', {})
+        if isinstance(queue_data, list):
+            queue_data = self._upgrade_queue_v21(queue_data)
+            queue_data = self._upgrade_queue_v22(queue_data)
+            queue_data = self._upgrade_queue_v23(queue_data)
+            self.state.set('spotlight', 'queue', queue_data)
+            self.state.write()
+        return SpotlightQueue(dict(queue_item, id=int(item_id))
+                              for item_id, queue_item in queue_data.items())
+
+    @staticmethod
+    def _upgrade_queue_v21(queue_data: list) -> list:
+        new_queue = []
         cur_date = datetime.utcnow()
         next_date = cur_date + timedelta(days=1)
-        if self.queue_data and not isinstance(self.queue_data[0], dict):
+        if queue_data and not isinstance(queue_data[0], dict):
             logger.info("Upgrading queue to version 2.1")
-            for queue_index in self.queue_data:
+            for queue_index in queue_data:
                 new_queue.append({
                     'index': queue_index,
                     'start': cur_date.timestamp(),
@@ -365,15 +453,23 @@ class Spotlight(KazCog):
                 })
                 cur_date += timedelta(days=2)
                 next_date += timedelta(days=2)
-            self.queue_data = new_queue
-            self._write_db()
+            return new_queue
+        return queue_data
 
-    def _upgrade_queue_v22(self):
-        if self.queue_data and 'reminder_sent' not in self.queue_data[0]:
+    @staticmethod
+    def _upgrade_queue_v22(queue_data: list) -> list:
+        if queue_data and 'reminder_sent' not in queue_data[0]:
             logger.info("Upgrading queue to version 2.2")
-            for queue_item in self.queue_data:
+            for queue_item in queue_data:
                 queue_item['reminder_sent'] = False
-            self._write_db()
+        return queue_data
+
+    @staticmethod
+    def _upgrade_queue_v23(queue_data: list) -> dict:
+        """ Queue stored as a dict of item ID to item, so that items can be written singly. """
+        logger.info("Upgrading queue to version 2.3")
+        return {str(i): queue_item for i, queue_item
+                in enumerate(sorted(queue_data, key=lambda o: o['start']))}
 
     async def _get_current(self) -> SpotlightApp:
         """
@@ -438,15 +534,13 @@ class Spotlight(KazCog):
             logged and communicated over Discord, provided for informational purposes/further
             handling)
         """
-        index = self.applications.index(app) + 1
+        index = app.index + 1
         logger.info("Displaying spotlight data for: {!s}".format(app))
 
-        try:
-            s_user_id = extract_user_id(app.user_id)
-        except discord.InvalidArgument:
-            author_value = "{} (invalid ID)".format(app.user_name_only)
+        if app.discord_id:
+            author_value = "{} ({})".format(user_mention(app.discord_id), app.user_name_only)
         else:
-            author_value = "{} ({})".format(user_mention(s_user_id), app.user_name_only)
+            author_value = "{} (invalid ID)".format(app.user_name_only)
 
         es = EmbedSplitter(color=0x80AAFF, auto_truncate=True)
         es.add_field_no_break(name="Project Name", value=app.project, inline=True)
@@ -483,9 +577,8 @@ class Spotlight(KazCog):
         Handles validating the app (mostly existence of the user), and communicating any warnings
         via Discord message to msg_dest.
         """
-        try:
-            user_id = extract_user_id(app.user_id)
-        except discord.InvalidArgument:
+        user_id = app.discord_id
+        if not user_id:
             logger.warning("User ID format for spotlight app is invalid: '{}'".format(app.user_id))
             await self.bot.say("**Warning**: User ID format is invalid: '{}'".format(app.user_id))
             return
@@ -557,10 +650,6 @@ class Spotlight(KazCog):
             logger.warning(msg)
             await self.send_output("[Warning] " + msg)
 
-        # convert queue from previous versions
-        self._upgrade_queue_v21()
-        self._upgrade_queue_v22()
-
         # get spotlight applications - mostly to verify the connection
         self._load_applications()
 
@@ -582,28 +671,34 @@ class Spotlight(KazCog):
 
     @spotlight.command(pass_context=True, ignore_extra=False, aliases=['l'])
     @mod_only()
-    async def list(self, ctx):
+    async def list(self, ctx, *, category: str=None):
         """!kazhelp
         description: List all the {{spotlight_name}} applications in summary form.
+        parameters:
+            - name: category
+              optional: true
+              type: string
+              description: If specified, only list applications with this genre or project type
+                (not case sensitive).
+        examples:
+            - command: .spotlight list
+              description: List all applications.
+            - command: .spotlight list Fantasy
+              description: List applications in the Fantasy genre.
         """
         self._load_applications()
-        logger.info("Listing all spotlight applications for {0.author!s} in {0.channel!s}"
-            .format(ctx.message))
-
-        # format each application as a string
-        app_str_list = []
-        for app in self.applications:
-            if app.is_valid:
-                app_str_list.append(app.discord_str())
-            else:  # deleted entries: blank username/project name or blank user/'DELETED' project
-                app_str_list.append(None)
-                continue
-
-        # format into a string list for display
-        app_list_string = format_list(app_str_list) if app_str_list else 'Empty'
-        # cleanup for deleted records
-        # We don't have a dedicated column for this, so hacky regex post-numbering it is!
-        app_list_string = re.sub(r'(^|\n)\s*\d+\. None(\n|$)', '\n', app_list_string)
+        logger.info("Listing spotlight applications (category={0!r}) for {1.author!s} in "
+                    "{1.channel!s}".format(category, ctx.message))
+
+        # deleted entries (blank username/project name or 'DELETED' project) are not indexed, so
+        # number each application by its index in the full list (as used by select)
+        apps = self.applications.get_valid(category)
+        if apps:
+            fmt = "{0: >" + str(len(str(len(self.applications)))) + "d}. {1}"
+            app_list_string = '\n'.join(fmt.format(app.index + 1, app.discord_str())
+                                        for app in apps)
+        else:
+            app_list_string = 'Empty'
         await self.send_embed_list(title=self.LIST_HEADING, contents=app_list_string)
 
     @spotlight.command(pass_context=True, ignore_extra=False, aliases=['c'])
@@ -626,11 +721,22 @@ class Spotlight(KazCog):
 
     @spotlight.command(pass_context=True, ignore_extra=False, aliases=['r'])
     @mod_only()
-    async def roll(self, ctx):
+    async def roll(self, ctx, *, category: str=None):
         """!kazhelp
         description: |
             Select a {{spotlight_name}} application at random, and set it as the currently selected
             application. Only applications that are marked 'ready for Spotlight' will be selected.
+        parameters:
+            - name: category
+              optional: true
+              type: string
+              description: If specified, only select from applications with this genre or project
+                type (not case sensitive).
+        examples:
+            - command: .spotlight roll
+              description: Select any ready application.
+            - command: .spotlight roll Fantasy
+              description: Select a ready application in the Fantasy genre.
         """
         self._load_applications()
 
@@ -639,8 +745,16 @@ class Spotlight(KazCog):
             await self.bot.say("There are no spotlight applications!")
             return
 
-        selected_app = random.choice(list(filter(lambda app: app.is_ready, self.applications)))
-        self.current_app_index = self.applications.index(selected_app)
+        ready_apps = self.applications.get_ready(category)
+        if not ready_apps:
+            logger.warning("roll: No ready spotlight applications found (category={!r})"
+                .format(category))
+            await self.bot.say("There are no spotlight applications ready{}!"
+                .format(" in '{}'".format(category) if category else ""))
+            return
+
+        selected_app = random.choice(ready_apps)
+        self.current_app_index = selected_app.index
         self._write_db()
 
         logger.info("roll: Currently selected app {:d} {!s}"
@@ -758,7 +872,7 @@ class Spotlight(KazCog):
             except IndexError:
                 # app_str for non-showcase, app's data for showcase format
                 app_str = self.UNKNOWN_APP_STR
-                app = SpotlightApp(["", "Unknown", "", "", app_str], self.bot)
+                app = SpotlightApp(["", "Unknown", "", "", app_str], -1)
             else:
                 app_str = app.discord_str()
 
@@ -776,9 +890,6 @@ class Spotlight(KazCog):
     def format_date_range(self, start: Union[date, datetime], end: Union[date, datetime]):
         return start.strftime(self.time_formats[0]), end.strftime(self.time_formats[1])
 
-    def sort_queue(self):
-        self.queue_data = deque(sorted(self.queue_data, key=lambda o: o['start']))
-
     @queue.command(name='list', ignore_extra=False, pass_context=True, aliases=['l'])
     @mod_only()
     async def queue_list(self, ctx):
@@ -894,12 +1005,11 @@ class Spotlight(KazCog):
             'end': utctimestamp(dates[1]),
             'reminder_sent': False
         }
-        self.queue_data.append(queue_item)
+        queue_index = self.queue_data.add(queue_item)
         logger.info("queue add: added #{:d} from current select at {} to {}"
             .format(self.current_app_index + 1, dates[0].isoformat(' '), dates[1].isoformat(' ')))
 
-        self.sort_queue()
-        queue_index = self.queue_data.index(queue_item)  # find the new position now
+        self._write_queue_item(queue_item)
         self._write_db()
         self._schedule_upcoming_reminder()
         start, end = self.format_date_range(dates[0], dates[1])
@@ -947,17 +1057,18 @@ class Spotlight(KazCog):
         try:
             app = await self._get_current()
         except IndexError:
-            self.queue_data.appendleft(queue_item)
+            self.queue_data.add(queue_item)
             self.current_app_index = old_index
             return  # get_current() already handles this
         except Exception:
-            self.queue_data.appendleft(queue_item)
+            self.queue_data.add(queue_item)
             self.current_app_index = old_index
             raise
         else:
             await self.send_spotlight_info(ctx.message.channel, app)
             await self.bot.say("**Scheduled for:** {} to {}".format(start_str, end_str))
             await self.send_validation_warnings(ctx, app)
+            self._delete_queue_item(queue_item)
             self._write_db()
             self._schedule_upcoming_reminder()
 
@@ -1011,10 +1122,8 @@ class Spotlight(KazCog):
             raise commands.BadArgument(e.args[0]) from e
 
         # Make the changes
-        queue_item['start'] = utctimestamp(dates[0])  # same mutable object as in queue_data
-        queue_item['end'] = utctimestamp(dates[1])  # same mutable object as in queue_data
-        self.sort_queue()
-        new_queue_index = self.queue_data.index(queue_item) + 1
+        new_queue_index = self.queue_data.reschedule(
+            queue_array_index, utctimestamp(dates[0]), utctimestamp(dates[1])) + 1
 
         # Prepare the output
         try:
@@ -1026,6 +1135,7 @@ class Spotlight(KazCog):
 
         logger.info("queue edit: changed item {:d} to dates {} to {}"
             .format(queue_index, dates[0].isoformat(' '), dates[1].isoformat(' ')))
+        self._write_queue_item(queue_item)
         self._write_db()
         self._schedule_upcoming_reminder()
         await self.bot.say(self.QUEUE_CHANGED_FMT.format(
@@ -1084,9 +1194,10 @@ class Spotlight(KazCog):
             date.fromtimestamp(queue_item['end'])
         )
 
-        del self.queue_data[queue_array_index]
+        self.queue_data.remove(queue_array_index)
 
         logger.info("queue rem: removed index {0:d}".format(queue_index))
+        self._delete_queue_item(queue_item)
         self._write_db()
         self._schedule_upcoming_reminder()
         await self.bot.say(self.QUEUE_CHANGED_FMT.format(
@@ -1153,19 +1264,12 @@ class Spotlight(KazCog):
         else:
             await self.core.on_command_error(exc, ctx, force=True)  # Other errors can bubble up
 
-    def _get_next_reminder(self):
-        for queue_item in self.queue_data:
-            if not queue_item['reminder_sent']:
-                return queue_item
-        else:  # no future item found
-            return None
-
     def _schedule_upcoming_reminder(self):
         async def inner():
             logger.debug("Waiting on task_upcoming_reminder to finish cancelling...")
             await self.scheduler.wait_all(self.task_upcoming_reminder)
             logger.debug("Done, scheduling next reminder...")
-            queue_item = self._get_next_reminder()
+            queue_item = self.queue_data.next_reminder()
             if queue_item is not None:
                 start_time = datetime.utcfromtimestamp(queue_item['start'])
                 reminder_time = start_time - self.queue_reminder_offset
@@ -1176,7 +1280,7 @@ class Spotlight(KazCog):
 
     @task(is_unique=True)
     async def task_upcoming_reminder(self):
-        queue_item = self._get_next_reminder()
+        queue_item = self.queue_data.next_reminder()
         if not queue_item:
             logger.warning("task_upcoming_reminder: no future queue items to remind")
             await self.send_output("**Spotlight queue reminder failed**: no future queue items!")
@@ -1204,7 +1308,8 @@ class Spotlight(KazCog):
             start=start_str, end=end_str, app=app_str
         ))
 
-        queue_item['reminder_sent'] = True
+        self.queue_data.set_reminder_sent(queue_item)
+        self._write_queue_item(queue_item)
         self._write_db()
         self._schedule_upcoming_reminder()
 
@@ -5,12 +5,14 @@ import enum
 import gzip
 import hashlib
 import io
+import json
 import logging
 import os
 import shutil
+from array import array
 from datetime import datetime, timedelta
 from os import path
-from typing import Union, Tuple, Optional, List
+from typing import Union, Tuple, Optional, List, Dict, Iterable, Set
 
 import discord
 
@@ -58,33 +60,148 @@ class StatsAccumulator:
     statistics across different Accumulator outputs, while ensuring no link between the user and
     data can reasonably be made.
 
+    For more frequent persistence, :meth:`~.pop_delta()` returns only the counters changed since the
+    last call (or since the last :meth:`~.clear_delta()`); these deltas can be re-applied on top of
+    a :meth:`~.to_dict()` snapshot with :meth:`~.apply_delta()`.
+
+    Internally, user hashes and channel IDs are interned into small integer indices, and each event
+    tuple is packed into a single integer key. This avoids storing a copy of the (long) user hash
+    for every event tuple. :meth:`~.find()` for a user looks up that user's keys directly (one per
+    event type and channel). By default, a compact index of keys by channel is also kept, so that
+    :meth:`~.find()` doesn't need to scan all the data when only a channel is specified.
+
     :param period: The start time of the period covered.
     :param salt: The salt to use for user anonymisation.
     :param hash_name: The name of the hash to use for user anonymisation.
     :param iterations: The number of hash iterations to use.
+    :param indexed: Whether to maintain the by-channel index.
     """
-    def __init__(self, period: datetime, salt: bytes, hash_name='sha256', iterations=100000):
-        self.data = {}
-        self.start_times = {}
+    _TYPE_BITS = 3
+    _CHANNEL_BITS = 20
+
+    def __init__(self, period: datetime, salt: bytes, hash_name='sha256', iterations=100000,
+                 indexed=True):
+        self.data = {}  # type: Dict[int, int]
+        self.start_times = {}  # type: Dict[Tuple[EventType, str, str], float]
         self.period = period
         self.salt = salt
 
         self.hash_name = hash_name
         self.hash_iters = iterations
 
+        # index 0 is reserved for None (events not associated with a user/channel)
+        self._users = [None]  # type: List[Optional[str]]
+        self._user_map = {None: 0}  # type: Dict[Optional[str], int]
+        self._channels = [None]  # type: List[Optional[str]]
+        self._channel_map = {None: 0}  # type: Dict[Optional[str], int]
+
+        # user ID -> user index: avoids recalculating hashes for known users. Never persisted.
+        self._user_id_cache = {}  # type: Dict[str, int]
+
+        self.indexed = indexed
+        self._by_channel = {}  # type: Dict[int, array]  # packed keys, array('q')
+
+        # delta tracking: changed keys, and number of interned users/channels already persisted
+        self._dirty_keys = set()  # type: Set[int]
+        self._saved_users = 1
+        self._saved_channels = 1
+        self._start_times_dirty = False
+
+    def __len__(self):
+        return len(self.data)
+
+    @classmethod
+    def _pack(cls, type_value: int, user_index: int, channel_index: int) -> int:
+        if channel_index >> cls._CHANNEL_BITS:
+            raise OverflowError("Too many channels in accumulator")
+        return (((user_index << cls._CHANNEL_BITS) | channel_index) << cls._TYPE_BITS) | type_value
+
+    @classmethod
+    def _unpack(cls, key: int) -> Tuple[int, int, int]:
+        type_value = key & ((1 << cls._TYPE_BITS) - 1)
+        key >>= cls._TYPE_BITS
+        channel_index = key & ((1 << cls._CHANNEL_BITS) - 1)
+        return type_value, key >> cls._CHANNEL_BITS, channel_index
+
+    def _user_index(self, user: Union[discord.Member, str, None], create=True) -> Optional[int]:
+        """
+        Get the interned index for a user. Returns None if ``create`` is False and the user has no
+        data in this accumulator.
+        """
+        if user is None:
+            return 0
+        user_id = user.id if isinstance(user, discord.Member) else str(user)
+
+        if user_id.startswith('h$'):
+            user_hash = user_id
+            user_id = None
+        else:
+            try:
+                return self._user_id_cache[user_id]
+            except KeyError:
+                user_hash = self._hash(user_id)
+
+        try:
+            index = self._user_map[user_hash]
+        except KeyError:
+            if not create:
+                return None
+            index = self._user_map[user_hash] = len(self._users)
+            self._users.append(user_hash)
+        if user_id is not None:
+            self._user_id_cache[user_id] = index
+        return index
+
+    def _channel_index(self, channel: Union[discord.Channel, str, None], create=True)\
+            -> Optional[int]:
+        """
+        Get the interned index for a channel. Returns None if ``create`` is False and the channel
+        has no data in this accumulator.
+        """
+        channel_id = channel.id if isinstance(channel, discord.Channel) else channel
+        try:
+            return self._channel_map[channel_id]
+        except KeyError:
+            if not create:
+                return None
+            index = self._channel_map[channel_id] = len(self._channels)
+            self._channels.append(channel_id)
+            return index
+
+    def _make_key(self,
+                  type_: EventType,
+                  user: Union[discord.Member, str, None],
+                  channel: Union[discord.Channel, str, None],
+                  create=True) -> Optional[int]:
+        user_index = self._user_index(user, create)
+        channel_index = self._channel_index(channel, create)
+        if user_index is None or channel_index is None:
+            return None
+        return self._pack(type_.value, user_index, channel_index)
+
     def _make_tuple(self,
                     type_: EventType,
                     user: Union[discord.Member, str],
                     channel: Union[discord.Channel, str]) -> Tuple:
-        if isinstance(user, discord.Member):
-            user_hash = self._hash(user.id)
-        elif str(user).startswith('h$'):
-            user_hash = user
-        elif user is None:
-            user_hash = None
-        else:
-            user_hash = self._hash(str(user))
-        return type_, user_hash, channel.id if isinstance(channel, discord.Channel) else channel
+        user_index = self._user_index(user)
+        return type_, self._users[user_index], \
+            channel.id if isinstance(channel, discord.Channel) else channel
+
+    def _key_to_tuple(self, key: int) -> Tuple[EventType, str, str]:
+        type_value, user_index, channel_index = self._unpack(key)
+        return EventType(type_value), self._users[user_index], self._channels[channel_index]
+
+    def _set(self, key: int, value: int):
+        if self.data.get(key) == value:
+            return
+        if key not in self.data and self.indexed:
+            channel_index = self._unpack(key)[2]
+            try:
+                self._by_channel[channel_index].append(key)
+            except KeyError:
+                self._by_channel[channel_index] = array('q', (key,))
+        self.data[key] = value
+        self._dirty_keys.add(key)
 
     def _hash(self, data):
         if not isinstance(data, bytes):
@@ -100,11 +217,8 @@ class StatsAccumulator:
                       type_: EventType,
                       user: Optional[discord.Member],
                       channel: Optional[discord.Channel]):
-        key = self._make_tuple(type_, user, channel)
-        try:
-            self.data[key] += 1
-        except KeyError:
-            self.data[key] = 1
+        key = self._make_key(type_, user, channel)
+        self._set(key, self.data.get(key, 0) + 1)
 
     def capture_timed_event_start(self,
                                   timestamp: datetime,
@@ -113,6 +227,7 @@ class StatsAccumulator:
                                   channel: discord.Channel):
         key = self._make_tuple(type_, user, channel)
         self.start_times[key] = utctimestamp(timestamp)
+        self._start_times_dirty = True
 
     def capture_timed_event_end(self,
                                 timestamp: datetime,
@@ -123,47 +238,67 @@ class StatsAccumulator:
         try:
             start_time = self.start_times[key]
             del self.start_times[key]
+            self._start_times_dirty = True
         except KeyError:
             pass
         else:
-            try:
-                self.data[key] += int(utctimestamp(timestamp) - start_time + 0.5)
-            except KeyError:
-                self.data[key] = int(utctimestamp(timestamp) - start_time + 0.5)
+            data_key = self._make_key(*key)
+            self._set(data_key, self.data.get(data_key, 0) +
+                      int(utctimestamp(timestamp) - start_time + 0.5))
 
     def set_event(self,
                   type_: EventType,
                   user: Optional[discord.Member],
                   channel: Optional[discord.Channel],
                   value: int):
-        key = self._make_tuple(type_, user, channel)
-        self.data[key] = value
+        self._set(self._make_key(type_, user, channel), value)
 
     def get(self, type_: EventType, user: discord.Member, channel: discord.Channel) -> int:
         """ Retrieve an event count. If the tuple is not found, returns 0. """
-        key = self._make_tuple(type_, user, channel)
-        try:
-            return self.data[key]
-        except KeyError:
-            return 0
+        key = self._make_key(type_, user, channel, create=False)
+        return self.data.get(key, 0) if key is not None else 0
 
     def find(self,
             type_: EventType=None,
             user: discord.Member=None,
             channel: discord.Channel=None) -> List[Tuple[EventType, str, str, int]]:
         """
-        Search for data. This is an O(n) operation, searches for any combination of parameters.
+        Search for data. Searches for any combination of parameters. If ``user`` is specified, only
+        that user's data is searched. If only ``channel`` is specified, only that channel's data is
+        searched (if the accumulator is indexed). Otherwise, this is an O(n) operation.
 
         :return: A list of tuples containing (type, user_hash, channel_id, count)
         """
-
-        def tuple_filt(t: tuple):
-            return ((type_ is None or type_ == t[0]) and
-                    (user is None or user.id == t[1]) and
-                    (channel is None or channel.id == t[2]))
-
-        # noinspection PyTypeChecker
-        return [(*key, self.data[key]) for key in filter(tuple_filt, self.data.keys())]
+        user_index = self._user_index(user, create=False) if user is not None else None
+        channel_index = self._channel_index(channel, create=False) if channel is not None else None
+        if (user is not None and user_index is None) or \
+                (channel is not None and channel_index is None):
+            return []
+
+        if user_index is not None:
+            types = (type_.value,) if type_ is not None else (t.value for t in EventType)
+            channels = (channel_index,) if channel_index is not None else range(len(self._channels))
+            keys = [key for key in (self._pack(t, user_index, c)
+                                    for t in types for c in channels)
+                    if key in self.data]
+        elif self.indexed and channel_index is not None:
+            keys = self._by_channel.get(channel_index, ())
+        else:
+            keys = self.data.keys()
+
+        results = []
+        for key in keys:
+            k_type, k_user, k_channel = self._unpack(key)
+            if ((type_ is None or type_.value == k_type) and
+                    (user_index is None or user_index == k_user) and
+                    (channel_index is None or channel_index == k_channel)):
+                results.append((*self._key_to_tuple(key), self.data[key]))
+        return results
+
+    def items(self) -> Iterable[Tuple[EventType, str, str, int]]:
+        """ Iterate over all data, as tuples of (type, user_hash, channel_id, count). """
+        for key, value in self.data.items():
+            yield (*self._key_to_tuple(key), value)
 
     def write_csv(self, filepath: str, bot: discord.Client, now: datetime):
         logger.info("Writing CSV file: {}".format(filepath))
@@ -178,17 +313,24 @@ class StatsAccumulator:
 
             # write all events
             logger.debug("Writing all events to CSV...")
+            channel_names = []
+            for channel_id in self._channels:
+                channel = bot.get_channel(channel_id) if channel_id is not None else None
+                channel_names.append(('#' + channel.name) if channel else channel_id)
+
             rows = []
             period_str = self.period.isoformat(' ')
-            for k, v in self.data.items():
-                channel = bot.get_channel(k[2])
-                channel_name = ('#' + channel.name) if channel else k[2]
-                rows.append([period_str, k[0].name, k[1], channel_name, v])
+            for key, v in self.data.items():
+                type_value, user_index, channel_index = self._unpack(key)
+                rows.append([period_str, EventType(type_value).name, self._users[user_index],
+                             channel_names[channel_index], v])
             writer.writerows(rows)
 
     def to_dict(self):
         return {
-            'data': [(k[0].name, k[1], k[2], v) for k, v in self.data.items()],
+            'users': self._users[1:],
+            'channels': self._channels[1:],
+            'counts': list(self.data.items()),
             'start_time_data': [(k[0].name, k[1], k[2], v) for k, v in self.start_times.items()],
             'period': utctimestamp(self.period),
             'salt': binascii.b2a_base64(self.salt).decode(),
@@ -205,10 +347,78 @@ class StatsAccumulator:
             hash_name=data['hash_name'],
             iterations=data['hash_iters']
         )
-        self.data = {(EventType[i[0]], i[1], i[2]): i[3] for i in data['data']}
+        if 'counts' in data:
+            self._users.extend(data['users'])
+            self._user_map.update((h, i) for i, h in enumerate(self._users))
+            self._channels.extend(data['channels'])
+            self._channel_map.update((c, i) for i, c in enumerate(self._channels))
+            for key, value in data['counts']:
+                self._set(key, value)
+        else:  # legacy format: list of (type, user_hash, channel_id, count) tuples
+            for i in data['data']:
+                self.set_event(EventType[i[0]], i[1], i[2], i[3])
         self.start_times = {(EventType[i[0]], i[1], i[2]): i[3] for i in data['start_time_data']}
+        self.clear_delta()
         return self
 
+    def pop_delta(self) -> Optional[dict]:
+        """
+        Get all changes since the last call to this method (or since :meth:`~.clear_delta()`), and
+        reset the change tracking.
+
+        :return: A dict containing the changes, which can be passed to :meth:`~.apply_delta()`, or
+            None if there are no changes.
+        """
+        if not self._dirty_keys and not self._start_times_dirty and \
+                self._saved_users == len(self._users) and \
+                self._saved_channels == len(self._channels):
+            return None
+
+        delta = {
+            'period': utctimestamp(self.period),
+            'user_offset': self._saved_users,
+            'users': self._users[self._saved_users:],
+            'channel_offset': self._saved_channels,
+            'channels': self._channels[self._saved_channels:],
+            'counts': [(key, self.data[key]) for key in self._dirty_keys],
+            'start_time_data': [(k[0].name, k[1], k[2], v) for k, v in self.start_times.items()]
+        }
+        self.clear_delta()
+        return delta
+
+    def clear_delta(self):
+        """ Reset change tracking, e.g. after persisting a full snapshot from :meth:`~.to_dict`. """
+        self._dirty_keys.clear()
+        self._saved_users = len(self._users)
+        self._saved_channels = len(self._channels)
+        self._start_times_dirty = False
+
+    def apply_delta(self, delta: dict):
+        """
+        Apply a delta from :meth:`~.pop_delta()` to this accumulator. Applying the same delta more
+        than once has no further effect.
+
+        :raise ValueError: The delta is for a different period, or doesn't follow from the data
+            already in this accumulator.
+        """
+        if delta['period'] != utctimestamp(self.period):
+            raise ValueError("Delta is for a different period")
+        if delta['user_offset'] > len(self._users) or \
+                delta['channel_offset'] > len(self._channels):
+            raise ValueError("Delta is missing preceding users or channels")
+
+        for i, user_hash in enumerate(delta['users'], delta['user_offset']):
+            if i >= len(self._users):
+                self._user_map[user_hash] = i
+                self._users.append(user_hash)
+        for i, channel_id in enumerate(delta['channels'], delta['channel_offset']):
+            if i >= len(self._channels):
+                self._channel_map[channel_id] = i
+                self._channels.append(channel_id)
+        for key, value in delta['counts']:
+            self._set(key, value)
+        self.start_times = {(EventType[i[0]], i[1], i[2]): i[3] for i in delta['start_time_data']}
+
 
 class CsvRow:
     headings = ('Period', 'Event', 'User hash (monthly)', 'Channel', 'Count')
@@ -250,6 +460,40 @@ class CsvRow:
         return self._count_cache
 
 
+def append_delta_log(filepath: str, delta: dict):
+    """ Append an accumulator delta (see :meth:`StatsAccumulator.pop_delta`) to a log file. """
+    with open(filepath, mode='a') as logfile:
+        logfile.write(json.dumps(delta))
+        logfile.write('\n')
+
+
+def read_delta_log(filepath: str) -> List[dict]:
+    """
+    Read all accumulator deltas from a log file. Any malformed lines (e.g. a partial write before a
+    crash) are skipped. If the file doesn't exist, returns an empty list.
+    """
+    deltas = []
+    try:
+        with open(filepath) as logfile:
+            for i, line in enumerate(logfile, 1):
+                try:
+                    deltas.append(json.loads(line))
+                except ValueError:
+                    logger.warning("Skipping malformed line {:d} in delta log '{}'"
+                        .format(i, filepath))
+    except FileNotFoundError:
+        pass
+    return deltas
+
+
+def clear_delta_log(filepath: str):
+    """ Delete a delta log file, e.g. after it has been compacted into a full snapshot. """
+    try:
+        os.unlink(filepath)
+    except FileNotFoundError:
+        pass
+
+
 def init_stats_dir():
     logger.info("Checking/making stats directory '{}'...".format(stats_dir))
     os.makedirs(stats_dir, mode=0o775, exist_ok=True)
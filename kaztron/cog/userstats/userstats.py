@@ -118,6 +118,8 @@ class UserStats(KazCog):
 
     SAVE_TIMEOUT = 15
 
+    DELTA_LOG_FILE = 'state-userstats-delta.log'
+
     def __init__(self, bot):
         super().__init__(bot, 'userstats')
         self.setup_custom_state('userstats')
@@ -135,6 +137,7 @@ class UserStats(KazCog):
 
         self.acc = None  # type: StatsAccumulator
         self.last_acc_save = 0
+        self.member_count = None  # type: int
 
         self.load_accumulator()
 
@@ -143,6 +146,7 @@ class UserStats(KazCog):
 
         if acc_dict:
             self.acc = StatsAccumulator.from_dict(acc_dict)
+            self.replay_delta_log()
         else:
             current_hour = self.get_current_hour()
             if self.acc:
@@ -150,22 +154,50 @@ class UserStats(KazCog):
             else:
                 next_salt = self.get_next_salt(None, current_hour)
             self.acc = StatsAccumulator(current_hour, salt=next_salt, **self.ACCUMULATOR_SETTINGS)
+            self.save_accumulator_snapshot()
 
         self.last_acc_save = time.monotonic()
 
+    def replay_delta_log(self):
+        """ Apply any changes saved in the delta log since the last accumulator snapshot. """
+        deltas = core.read_delta_log(self.DELTA_LOG_FILE)
+        if deltas:
+            logger.info("Replaying {:d} accumulator deltas".format(len(deltas)))
+        for delta in deltas:
+            try:
+                self.acc.apply_delta(delta)
+            except (ValueError, KeyError):
+                logger.warning("Skipping accumulator delta not applicable to current accumulator")
+        self.acc.clear_delta()
+
     def save_accumulator(self, force=False):
+        """
+        Save changes to the accumulator since the last save to the delta log. The full accumulator
+        is only written to the state file by :meth:`~.save_accumulator_snapshot`.
+        """
         if force or time.monotonic() - self.last_acc_save >= self.SAVE_TIMEOUT:
-            # logger.debug("Updating total user count in accumulator...")
-            user_count = 0
-            for server in self.bot.servers:
-                user_count += len(server.members)
-            self.acc.set_event(EventType.total_users, None, None, user_count)
-
-            # logger.debug("Saving accumulator...")
-            self.state.set('userstats', 'accumulator', self.acc.to_dict())
-            self.state.write(log=False)
+            if self.member_count is not None:
+                self.acc.set_event(EventType.total_users, None, None, self.member_count)
+
+            delta = self.acc.pop_delta()
+            if delta:
+                core.append_delta_log(self.DELTA_LOG_FILE, delta)
             self.last_acc_save = time.monotonic()
 
+    def save_accumulator_snapshot(self):
+        """ Save the full accumulator to the state file, and compact the delta log. """
+        if self.member_count is not None:
+            self.acc.set_event(EventType.total_users, None, None, self.member_count)
+        self.state.set('userstats', 'accumulator', self.acc.to_dict())
+        self.state.write(log=False)
+        self.acc.clear_delta()
+        core.clear_delta_log(self.DELTA_LOG_FILE)
+        self.last_acc_save = time.monotonic()
+
+    def count_members(self):
+        """ Recount the total number of members on all servers. """
+        self.member_count = sum(len(server.members) for server in self.bot.servers)
+
     def get_next_salt(self,
                       prev_period: Optional[datetime],
                       next_period: datetime,
@@ -189,6 +221,7 @@ class UserStats(KazCog):
 
     async def on_ready(self):
         await super().on_ready()
+        self.count_members()
         await self.update_accumulator()
         await self.init_voice_channels()
         self.schedule_monthly_task()
@@ -217,7 +250,7 @@ class UserStats(KazCog):
         now = datetime.utcnow()
         for k in old_start_times.keys():
             self.acc.capture_timed_event_end(now, *k)
-        self.state.set('userstats', 'accumulator', self.acc.to_dict())
+        self.save_accumulator_snapshot()
 
     async def update_accumulator(self):
         """
@@ -246,7 +279,7 @@ class UserStats(KazCog):
         for k in old_start_times.keys():
             self.acc.capture_timed_event_start(now, *k)
         self.acc.start_times.update(old_start_times)
-        self.save_accumulator(force=True)
+        self.save_accumulator_snapshot()
 
     async def show_report(self, dest, report: reports.Report):
         em = discord.Embed(
@@ -335,6 +368,7 @@ class UserStats(KazCog):
     async def on_member_join(self, member: discord.Member):
         """ On member join, record the event. """
         await self.update_accumulator()
+        self.member_count += 1
 
         if member.id not in self.ignore_user_ids:
             self.acc.capture_event(EventType.join, None, None)
@@ -344,6 +378,7 @@ class UserStats(KazCog):
     async def on_member_remove(self, member: discord.Member):
         """ On member part, record the event. """
         await self.update_accumulator()
+        self.member_count -= 1
 
         if member.id not in self.ignore_user_ids:
             self.acc.capture_event(EventType.part, None, None)
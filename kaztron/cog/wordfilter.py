@@ -8,6 +8,7 @@ from kaztron import KazCog
 from kaztron.config import SectionView
 from kaztron.driver.wordfilter import WordFilter as WordFilterEngine
 from kaztron.kazcog import ready_only
+from kaztron.sendqueue import Priority
 from kaztron.utils.checks import mod_only, mod_channels
 from kaztron.utils.discord import check_role, MSG_MAX_LEN, Limits, get_command_str, get_help_str, \
     get_group_help, get_jump_url
@@ -195,7 +196,7 @@ class WordFilter(KazCog):
                              value=natural_truncate(message_string, Limits.EMBED_FIELD_VALUE),
                              inline=False)
 
-                await self.bot.send_message(self.channel_current, embed=em)
+                await self.send_message(self.channel_current, embed=em, priority=Priority.HIGH)
 
     @commands.group(name="filter", invoke_without_command=True, pass_context=True)
     @mod_only()
@@ -282,6 +282,45 @@ class KaztronConfig:
         section_data[key] = copy.deepcopy(value)
         self.is_dirty = True
 
+    def _get_item_parent(self, section: str, key: str, path: Sequence[str], create: bool) -> dict:
+        if self._read_only:
+            raise ReadOnlyError("Configuration {} is read-only".format(self.filename))
+        if not path:
+            raise ValueError("Item path cannot be empty")
+        parent = self._data.setdefault(section, {}) if create else self._data[section]
+        for path_key in (key,) + tuple(path[:-1]):
+            parent = parent.setdefault(path_key, {}) if create else parent[path_key]
+        return parent
+
+    def set_item(self, section: str, key: str, path: Sequence[str], value):
+        """
+        Write a single item within a (nested) dict configuration value, i.e.,
+        ``data[section][key][path[0]][path[1]]... = value``. Missing dicts along the path are
+        created.
+
+        Unlike :meth:`set`, only ``value`` is copied: use this to update one item in a large
+        configuration value.
+
+        :raise ReadOnlyError: configuration is set as read-only
+        """
+        parent = self._get_item_parent(section, key, path, create=True)
+        parent[path[-1]] = copy.deepcopy(value)
+        self.is_dirty = True
+
+    def delete_item(self, section: str, key: str, path: Sequence[str]):
+        """
+        Delete a single item within a (nested) dict configuration value. See :meth:`set_item`.
+        No effect if the item does not exist.
+
+        :raise ReadOnlyError: configuration is set as read-only
+        """
+        try:
+            parent = self._get_item_parent(section, key, path, create=False)
+            del parent[path[-1]]
+        except KeyError:
+            return
+        self.is_dirty = True
+
     def set_defaults(self, section: str, **kwargs):
         """
         Set configuration values for any keys that are not already defined in the config file.
@@ -450,6 +489,23 @@ class SectionView:
             raise ConfigConverterError(self.__config.filename, self.__section, key) from e
         self.__config.set(self.__section, key, value)
 
+    def set_item(self, key: str, path: Sequence[str], value):
+        """
+        Write a single item within a (nested) dict configuration value. Usage is similar to
+        :meth:`KaztronConfig.set_item`.
+
+        No converters are called and the converted value cache is not cleared: this is for keys
+        whose converted value is updated in place, and must be kept consistent with the stored
+        value by the caller.
+        """
+        self.__config.set_item(self.__section, key, path, value)
+
+    def delete_item(self, key: str, path: Sequence[str]):
+        """
+        Delete a single item within a (nested) dict configuration value. See :meth:`set_item`.
+        """
+        self.__config.delete_item(self.__section, key, path)
+
     def keys(self):
         return self.__config.get_section_data(self.__section).keys()
 
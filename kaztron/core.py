@@ -11,6 +11,7 @@ from kaztron.config import SectionView
 from kaztron.errors import *
 from kaztron.help_formatter import DiscordHelpFormatter, JekyllHelpFormatter
 from kaztron.rolemanager import RoleManager
+from kaztron.sendqueue import Priority
 from kaztron.utils.checks import mod_only, mod_channels
 from kaztron.utils.decorators import task_handled_errors
 from kaztron.utils.logging import message_log_str, exc_log_str, tb_log_str, exc_msg_str
@@ -211,7 +212,7 @@ class CoreCog(kaztron.KazCog):
             ', '.join(key + '=' + repr(value) for key, value in kwargs.items()))
         logger.exception("Error occurred in " + log_msg)
         await self.send_output("[ERROR] In {}\n\n{}\n\nSee log for details".format(
-            log_msg, exc_log_str(exc_info[1])))
+            log_msg, exc_log_str(exc_info[1])), priority=Priority.HIGH)
 
         try:
             message = args[0]
@@ -445,6 +446,8 @@ class CoreCog(kaztron.KazCog):
             resources for operators and moderators.
 
             TIP: *For mods.* If {{name}} ever seems unresponsive, try this command first.
+
+            This also shows outgoing message queue statistics, overall and for the current channel.
         """
         em = discord.Embed(color=0x80AAFF, title=self.name)
         em.add_field(name="KazTron version",
@@ -452,6 +455,12 @@ class CoreCog(kaztron.KazCog):
         em.add_field(name="discord.py version",
             value="v{}".format(discord.__version__), inline=True)
         em.add_field(name="Loaded Cogs", value='\n'.join(self.bot.cogs.keys()))
+        em.add_field(name="Send Queue", value="depth={:d} {!s}"
+            .format(self.send_queue.depth(), self.send_queue.stats), inline=False)
+        channel_stats = self.send_queue.destination_stats(ctx.message.channel)
+        if channel_stats is not None:
+            em.add_field(name="Send Queue (this channel)", value="depth={:d} {!s}"
+                .format(self.send_queue.depth(ctx.message.channel), channel_stats), inline=False)
 
         links = kaztron.bot_info["links"].copy()
         links.update(self.cog_config.info_links)
@@ -18,6 +18,11 @@ from sqlalchemy.engine import Engine
 from sqlalchemy.orm.exc import NoResultFound, MultipleResultsFound
 
 
+#: Maximum number of bound parameters in a single SQLite statement (default compile-time limit for
+#: SQLite < 3.32). Use to chunk large ``IN (...)`` queries.
+SQLITE_MAX_VARIABLES = 999
+
+
 def make_sqlite_engine(filename):
     """
     Make an SQLAlchemy engine. Filename should be unique to the cog/module using it to avoid
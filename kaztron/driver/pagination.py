@@ -1,4 +1,4 @@
-from typing import List, Tuple
+from typing import List, Tuple, Callable, Optional
 
 import math
 
@@ -25,7 +25,7 @@ class Pagination:
     @property
     def total_pages(self):
         """ Calculate the total pages. """
-        return int(math.ceil(len(self.records) / self.page_size))
+        return int(math.ceil(len(self) / self.page_size))
 
     @property
     def page(self) -> int:
@@ -48,7 +48,7 @@ class Pagination:
             start = self.page * self.page_size
             end = start + self.page_size
         else:
-            end = len(self.records) - (self.total_pages - self.page - 1) * self.page_size
+            end = len(self) - (self.total_pages - self.page - 1) * self.page_size
             start = max(0, end - self.page_size)
         return start, end
 
@@ -58,3 +58,35 @@ class Pagination:
     def __iter__(self):
         start_index, end_index = self.get_page_indices()
         return itertools.islice(self.records, start_index, end_index)
+
+
+class QueryPagination(Pagination):
+    """
+    Lazy paginator backed by a query: only the records on the current page are retrieved, and only
+    when first needed. The current page's records are cached until the page changes.
+
+    :param count: Total number of records.
+    :param fetch: Function that takes a start and end index (as in a slice) and returns the records
+        in that range.
+    :param page_size: Number of records per page.
+    :param align_end: See :class:`Pagination`.
+    """
+    def __init__(self, count: int, fetch: Callable[[int, int], List], page_size: int,
+                 align_end=False):
+        self.count = count
+        self.fetch = fetch
+        self._cached = None  # type: Optional[Tuple[int, List]]
+        super().__init__((), page_size, align_end)
+
+    def get_page_records(self) -> List:
+        """ Get the records for the current page. """
+        if self._cached is None or self._cached[0] != self.page:
+            start_index, end_index = self.get_page_indices()
+            self._cached = (self.page, list(self.fetch(start_index, end_index)))
+        return self._cached[1]
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        return iter(self.get_page_records())
@@ -1,7 +1,11 @@
-from typing import Iterable, Sequence, Dict, Optional, MutableMapping, Set
+from typing import Iterable, Sequence, Dict, Optional, MutableMapping, Set, Tuple, List
+import re
 import secrets
 import logging
+import time
+from urllib.parse import urlsplit
 
+import aiohttp
 import asyncpraw as apraw
 # noinspection PyUnresolvedReferences
 from asyncpraw import models
@@ -9,8 +13,10 @@ from asyncpraw import models
 from asyncpraw import *
 # noinspection PyUnresolvedReferences
 from asyncprawcore.exceptions import *
+from asyncprawcore import Requestor
 
 from kaztron.config import SectionView, get_kaztron_config, get_runtime_config
+from kaztron.driver.stats import MeanVarianceAccumulator
 
 logger = logging.getLogger(__name__)
 Reddit = apraw.Reddit
@@ -43,6 +49,82 @@ class RedditState(SectionView):
     last_auth_state: str
 
 
+class RequestStats:
+    """
+    Number and latency of reddit API requests, by account and endpoint. Endpoint paths are
+    normalised (e.g. subreddit names and post IDs are replaced by placeholders).
+    """
+    _path_patterns = (
+        (re.compile(r'/r/[^/]+'), '/r/{subreddit}'),
+        (re.compile(r'/(u|user)/[^/]+'), '/user/{user}'),
+        (re.compile(r'/comments/[^/]+(/[^/]+)?'), '/comments/{id}'),
+        (re.compile(r'/wiki/.+'), '/wiki/{page}'),
+    )
+
+    def __init__(self):
+        self.latency = {}  # type: Dict[Tuple[str, str], MeanVarianceAccumulator]  # seconds
+        self.errors = {}  # type: Dict[Tuple[str, str], int]
+        self.since = time.time()
+
+    @classmethod
+    def endpoint(cls, method: str, url: str) -> str:
+        path = urlsplit(url).path.rstrip('/') or '/'
+        for pattern, replacement in cls._path_patterns:
+            path = pattern.sub(replacement, path)
+        return '{} {}'.format(method.upper(), path)
+
+    def record(self, username: str, method: str, url: str, latency: float, error=False):
+        key = (username, self.endpoint(method, url))
+        try:
+            self.latency[key].update(latency)
+        except KeyError:
+            self.latency[key] = acc = MeanVarianceAccumulator()
+            acc.update(latency)
+        if error:
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+    @property
+    def total(self) -> int:
+        return sum(acc.count for acc in self.latency.values())
+
+    def summary(self) -> List[Tuple[str, str, int, float, int]]:
+        """
+        Get a summary of requests, busiest endpoints first.
+
+        :return: List of (username, endpoint, count, mean latency in seconds, error count).
+        """
+        rows = [(username, endpoint, acc.count, acc.mean, self.errors.get((username, endpoint), 0))
+                for (username, endpoint), acc in self.latency.items()]
+        rows.sort(key=lambda row: row[2], reverse=True)
+        return rows
+
+    def reset(self):
+        self.latency.clear()
+        self.errors.clear()
+        self.since = time.time()
+
+
+class InstrumentedRequestor(Requestor):
+    """ Requestor that records each request into a :class:`~.RequestStats`. """
+    def __init__(self, *args, stats: RequestStats, username: str, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.stats = stats
+        self.username = username
+
+    # Assumes the coroutine request() API of the asyncprawcore version pinned by asyncpraw~=7.1
+    # (asyncprawcore < 4). In asyncprawcore 4+, request() is an async context manager instead, and
+    # this override must be rewritten to wrap it.
+    async def request(self, method, url, *args, **kwargs):
+        start = time.monotonic()
+        error = True
+        try:
+            response = await super().request(method, url, *args, **kwargs)
+            error = response.status >= 400
+            return response
+        finally:
+            self.stats.record(self.username, method, url, time.monotonic() - start, error)
+
+
 class RedditLoginManager:
     """
     Manages login credentials and OAuth flow for Reddit, and provides instances of the PRAW Reddit
@@ -54,6 +136,10 @@ class RedditLoginManager:
     `get_reddit_scopes` at the MODULE level. This callable must return a list of scopes as strings,
     and must work upon being imported (i.e. without a call to `setup()` or an actual cog/bot
     initialisation).
+
+    Reddit instances are shared between all RedditLoginManager objects, so that all extensions
+    using the same account share one access token (refreshed only when it expires). All instances
+    share a single HTTP connection pool, and record their API requests in :attr:`~.stats`.
     """
     _global_config = get_kaztron_config()
     _global_state = get_runtime_config()
@@ -67,9 +153,30 @@ class RedditLoginManager:
         last_auth_state=None
     )
 
-    def __init__(self):
-        # lazy cache of reddit instance objects
-        self.reddit_cache = {u: None for u in self.users}  # type: Dict[str, praw.Reddit]
+    # lazy cache of reddit instance objects, shared by all instances
+    reddit_cache = {}  # type: Dict[str, apraw.Reddit]
+    _session = None  # type: aiohttp.ClientSession
+    #: API request statistics for all reddit instances
+    stats = RequestStats()
+
+    @classmethod
+    def _get_requestor_kwargs(cls, username: str) -> dict:
+        if cls._session is None or cls._session.closed:
+            cls._session = aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=None))
+        return {'session': cls._session, 'stats': cls.stats, 'username': username}
+
+    @classmethod
+    async def close(cls):
+        """
+        Close the shared HTTP connection pool, and discard all cached reddit instances (they use
+        the closed pool). Called on bot shutdown. Later calls to :meth:`~.get_reddit` open a new
+        pool.
+        """
+        cls.reddit_cache.clear()
+        if cls._session is not None and not cls._session.closed:
+            logger.debug("Closing reddit HTTP session")
+            await cls._session.close()
+        cls._session = None
 
     @property
     def users(self) -> Sequence[str]:
@@ -96,7 +203,9 @@ class RedditLoginManager:
                 client_id=self._config.client_id,
                 client_secret=self._config.client_secret,
                 refresh_token=self.refresh_tokens[username],
-                user_agent=self._config.user_agent
+                user_agent=self._config.user_agent,
+                requestor_class=InstrumentedRequestor,
+                requestor_kwargs=self._get_requestor_kwargs(username)
             )
         return self.reddit_cache[username]
 
@@ -105,9 +214,19 @@ class RedditLoginManager:
             client_id=self._config.client_id,
             client_secret=self._config.client_secret,
             redirect_uri=self._config.refresh_uri,
-            user_agent=self._config.user_agent
+            user_agent=self._config.user_agent,
+            requestor_class=InstrumentedRequestor,
+            requestor_kwargs=self._get_requestor_kwargs('(anonymous)')
         )
 
+    def get_rate_limits(self) -> Dict[str, dict]:
+        """
+        Get the API rate limit status of each reddit instance in use, as of its last request.
+
+        :return: Dict of username to limits, as :attr:`asyncpraw.Reddit.auth.limits`.
+        """
+        return {username: reddit.auth.limits for username, reddit in self.reddit_cache.items()}
+
     def get_extension_scopes(self) -> Set[str]:
         """
         Get reddit scopes required from extensions enabled in the configuration file.
@@ -157,7 +276,7 @@ class RedditLoginManager:
         with self._state as state:
             name = (await reddit.user.me()).name
             state.refresh_tokens[name] = refresh_token
-            self.reddit_cache[name] = reddit
+            self.reddit_cache.pop(name, None)  # next get_reddit() uses the new refresh token
         logger.info(f"Authorised user {name}")
         return reddit
 
@@ -167,8 +286,8 @@ class RedditLoginManager:
         information for that user.
         :raises KeyError: User not logged in.
         """
-        del self.reddit_cache[username]
         del self._state.refresh_tokens[username]
+        self.reddit_cache.pop(username, None)
         with self._state as state:
             state.refresh_tokens = self._state.refresh_tokens  # force marking as modified
         logger.info(f"Logged out user {username}")
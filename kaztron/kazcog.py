@@ -9,6 +9,7 @@ from discord.ext import commands
 from kaztron.utils.embeds import EmbedSplitter
 from kaztron.config import KaztronConfig, SectionView
 from kaztron.errors import BotNotReady, CogNotLoadedError
+from kaztron.sendqueue import Priority
 from kaztron.utils.discord import Limits
 from kaztron.utils.strings import natural_split, split_chunks_on
 
@@ -223,11 +224,15 @@ class KazCog:
 
     async def send_message(self, destination, contents=None, *, tts=False,
                            embed: Union[discord.Embed, EmbedSplitter]=None,
-                           auto_split=True, split='word') -> Sequence[discord.Message]:
+                           auto_split=True, split='word',
+                           priority=Priority.NORMAL, coalesce=False) -> Sequence[discord.Message]:
         """
         Send a message. This method wraps the :meth:`discord.Client.send_message` method and adds
         automatic message splitting if a message is too long for one line.
 
+        Messages are sent via the bot's :class:`~kaztron.sendqueue.SendQueue`, which paces sends to
+        Discord's rate limits and sends higher-priority messages first.
+
         No parsing of Markdown is done for message splitting; this behaviour may break intended
         formatting. For messages which may contain formatting, it is suggested you parse and split
         the message instead of relying on auto-splitting.
@@ -248,6 +253,11 @@ class KazCog:
         :param auto_split: Whether to auto-split messages that exceed the maximum message length.
         :param split: What to split on: 'word' or 'line'. 'Line' should only be used for messages
             known to contain many line breaks, as otherwise auto-splitting is likely to fail.
+        :param priority: Message priority in the send queue, e.g. ``Priority.HIGH`` for moderator
+            alerts or ``Priority.BULK`` for large listings and feeds.
+        :param coalesce: Whether short text messages can be merged with adjacent short messages
+            to the same destination (also sent with this flag) into one Discord message. Should
+            only be used for messages that won't later be edited or deleted.
         """
 
         # prepare text contents
@@ -271,21 +281,37 @@ class KazCog:
         # so the last text chunk will have the first embed chunk attached
         # this is because non-split messages usually have the embed appear after the msg -
         # should be fairly rare for both msg and embed to be split
-        msg_list = []
+        # enqueue everything at once, so all chunks are sent in sequence
+        futures = []
         for content_chunk in content_chunks[:-1]:
-            msg_list.append(await self.bot.send_message(destination, content_chunk, tts=tts))
+            futures.append(self.send_queue.enqueue(destination, content_chunk, tts=tts,
+                priority=priority, coalesce=coalesce))
 
-        msg_list.append(await self.bot.send_message(
-            destination, content_chunks[-1], tts=tts, embed=embed_list[0]
-        ))
+        futures.append(self.send_queue.enqueue(destination, content_chunks[-1], tts=tts,
+            embed=embed_list[0], priority=priority, coalesce=coalesce))
 
         for embed_chunk in embed_list[1:]:
-            msg_list.append(await self.bot.send_message(destination, tts=tts, embed=embed_chunk))
+            futures.append(self.send_queue.enqueue(destination, tts=tts, embed=embed_chunk,
+                priority=priority))
+
+        msg_list = []
+        try:
+            for future in futures:
+                msg_list.append(await future)
+        except BaseException:
+            # don't keep sending the rest of a message that's already incomplete
+            for future in futures:
+                if not future.done():
+                    future.cancel()
+                elif not future.cancelled():
+                    future.exception()  # retrieve it, so it isn't logged as never retrieved
+            raise
         return tuple(msg_list)
 
     async def send_output(self, contents, *,
                           tts=False, embed: Union[discord.Embed, EmbedSplitter]=None,
-                          auto_split=True, split='word') -> Sequence[discord.Message]:
+                          auto_split=True, split='word',
+                          priority=Priority.NORMAL, coalesce=False) -> Sequence[discord.Message]:
         """
         Send a message to the bot output channel.
 
@@ -293,11 +319,12 @@ class KazCog:
         :meth:`.send_message`.
         """
         return await self.send_message(self.channel_out, contents, tts=tts, embed=embed,
-            auto_split=auto_split, split=split)
+            auto_split=auto_split, split=split, priority=priority, coalesce=coalesce)
 
     async def send_public(self, contents, *,
                           tts=False, embed: Union[discord.Embed, EmbedSplitter]=None,
-                          auto_split=True, split='word') -> Sequence[discord.Message]:
+                          auto_split=True, split='word',
+                          priority=Priority.NORMAL, coalesce=False) -> Sequence[discord.Message]:
         """
         Send a message to the bot public output channel.
 
@@ -305,7 +332,7 @@ class KazCog:
         :meth:`.send_message`.
         """
         return await self.send_message(self.channel_public, contents, tts=tts, embed=embed,
-            auto_split=auto_split, split=split)
+            auto_split=auto_split, split=split, priority=priority, coalesce=coalesce)
 
     @property
     def core(self):
@@ -335,6 +362,16 @@ class KazCog:
     def scheduler(self):
         return self._bot.scheduler
 
+    @property
+    def send_queue(self):
+        from kaztron.sendqueue import SendQueue  # for type annotation/IDE inference
+        return self._bot.send_queue  # type: SendQueue
+
+    @property
+    def member_index(self):
+        from kaztron.memberindex import MemberIndex  # for type annotation/IDE inference
+        return self._bot.member_index  # type: MemberIndex
+
     @property
     def channel_out(self) -> discord.Channel:
         """
@@ -0,0 +1,225 @@
+import logging
+from typing import Dict, Set, Tuple, List, Optional, Iterable
+
+import discord
+
+logger = logging.getLogger(__name__)
+
+
+class MemberIndex:
+    """
+    Bot-wide index of server members, to look up members by name and search names and nicknames
+    without scanning the whole member list of every server.
+
+    The index is rebuilt on ready and kept up to date from member join, update and remove events
+    (and server join/remove events). It holds:
+
+    * an exact map of ``name#discriminator`` to members;
+    * an exact map of names and nicknames to members (like :meth:`discord.Server.get_member_named`);
+    * a trigram index of lowercased names and nicknames, for substring search.
+
+    Trigram posting lists are append-only: entries for removed or renamed members are left in
+    place and filtered out on search, and the lists are compacted once stale entries outnumber
+    live ones.
+
+    Normally accessed via ``bot.member_index`` or :attr:`KazCog.member_index`.
+
+    :param bot: The bot instance.
+    """
+    #: n-gram length for substring search. Search terms shorter than this fall back to a scan.
+    NGRAM = 3
+
+    def __init__(self, bot: discord.Client):
+        self.bot = bot
+        self._next_slot = 0
+        self._slots = {}  # type: Dict[Tuple[str, str], int]
+        self._members = {}  # type: Dict[int, discord.Member]
+        self._indexed = {}  # type: Dict[int, Tuple[str, Optional[str], str]]  # name, nick, discrim
+        self._by_tag = {}  # type: Dict[str, List[int]]
+        self._by_name = {}  # type: Dict[str, List[int]]
+        self._ngrams = {}  # type: Dict[str, List[int]]
+        self._ngram_count = 0
+        self._ngram_stale = 0
+
+        bot.add_listener(self.on_ready)
+        bot.add_listener(self.on_server_join)
+        bot.add_listener(self.on_server_remove)
+        bot.add_listener(self.on_member_join)
+        bot.add_listener(self.on_member_update)
+        bot.add_listener(self.on_member_remove)
+
+    def __len__(self):
+        return len(self._members)
+
+    @classmethod
+    def _ngrams_of(cls, s: str) -> Set[str]:
+        s = s.lower()
+        return {s[i:i+cls.NGRAM] for i in range(len(s) - cls.NGRAM + 1)}
+
+    # exact-match maps use lists: almost all keys map to a single member, and small lists are much
+    # lighter than sets
+    @staticmethod
+    def _index_add(index: Dict[str, List[int]], keys: Iterable[str], slot: int):
+        for key in keys:
+            try:
+                index[key].append(slot)
+            except KeyError:
+                index[key] = [slot]
+
+    @staticmethod
+    def _index_discard(index: Dict[str, List[int]], keys: Iterable[str], slot: int):
+        for key in keys:
+            try:
+                slots = index[key]
+                slots.remove(slot)
+            except (KeyError, ValueError):
+                continue
+            if not slots:
+                del index[key]
+
+    @classmethod
+    def _keys_of(cls, name: str, nick: Optional[str], discrim: str):
+        names = {name, nick} if nick else {name}
+        ngrams = cls._ngrams_of(name) | (cls._ngrams_of(nick) if nick else set())
+        return '{}#{}'.format(name, discrim), names, ngrams
+
+    def add(self, member: discord.Member):
+        """ Add a member to the index, or update it if already indexed. """
+        key = (member.server.id, member.id)
+        try:
+            slot = self._slots[key]
+        except KeyError:
+            slot = self._slots[key] = self._next_slot
+            self._next_slot += 1
+        else:
+            if self._indexed[slot] == (member.name, member.nick, member.discriminator):
+                self._members[slot] = member
+                return
+            self._unindex(slot)
+
+        self._members[slot] = member
+        self._indexed[slot] = (member.name, member.nick, member.discriminator)
+        tag, names, ngrams = self._keys_of(member.name, member.nick, member.discriminator)
+        self._index_add(self._by_tag, (tag,), slot)
+        self._index_add(self._by_name, names, slot)
+        self._add_ngrams(ngrams, slot)
+
+    def _add_ngrams(self, ngrams: Set[str], slot: int):
+        for ngram in ngrams:
+            try:
+                self._ngrams[ngram].append(slot)
+            except KeyError:
+                self._ngrams[ngram] = [slot]
+        self._ngram_count += len(ngrams)
+
+    def remove(self, member: discord.Member):
+        """ Remove a member from the index. No effect if the member is not indexed. """
+        try:
+            slot = self._slots.pop((member.server.id, member.id))
+        except KeyError:
+            return
+        self._unindex(slot)
+        del self._members[slot]
+
+    def _unindex(self, slot: int):
+        tag, names, ngrams = self._keys_of(*self._indexed.pop(slot))
+        self._index_discard(self._by_tag, (tag,), slot)
+        self._index_discard(self._by_name, names, slot)
+        self._ngram_stale += len(ngrams)
+        if self._ngram_stale > max(self._ngram_count - self._ngram_stale, 1000):
+            self._compact_ngrams()
+
+    def _compact_ngrams(self):
+        self._ngrams.clear()
+        self._ngram_count = self._ngram_stale = 0
+        for slot, indexed in self._indexed.items():
+            self._add_ngrams(self._keys_of(*indexed)[2], slot)
+
+    def add_server(self, server: discord.Server):
+        for member in server.members:
+            self.add(member)
+
+    def remove_server(self, server: discord.Server):
+        for member in [self._members[slot] for (server_id, _), slot in self._slots.items()
+                       if server_id == server.id]:
+            self.remove(member)
+
+    def rebuild(self):
+        """ Rebuild the index from all of the bot's servers. """
+        self._slots.clear()
+        self._members.clear()
+        self._indexed.clear()
+        self._by_tag.clear()
+        self._by_name.clear()
+        self._ngrams.clear()
+        self._ngram_count = self._ngram_stale = 0
+        for server in self.bot.servers:
+            self.add_server(server)
+        logger.info("Indexed {:d} members".format(len(self)))
+
+    def _filter(self, slots: Iterable[int], server: discord.Server=None) -> List[discord.Member]:
+        members = [self._members[slot] for slot in slots]
+        if server is not None:
+            members = [m for m in members if m.server.id == server.id]
+        return members
+
+    def get_member_named(self, name: str, server: discord.Server=None) \
+            -> Optional[discord.Member]:
+        """
+        Find a member by ``name#discriminator``, or else by exact name or nickname. Same matching
+        rules as :meth:`discord.Server.get_member_named`.
+
+        :param server: Server to search in. If not specified, search all servers.
+        :return: A matching member, or None if not found.
+        """
+        if len(name) > 5 and name[-5] == '#':
+            members = self._filter(self._by_tag.get(name, ()), server)
+            if members:
+                return members[0]
+        members = self._filter(self._by_name.get(name, ()), server)
+        return members[0] if members else None
+
+    def search(self, search: str, server: discord.Server=None) -> List[discord.Member]:
+        """
+        Find members whose name or nickname contains a search string, case-insensitive.
+
+        :param server: Server to search in. If not specified, search all servers.
+        """
+        search = search.lower()
+        if len(search) < self.NGRAM:
+            candidates = self._indexed.keys()
+        else:
+            try:
+                # any match must be in every trigram's posting list: check the shortest one
+                candidates = set(min((self._ngrams[ngram] for ngram in self._ngrams_of(search)),
+                                     key=len))
+            except KeyError:
+                return []
+
+        matches = []
+        for slot in candidates:
+            try:
+                name, nick, _ = self._indexed[slot]
+            except KeyError:  # stale posting
+                continue
+            if search in name.lower() or (nick and search in nick.lower()):
+                matches.append(slot)
+        return self._filter(matches, server)
+
+    async def on_ready(self):
+        self.rebuild()
+
+    async def on_server_join(self, server: discord.Server):
+        self.add_server(server)
+
+    async def on_server_remove(self, server: discord.Server):
+        self.remove_server(server)
+
+    async def on_member_join(self, member: discord.Member):
+        self.add(member)
+
+    async def on_member_update(self, before: discord.Member, after: discord.Member):
+        self.add(after)
+
+    async def on_member_remove(self, member: discord.Member):
+        self.remove(member)
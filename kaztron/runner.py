@@ -11,7 +11,9 @@ from kaztron import KazCog
 from kaztron.config import get_kaztron_config, KaztronConfig, get_runtime_config
 from kaztron.discord_patches import apply_patches
 from kaztron.help_formatter import CoreHelpParser, DiscordHelpFormatter
+from kaztron.memberindex import MemberIndex
 from kaztron.scheduler import Scheduler
+from kaztron.sendqueue import SendQueue
 
 logger = logging.getLogger("kaztron.bootstrap")
 
@@ -49,6 +51,8 @@ def run(loop: asyncio.AbstractEventLoop):
 
     # KazTron-specific extension classes
     client.scheduler = Scheduler(client)
+    client.send_queue = SendQueue(client)
+    client.member_index = MemberIndex(client)
     client.kaz_help_parser = kaz_help_parser
 
     # Load core extension (core + rolemanager)
@@ -103,6 +107,9 @@ def run(loop: asyncio.AbstractEventLoop):
         except Exception:
             pass
         # END CONTRIB
+        reddit_driver = sys.modules.get('kaztron.driver.reddit')
+        if reddit_driver is not None:  # only loaded if a reddit extension is enabled
+            loop.run_until_complete(reddit_driver.RedditLoginManager.close())
         KazCog.state.write()
 
 
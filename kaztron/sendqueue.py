@@ -0,0 +1,308 @@
+import asyncio
+import enum
+import heapq
+import itertools
+import logging
+from collections import deque
+from typing import Callable, Awaitable, Dict, List, Optional
+
+import discord
+
+from kaztron.driver.stats import MeanVarianceAccumulator
+from kaztron.utils.discord import Limits
+
+logger = logging.getLogger(__name__)
+
+
+SendFunction = Callable[..., Awaitable[discord.Message]]  #: like discord.Client.send_message
+
+
+class Priority(enum.IntEnum):
+    """ Message priority. Lower values are sent first. """
+    HIGH = 0  #: e.g. moderator alerts
+    NORMAL = 1
+    BULK = 2  #: e.g. bulk posts, listings, feeds
+
+
+class RateLimitBucket:
+    """
+    Sliding-window rate limit tracker: allows ``limit`` sends in any period of ``per`` seconds.
+
+    Discord's message-send bucket is per channel (5 messages per 5 seconds at time of writing).
+    Pacing sends to this limit avoids hitting 429 responses in the first place.
+
+    :param limit: Number of sends allowed per window.
+    :param per: Window length, in seconds.
+    """
+    def __init__(self, limit=5, per=5.0):
+        self.limit = limit
+        self.per = per
+        self._times = deque(maxlen=limit)
+        self.blocked_until = 0.0
+
+    def delay(self, now: float) -> float:
+        """ Time to wait (in seconds) from ``now`` before the next send is allowed. """
+        delay = self.blocked_until - now
+        if len(self._times) == self.limit:
+            delay = max(delay, self._times[0] + self.per - now)
+        return max(delay, 0.0)
+
+    def record(self, now: float):
+        """ Record a send at time ``now``. """
+        self._times.append(now)
+
+    def block(self, now: float, retry_after: float):
+        """ Block all sends until ``retry_after`` seconds after ``now`` (e.g. after a 429). """
+        self.blocked_until = max(self.blocked_until, now + retry_after)
+
+
+class SendStats:
+    """
+    Send queue metrics.
+
+    :ivar enqueued: Number of messages enqueued.
+    :ivar sent: Number of messages sent (API calls made successfully).
+    :ivar coalesced: Number of messages that were merged into a previous message instead of
+        requiring their own API call.
+    :ivar rate_limited: Number of 429 (Too Many Requests) responses received.
+    :ivar failed: Number of messages that failed to send.
+    :ivar max_depth: Maximum observed queue depth.
+    :ivar wait_time: Accumulator for the time (in seconds) messages spent in queue before sending.
+    """
+    def __init__(self):
+        self.enqueued = 0
+        self.sent = 0
+        self.coalesced = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.max_depth = 0
+        self.wait_time = MeanVarianceAccumulator()
+
+    def __str__(self):
+        return ("enqueued={0.enqueued:d} sent={0.sent:d} coalesced={0.coalesced:d} "
+                "rate_limited={0.rate_limited:d} failed={0.failed:d} max_depth={0.max_depth:d} "
+                "wait={1:.2f}s (σ={2:.2f}s)")\
+            .format(self, self.wait_time.mean, self.wait_time.std_dev)
+
+
+class SendRequest:
+    """ A queued message. Not normally instantiated directly: see :meth:`SendQueue.enqueue`. """
+    __slots__ = ('destination', 'content', 'tts', 'embed', 'priority', 'coalesce',
+                 'future', 'enqueued_at', 'seq')
+
+    def __init__(self, destination, content: Optional[str], tts: bool,
+                 embed: Optional[discord.Embed], priority: Priority, coalesce: bool,
+                 future: asyncio.Future, enqueued_at: float, seq: int):
+        self.destination = destination
+        self.content = content
+        self.tts = tts
+        self.embed = embed
+        self.priority = priority
+        self.coalesce = coalesce
+        self.future = future
+        self.enqueued_at = enqueued_at
+        self.seq = seq
+
+    def __lt__(self, other: 'SendRequest'):
+        return (self.priority, self.seq) < (other.priority, other.seq)
+
+    def can_merge(self, other: 'SendRequest') -> bool:
+        """ Whether ``other`` can be appended to this message's content. """
+        return (self.coalesce and other.coalesce and
+                self.embed is None and other.embed is None and
+                self.priority == other.priority and self.tts == other.tts and
+                bool(self.content) and bool(other.content) and
+                len(self.content) + len(other.content) + 1 <= Limits.MESSAGE)
+
+
+class DestinationQueue:
+    """ Priority queue and rate limit bucket for a single destination. """
+    def __init__(self, key: str):
+        self.key = key
+        self.heap = []  # type: List[SendRequest]
+        self.bucket = RateLimitBucket()
+        self.stats = SendStats()
+        self.worker = None  # type: asyncio.Task
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class SendQueue:
+    """
+    Central outbound message queue. Messages are queued per destination (which corresponds to
+    Discord's message-send rate limit bucket), and each destination is processed by its own worker
+    task that paces sends to the rate limit, sends higher-priority messages first, and optionally
+    merges consecutive small text messages into one.
+
+    Messages to the same destination with the same priority are always sent in order.
+
+    Normally accessed via ``bot.send_queue`` or :attr:`KazCog.send_queue`, and used via
+    :meth:`KazCog.send_message`.
+
+    :param bot: The bot instance.
+    :param send_func: The coroutine used to send each message. Defaults to ``bot.send_message``.
+    :param max_retries: Maximum attempts to send a message after a 429 response.
+    :param backlog_warning: Log a warning if a destination's queue grows past this depth.
+    """
+    def __init__(self, bot: discord.Client, send_func: SendFunction=None,
+                 max_retries=5, backlog_warning=50):
+        self.bot = bot
+        self.loop = bot.loop  # type: asyncio.AbstractEventLoop
+        self.send_func = send_func or bot.send_message
+        self.max_retries = max_retries
+        self.backlog_warning = backlog_warning
+        self.global_bucket = RateLimitBucket(limit=50, per=1.0)
+        self.queues = {}  # type: Dict[str, DestinationQueue]
+        self.stats = SendStats()
+        self._seq = itertools.count()
+
+    @staticmethod
+    def _key(destination) -> str:
+        try:
+            return destination.id
+        except AttributeError:
+            return str(destination)
+
+    def depth(self, destination=None) -> int:
+        """ Number of queued messages for a destination, or for all destinations if None. """
+        if destination is None:
+            return sum(len(q) for q in self.queues.values())
+        try:
+            return len(self.queues[self._key(destination)])
+        except KeyError:
+            return 0
+
+    def destination_stats(self, destination) -> Optional[SendStats]:
+        """ Metrics for a specific destination, or None if nothing was ever sent there. """
+        try:
+            return self.queues[self._key(destination)].stats
+        except KeyError:
+            return None
+
+    def enqueue(self, destination, content: str=None, *, tts=False, embed: discord.Embed=None,
+                priority=Priority.NORMAL, coalesce=False) -> asyncio.Future:
+        """
+        Queue a message for sending.
+
+        :param destination: As :meth:`discord.Client.send_message`.
+        :param content: As :meth:`discord.Client.send_message`.
+        :param tts: As :meth:`discord.Client.send_message`.
+        :param embed: As :meth:`discord.Client.send_message`.
+        :param priority: Message priority.
+        :param coalesce: If True, this message may be merged (separated by a newline) with
+            adjacent queued messages that also have this flag set. In that case, all of the merged
+            requests resolve to the same :class:`discord.Message`.
+        :return: A future that resolves to the sent :class:`discord.Message`, or raises the
+            exception that occurred while sending.
+        """
+        key = self._key(destination)
+        try:
+            queue = self.queues[key]
+        except KeyError:
+            queue = self.queues[key] = DestinationQueue(key)
+
+        future = self.loop.create_future()
+        request = SendRequest(destination, content, tts, embed, priority, coalesce,
+                              future, self.loop.time(), next(self._seq))
+        heapq.heappush(queue.heap, request)
+
+        for stats in (queue.stats, self.stats):
+            stats.enqueued += 1
+            stats.max_depth = max(stats.max_depth, len(queue))
+        if len(queue) == self.backlog_warning:
+            logger.warning("Send queue for {} is backlogged: {:d} messages"
+                .format(key, len(queue)))
+
+        if queue.worker is None or queue.worker.done():
+            queue.worker = self.loop.create_task(self._run_worker(queue))
+        return future
+
+    async def send(self, destination, content: str=None, *, tts=False, embed: discord.Embed=None,
+                   priority=Priority.NORMAL, coalesce=False) -> discord.Message:
+        """ Queue a message and wait for it to be sent. Parameters as :meth:`~.enqueue`. """
+        return await self.enqueue(destination, content, tts=tts, embed=embed,
+                                  priority=priority, coalesce=coalesce)
+
+    def _pop_batch(self, queue: DestinationQueue) -> List[SendRequest]:
+        """ Pop the next request from the queue, along with any requests that can merge into it. """
+        batch = [heapq.heappop(queue.heap)]
+        while not batch[0].future.cancelled() and queue.heap:
+            head = batch[0]
+            if not head.can_merge(queue.heap[0]):
+                break
+            nxt = heapq.heappop(queue.heap)
+            if not nxt.future.cancelled():
+                head.content = head.content + '\n' + nxt.content
+                batch.append(nxt)
+        return batch
+
+    async def _run_worker(self, queue: DestinationQueue):
+        while queue.heap:
+            batch = self._pop_batch(queue)
+            if batch[0].future.cancelled():
+                continue
+            try:
+                message = await self._send(queue, batch[0])
+            except asyncio.CancelledError:
+                for request in batch:
+                    request.future.cancel()
+                raise
+            except Exception as e:
+                for stats in (queue.stats, self.stats):
+                    stats.failed += len(batch)
+                for request in batch:
+                    if not request.future.done():
+                        request.future.set_exception(e)
+            else:
+                now = self.loop.time()
+                for stats in (queue.stats, self.stats):
+                    stats.sent += 1
+                    stats.coalesced += len(batch) - 1
+                for request in batch:
+                    queue.stats.wait_time.update(now - request.enqueued_at)
+                    self.stats.wait_time.update(now - request.enqueued_at)
+                    if not request.future.done():
+                        request.future.set_result(message)
+
+    async def _send(self, queue: DestinationQueue, request: SendRequest) -> discord.Message:
+        attempt = 0
+        while True:
+            now = self.loop.time()
+            delay = max(queue.bucket.delay(now), self.global_bucket.delay(now))
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+
+            now = self.loop.time()
+            queue.bucket.record(now)
+            self.global_bucket.record(now)
+            try:
+                return await self.send_func(request.destination, request.content,
+                                            tts=request.tts, embed=request.embed)
+            except discord.HTTPException as e:
+                if getattr(e.response, 'status', None) != 429 or attempt >= self.max_retries:
+                    raise
+                attempt += 1
+                retry_after = self._get_retry_after(e, attempt)
+                for stats in (queue.stats, self.stats):
+                    stats.rate_limited += 1
+                logger.warning("Rate limited sending to {}: retrying in {:.2f}s (attempt {:d})"
+                    .format(queue.key, retry_after, attempt))
+                bucket = self.global_bucket if self._is_global(e) else queue.bucket
+                bucket.block(self.loop.time(), retry_after)
+
+    @staticmethod
+    def _get_retry_after(e: discord.HTTPException, attempt: int) -> float:
+        # Retry-After is in milliseconds in the API version used by discord.py 0.16
+        try:
+            return float(e.response.headers['Retry-After']) / 1000
+        except (AttributeError, KeyError, TypeError, ValueError):
+            return 2.0 ** (attempt - 1)
+
+    @staticmethod
+    def _is_global(e: discord.HTTPException) -> bool:
+        try:
+            return e.response.headers.get('X-RateLimit-Global', '').lower() == 'true'
+        except AttributeError:
+            return False
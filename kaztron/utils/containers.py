@@ -1,3 +1,4 @@
+import time
 from collections import OrderedDict
 
 
@@ -14,3 +15,73 @@ class FifoCache(OrderedDict):
         super().__setitem__(key, value)
         if len(self) > self.maxsize:
             self.popitem(last=False)
+
+
+class TtlLruCache:
+    """
+    Fixed-size cache with expiring entries. When full, evicts the least recently used item.
+
+    :param maxsize: Maximum number of items.
+    :param ttl: Time-to-live of each item, in seconds, from when it was stored.
+    :param timer: Function returning the current time in seconds. Default :func:`time.monotonic`.
+    """
+    def __init__(self, maxsize=128, ttl=300.0, timer=time.monotonic):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.timer = timer
+        self._data = OrderedDict()  # key -> (expiry time, value)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return self.get(key, _MISSING, count=False) is not _MISSING
+
+    def get(self, key, default=None, *, count=True):
+        """ Get an item, or ``default`` if the item is not cached or has expired. """
+        try:
+            expires, value = self._data[key]
+        except KeyError:
+            value = _MISSING
+        else:
+            if expires <= self.timer():
+                del self._data[key]
+                value = _MISSING
+            else:
+                self._data.move_to_end(key)
+
+        if count:
+            if value is _MISSING:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return default if value is _MISSING else value
+
+    def ttl_remaining(self, key) -> float:
+        """
+        Time in seconds until an item expires, or 0 if the item is not cached or has expired. Does
+        not count as a use of the item.
+        """
+        try:
+            expires, _ = self._data[key]
+        except KeyError:
+            return 0.0
+        return max(expires - self.timer(), 0.0)
+
+    def put(self, key, value):
+        self._data[key] = (self.timer() + self.ttl, value)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def invalidate(self, key):
+        """ Remove an item from the cache, if present. """
+        self._data.pop(key, None)
+
+    def clear(self):
+        self._data.clear()
+
+
+_MISSING = object()
@@ -223,6 +223,15 @@ def get_member(ctx: commands.Context, user: str) -> discord.Member:
     except discord.InvalidArgument:
         s_user_id = user
 
+        # name lookup: use the member index if available, current server first
+        member_index = getattr(ctx.bot, 'member_index', None)
+        if member_index is not None:
+            member = member_index.get_member_named(user, ctx.message.server) \
+                or member_index.get_member_named(user)
+            if member is None:
+                raise commands.BadArgument('Member "{}" not found'.format(user))
+            return member
+
     member_converter = commands.MemberConverter(ctx, s_user_id)
     return member_converter.convert()
 
@@ -1,4 +1,4 @@
-from typing import List
+from typing import List, Iterable, Union, Tuple, Mapping
 
 from discord.embeds import Embed, EmptyEmbed
 
@@ -18,6 +18,9 @@ class EmbedSplitter:
     :cls:`discord.Embed` instance :attr:`~.truncate`. You should not write properties to it
     (use this class's `set_*` methods or the constructor for that).
 
+    The sizes of the current embed and of cached fields are tracked incrementally, so adding a
+    field is a constant-time operation. To add many fields at once, see :meth:`~.add_fields`.
+
     :param auto_truncate: If True, automatically truncate title, description, etc. fields. If not,
         raise a ValueError if a value exceeds the limit.
     :raise ValueError: a text value is too long
@@ -37,6 +40,8 @@ class EmbedSplitter:
         self.repeat_footer = repeat_footer
         self.repeat_image = repeat_image
         self.cur_num_fields = 0
+        self._cur_size = 0  # total size of current embed (excluding cached fields)
+        self._cache_size = 0  # total size of cached fields
 
         if title is not EmptyEmbed and len(title) > Limits.EMBED_TITLE:
             if not self.auto_truncate:
@@ -102,6 +107,56 @@ class EmbedSplitter:
         A field value that exceeds the max length will split the field if auto_truncate is
         enabled, or raise a ValueError otherwise.
 
+        :raise ValueError: Field name or value too long (and auto_truncate disabled)
+        """
+        for field in self._prepare_field(name, value, inline):
+            self._field_cache.append(field)
+            self._cache_size += len(field['name']) + len(field['value'])
+
+        # if the current field cache does not fit, make new embed
+        # cache is not flushed into the embed, so this will keep currently cached fields together
+        if self._is_too_long(self._cache_size + self._footer_reserve()) or \
+                self._num_fields() > Limits.EMBED_FIELD_NUM:
+            self._start_new_embed()
+
+    def add_fields(self, fields: Iterable[Union[Tuple[str, str], Tuple[str, str, bool], Mapping]]):
+        """
+        Add many fields to the embed(s). Equivalent to calling :meth:`~.add_field` for each field
+        (i.e. the embeds may be split between any two fields), but faster for large numbers of
+        fields.
+
+        Fields are packed greedily: each embed is filled with as many fields as fit, before
+        starting a new embed. As with :meth:`~.add_field`, the parts of a split field are kept
+        together in the same embed.
+
+        :param fields: Iterable of fields. Each field can be a tuple ``(name, value)`` or
+            ``(name, value, inline)``, or a dict with keys ``name``, ``value`` and optionally
+            ``inline``. Inline defaults to True.
+        :raise ValueError: Field name or value too long (and auto_truncate disabled)
+        """
+        self._flush_field_cache()
+        cur_embed = self.cur_embed
+        reserve = self._footer_reserve()
+        for field in fields:
+            if isinstance(field, Mapping):
+                prepared = self._prepare_field(**field)
+            else:
+                prepared = self._prepare_field(*field)
+            size = sum(len(f['name']) + len(f['value']) for f in prepared)
+            if self._cur_size + size + reserve > Limits.EMBED_TOTAL or \
+                    self.cur_num_fields + len(prepared) > Limits.EMBED_FIELD_NUM:
+                self._start_new_embed()
+                cur_embed = self.cur_embed
+            for f in prepared:
+                cur_embed.add_field(**f)
+            self.cur_num_fields += len(prepared)
+            self._cur_size += size
+
+    def _prepare_field(self, name, value, inline=True) -> List[dict]:
+        """
+        Validate (and truncate, if enabled) a field. Returns the list of fields to add (more than
+        one if the value is split).
+
         :raise ValueError: Field name or value too long (and auto_truncate disabled)
         """
         if len(name) > Limits.EMBED_FIELD_NAME:
@@ -114,43 +169,44 @@ class EmbedSplitter:
         if len(value) > Limits.EMBED_FIELD_VALUE:
             if not self.auto_truncate:
                 raise ValueError("Field value too long")
-            self._add_split_field(name, value, inline)
+            return self._split_field(name, value, inline)
         elif not value.strip():
             raise ValueError("Empty value for field named {!r}".format(name))
         else:
-            self._field_cache.append({'name': name, 'value': value, 'inline': inline})
+            return [{'name': name, 'value': value, 'inline': inline}]
 
-        cur_len = sum(len(f['name']) + len(f['value']) for f in self._field_cache)
-        try:
-            if not self.repeat_footer:  # always reserve footer space, just 'cause it's simpler
-                cur_len += len(self.template.footer.text)
-        except TypeError:  # self.template.footer.text is EmptyEmbed
-            pass
-
-        # if the current field cache does not fit, make new embed
-        # cache is not flushed into the embed, so this will keep currently cached fields together
-        if self._is_too_long(cur_len) or self._num_fields() > Limits.EMBED_FIELD_NUM:
-            self._start_new_embed()
-
-    def _add_split_field(self, name, value, inline):
+    @staticmethod
+    def _split_field(name, value, inline) -> List[dict]:
         """ Split a field into multiple fields if the value is too long. """
+        fields = []
         value_rem = value
         while value_rem:
             # add current field
             new_val = natural_truncate(
                 value_rem, maxlen=Limits.EMBED_FIELD_VALUE, ellipsis_=''
             )
-            self._field_cache.append({'name': name, 'value': new_val, 'inline': inline})
+            fields.append({'name': name, 'value': new_val, 'inline': inline})
 
             # next iter
             value_rem = value_rem[len(new_val):]
             name = '…'
+        return fields
+
+    def _footer_reserve(self) -> int:
+        """ Space to reserve for the footer in each embed. """
+        try:
+            if not self.repeat_footer:  # always reserve footer space, just 'cause it's simpler
+                return len(self.template.footer.text)
+        except TypeError:  # self.template.footer.text is EmptyEmbed
+            pass
+        return 0
 
     def _start_initial_embed(self):
         self.cur_embed = self._make_embed_skeleton(
             header=True, desc=True, footer=self.repeat_footer, image=True
         )
         self.cur_num_fields = 0
+        self._cur_size = get_embed_size(self._cur_embed)
         self._embeds.append(self.cur_embed)
 
     def _start_new_embed(self):
@@ -159,17 +215,23 @@ class EmbedSplitter:
             footer=self.repeat_footer, image=self.repeat_image
         )
         self.cur_num_fields = 0
+        self._cur_size = get_embed_size(self._cur_embed)
         self._embeds.append(self.cur_embed)
 
     def _flush_field_cache(self):
+        cur_embed = self.cur_embed
         for field in self._field_cache:
-            self.cur_embed.add_field(**field)
+            cur_embed.add_field(**field)
         self.cur_num_fields += len(self._field_cache)
+        self._cur_size += self._cache_size
         self._field_cache.clear()
+        self._cache_size = 0
 
     def _is_too_long(self, new_length=0):
         """ Check if current embed would be too long with ``new_length`` characters added to it. """
-        return get_embed_size(self.cur_embed) + new_length > Limits.EMBED_TOTAL
+        if self._cur_embed is None:
+            self._start_initial_embed()
+        return self._cur_size + new_length > Limits.EMBED_TOTAL
 
     def _num_fields(self):
         """ Check number of fields of the current embed, including cached fields. """
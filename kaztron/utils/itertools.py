@@ -1,5 +1,5 @@
 from itertools import *
-from typing import Iterable, Any
+from typing import Iterable, Any, List
 
 
 def pairwise(s: Iterable[Any]):
@@ -19,3 +19,13 @@ def windowed(s: Iterable[Any], n=2):
         next(b, None)
     iterators.append(b)
     return zip(*iterators)
+
+
+def chunked(s: Iterable[Any], n: int) -> Iterable[List[Any]]:
+    """ s -> [s0, s1, ..., s(n-1)], [sn, s(n+1), ..., s(2n-1)], ... (last chunk may be shorter) """
+    it = iter(s)
+    while True:
+        chunk = list(islice(it, n))
+        if not chunk:
+            return
+        yield chunk
@@ -0,0 +1,143 @@
+import asyncio
+
+import pytest
+
+from kaztron.cog.reddit.subwatch import RedditStreamManager
+
+
+class MockSubreddit:
+    def __init__(self, name):
+        self.display_name = name
+
+
+class MockSubmission:
+    def __init__(self, id_, subreddit, created_utc):
+        self.id = id_
+        self.subreddit = MockSubreddit(subreddit)
+        self.created_utc = created_utc
+
+
+class FakeListingServer:
+    """
+    Local fake of the reddit new-submissions listing. Multireddit streams behave like PRAW's
+    ``stream.submissions(pause_after=0)``: the first poll returns the latest posts (up to the
+    listing limit), later polls only return posts not yet seen, and each poll ends with ``None``.
+    """
+    LIMIT = 100
+
+    def __init__(self, loop):
+        self.loop = loop
+        self.posts = []
+        self.requests = []
+        self.stalled = set()
+
+    def post(self, subreddit, created_utc):
+        self.posts.append(MockSubmission('p{:d}'.format(len(self.posts)), subreddit, created_utc))
+
+    async def subreddit(self, display_name):
+        return FakeMultireddit(self, display_name.lower().split('+'))
+
+
+class FakeMultireddit:
+    def __init__(self, server, subreddits):
+        self.server = server
+        self.subreddits = subreddits
+        self.stream = self
+
+    async def submissions(self, pause_after=None):
+        seen = set()
+        while True:
+            self.server.requests.append(tuple(self.subreddits))
+            if set(self.subreddits) & self.server.stalled:
+                await asyncio.sleep(3600)
+            new = [p for p in self.server.posts
+                   if p.subreddit.display_name.lower() in self.subreddits and p.id not in seen]
+            for post in new[-self.server.LIMIT:]:
+                seen.add(post.id)
+                yield post
+            yield None
+
+
+@pytest.fixture
+def loop():
+    return asyncio.get_event_loop()
+
+
+@pytest.fixture
+def server(loop):
+    return FakeListingServer(loop)
+
+
+def poll(loop, manager):
+    async def collect():
+        return [s async for s in manager.stream()]
+    return loop.run_until_complete(collect())
+
+
+# noinspection PyShadowingNames
+def test_merged_stream(loop, server):
+    names = ['sub{:d}'.format(i) for i in range(10)]
+    for t in range(30):
+        server.post(names[t % 10], 1000 + t)
+    manager = RedditStreamManager(server, names, last_checked=1009, max_shard_size=4)
+    assert [len(shard.subreddits) for shard in manager.shards] == [4, 4, 2]
+
+    results = poll(loop, manager)
+    assert [s.created_utc for s in results] == list(range(1010, 1030))
+    assert manager.last_checked == 1029
+    assert len(server.requests) == 3
+
+    server.post('sub3', 1030)
+    server.post('sub9', 1031)
+    assert [s.created_utc for s in poll(loop, manager)] == [1030, 1031]
+    assert poll(loop, manager) == []
+
+    # a refreshed shard reloads its backlog, but only returns posts after its own last post
+    manager.refresh()
+    server.post('sub0', 1032)
+    assert [s.created_utc for s in poll(loop, manager)] == [1032]
+
+
+# noinspection PyShadowingNames
+def test_adaptive_shards(loop, server, mocker):
+    names = ['busy', 'quiet1', 'quiet2', 'quiet3']
+    manager = RedditStreamManager(server, names, shard_volume=10)
+    assert len(manager.shards) == 1
+    poll(loop, manager)
+
+    t = 0
+    for _ in range(3):
+        for _ in range(12):
+            server.post('busy', t)
+            t += 1
+        server.post('quiet1', t)
+        t += 1
+        results = poll(loop, manager)
+        assert len(results) == 13
+    assert ('busy',) in [shard.subreddits for shard in manager.shards]
+
+    # a lone subreddit over shard_volume can't be split further, so it doesn't trigger a reshard
+    reshard = mocker.spy(manager, '_reshard')
+    for _ in range(3):
+        for _ in range(12):
+            server.post('busy', t)
+            t += 1
+        poll(loop, manager)
+    assert reshard.call_count == 0
+
+    for _ in range(20):
+        poll(loop, manager)
+    assert len(manager.shards) == 1
+
+
+# noinspection PyShadowingNames
+def test_stalled_shard(loop, server):
+    manager = RedditStreamManager(server, ['a', 'b'], max_shard_size=1, poll_timeout=0.1)
+    poll(loop, manager)
+    server.stalled.add('b')
+    server.post('a', 1)
+    server.post('b', 2)
+    assert [s.id for s in poll(loop, manager)] == ['p0']
+
+    server.stalled.clear()
+    assert [s.id for s in poll(loop, manager)] == ['p1']
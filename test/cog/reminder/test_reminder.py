@@ -0,0 +1,164 @@
+import asyncio
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+import pytest
+
+from kaztron.cog.reminder import controller as c
+from kaztron.cog.reminder.reminder import Reminders, ReminderData, RenewData
+from kaztron.scheduler import Scheduler
+
+
+@pytest.fixture
+def db(monkeypatch):
+    monkeypatch.setattr(c, 'db_file', ':memory:')
+    c.init_db()
+    yield
+    c.session.close()
+
+
+@pytest.fixture
+def loop():
+    return asyncio.get_event_loop()
+
+
+# noinspection PyShadowingNames
+@pytest.fixture
+def cog(mocker, loop, db):
+    bot = mocker.Mock()
+    bot.loop = loop
+    bot.scheduler = Scheduler(bot)
+    # don't need the config/state setup in KazCog.__init__
+    cog = Reminders.__new__(Reminders)
+    cog._bot = bot
+    cog.loaded = {}
+    cog.horizon = datetime.utcfromtimestamp(0)
+    yield cog
+    bot.scheduler.cancel_all()
+    loop.run_until_complete(asyncio.sleep(0))
+
+
+def make_reminder(remind_time, user_id='100', channel_id=None, renew_data=None):
+    return ReminderData(user_id=user_id, channel_id=channel_id, timestamp=datetime(2018, 1, 1),
+                        remind_time=remind_time, renew_data=renew_data, pin=False, msg='msg')
+
+
+def scheduled(cog):
+    return sorted(inst.args[0].reminder_id
+                  for inst in cog.scheduler.get_instances(cog.task_reminder_expired))
+
+
+# noinspection PyShadowingNames
+def test_controller_queries(db):
+    t = datetime(2018, 1, 1)
+    rows = c.add_reminders([
+        make_reminder(t + timedelta(hours=3)).to_row(),
+        make_reminder(t + timedelta(hours=1)).to_row(),
+        make_reminder(t + timedelta(hours=2), user_id='200').to_row(),
+        make_reminder(t + timedelta(hours=4), channel_id='300').to_row(),
+    ])
+    ids = [row.reminder_id for row in rows]
+
+    assert [r.reminder_id for r in c.query_due(t + timedelta(hours=2, minutes=30))] == \
+        [ids[1], ids[2]]
+    assert [r.reminder_id for r in c.query_reminders('100')] == [ids[1], ids[0]]
+    assert c.count_reminders('100') == 2
+    assert c.count_reminders() == 3  # personal reminders only
+    assert [r.reminder_id for r in c.query_reminders('100', '300')] == [ids[3]]
+    assert [r.reminder_id for r in c.query_saylaters()] == [ids[3]]
+    assert c.reminder_exists(make_reminder(t + timedelta(hours=3)).to_row())
+    assert not c.reminder_exists(make_reminder(t + timedelta(hours=5)).to_row())
+
+    assert c.update_reminder(ids[0], remind_time=t)
+    assert not c.update_reminder(-1, remind_time=t)
+    assert [r.reminder_id for r in c.query_reminders('100')] == [ids[0], ids[1]]
+
+    assert c.delete_reminders(saylaters=True) == [ids[3]]
+    assert sorted(c.delete_reminders('100')) == [ids[0], ids[1]]
+    c.delete_reminder(ids[2])
+    c.delete_reminder(ids[2])  # already deleted: no effect
+    assert c.query_due(t + timedelta(days=1)) == []
+
+
+# noinspection PyShadowingNames
+def test_load_reminders(cog):
+    now = datetime.utcnow()
+    rows = c.add_reminders([make_reminder(now + timedelta(minutes=10)).to_row(),
+                            make_reminder(now + timedelta(hours=2)).to_row()])
+
+    cog._load_reminders(now + timedelta(hours=1))
+    assert cog.horizon == now + timedelta(hours=1)
+    assert list(cog.loaded.keys()) == [rows[0].reminder_id]
+    assert scheduled(cog) == [rows[0].reminder_id]
+
+    cog._load_reminders(now + timedelta(hours=3))  # already loaded reminders aren't rescheduled
+    assert sorted(cog.loaded.keys()) == [rows[0].reminder_id, rows[1].reminder_id]
+    assert scheduled(cog) == [rows[0].reminder_id, rows[1].reminder_id]
+
+
+# noinspection PyShadowingNames
+def test_add_reminder_horizon(cog):
+    now = datetime.utcnow()
+    cog._load_reminders(now + timedelta(hours=1))
+
+    inside = make_reminder(now + timedelta(minutes=10))
+    cog.add_reminder(inside)
+    assert cog.loaded == {inside.reminder_id: inside}
+    assert scheduled(cog) == [inside.reminder_id]
+
+    outside = make_reminder(now + timedelta(hours=2))
+    cog.add_reminder(outside)
+    assert outside.reminder_id not in cog.loaded
+    assert scheduled(cog) == [inside.reminder_id]
+    assert c.count_reminders('100') == 2
+
+    cog._load_reminders(now + timedelta(hours=3))
+    assert scheduled(cog) == [inside.reminder_id, outside.reminder_id]
+
+    cog.remove_reminder(inside)
+    assert list(cog.loaded.keys()) == [outside.reminder_id]
+    assert c.count_reminders('100') == 1
+
+
+# noinspection PyShadowingNames
+def test_recurrence(cog, loop):
+    async def send_message(destination, contents):
+        return [contents]
+    cog.send_message = send_message
+
+    now = datetime.utcnow()
+    cog._load_reminders(now + timedelta(hours=1))
+    renew = RenewData(interval=timedelta(minutes=30), limit=5, limit_time=None)
+    r = make_reminder(now + timedelta(minutes=10), channel_id='300', renew_data=renew)
+    cog.add_reminder(r)
+
+    # next recurrence inside the horizon: rescheduled
+    loop.run_until_complete(cog.task_reminder_expired.run(cog, r))
+    assert r.remind_time == now + timedelta(minutes=40)
+    assert cog.loaded == {r.reminder_id: r}
+    row = c.query_saylaters()[0]
+    assert (row.remind_time, row.renew_limit) == (r.remind_time, 4)
+
+    # next recurrence past the horizon: stays in the database until loaded
+    loop.run_until_complete(cog.task_reminder_expired.run(cog, r))
+    assert r.remind_time == now + timedelta(minutes=70)
+    assert cog.loaded == {}
+    assert c.query_saylaters()[0].remind_time == r.remind_time
+
+    cog._load_reminders(now + timedelta(hours=2))
+    assert list(cog.loaded.keys()) == [r.reminder_id]
+
+
+# noinspection PyShadowingNames
+def test_migrate_state(cog, mocker):
+    t = datetime(2018, 1, 1)
+    reminders = [make_reminder(t), make_reminder(t, user_id='200')]
+    # simulate an interrupted migration: first reminder already in the database
+    c.add_reminders([reminders[0].to_row()])
+    cog.cog_state = SimpleNamespace(reminders=reminders)
+    cog.state = mocker.Mock()
+
+    cog._migrate_state()
+    assert [row.user_id for row in c.query_due(t + timedelta(days=1))] == ['100', '200']
+    assert cog.cog_state.reminders == []
+    cog.state.write.assert_called_once_with()
@@ -0,0 +1,113 @@
+from datetime import timedelta
+
+import pytest
+
+from kaztron import KazCog
+from kaztron.config import get_kaztron_config
+
+# the Spotlight cog reads its configuration when the class is defined
+if KazCog.config is None:
+    KazCog.static_init(get_kaztron_config(), None)
+
+from kaztron.cog.spotlight import Spotlight, SpotlightQueue  # noqa: E402
+
+
+def make_item(start, index=0, reminder_sent=False):
+    return {'index': index, 'start': start, 'end': start + 1, 'reminder_sent': reminder_sent}
+
+
+def check_consistent(queue: SpotlightQueue):
+    keys = [(item['start'], item['id']) for item in queue]
+    assert queue._keys == keys == sorted(keys)
+    assert queue._pending == [key for key, item in zip(keys, queue) if not item['reminder_sent']]
+
+
+def test_queue_order():
+    queue = SpotlightQueue()
+    for start, index in [(10, 0), (5, 1), (10, 2), (5, 3), (1, 4)]:
+        queue.add(make_item(start, index))
+    # ties on start date keep insertion order
+    assert [item['index'] for item in queue] == [4, 1, 3, 0, 2]
+    assert [item['id'] for item in queue] == [4, 1, 3, 0, 2]
+    assert queue.index(queue[2]) == 2
+    with pytest.raises(ValueError):
+        queue.index(dict(make_item(5, 3), id=3))  # equal key, but not the same item
+    check_consistent(queue)
+
+
+def test_queue_pending():
+    queue = SpotlightQueue(make_item(start, index, reminder_sent=(index == 0))
+                           for index, start in enumerate([10, 20, 30, 40]))
+    check_consistent(queue)
+    assert queue.next_reminder()['index'] == 1
+
+    queue.set_reminder_sent(queue[1])
+    queue.set_reminder_sent(queue[1])  # already sent: no change
+    check_consistent(queue)
+    assert queue.next_reminder()['index'] == 2
+
+    assert queue.reschedule(3, 15, 16) == 1
+    check_consistent(queue)
+    assert queue.next_reminder()['index'] == 3
+
+    assert queue.reschedule(0, 50, 51) == 3  # reminder already sent: stays out of pending
+    check_consistent(queue)
+    assert queue.next_reminder()['index'] == 3
+
+    assert queue.remove(0)['index'] == 3
+    check_consistent(queue)
+    assert queue.next_reminder()['index'] == 2
+
+    queue.set_reminder_sent(queue[1])
+    check_consistent(queue)
+    assert queue.next_reminder() is None
+
+
+def test_queue_popleft_readd():
+    queue = SpotlightQueue(make_item(start, index) for index, start in enumerate([10, 20, 30]))
+    item = queue.popleft()
+    check_consistent(queue)
+    assert item['index'] == 0
+    assert queue.next_reminder()['index'] == 1
+
+    assert queue.add(item) == 0
+    assert item['id'] == 0
+    check_consistent(queue)
+    assert queue.next_reminder() is item
+
+    queue.add(make_item(5, 3))
+    assert queue[0]['id'] == 3
+    for _ in range(4):
+        queue.popleft()
+    check_consistent(queue)
+    with pytest.raises(IndexError):
+        queue.popleft()
+
+
+def test_queue_upgrade_from_v20():
+    queue_data = [3, 1]
+    queue_data = Spotlight._upgrade_queue_v21(queue_data)
+    queue_data = Spotlight._upgrade_queue_v22(queue_data)
+    queue_data = Spotlight._upgrade_queue_v23(queue_data)
+
+    assert sorted(queue_data.keys()) == ['0', '1']
+    first, second = queue_data['0'], queue_data['1']
+    assert (first['index'], second['index']) == (3, 1)
+    assert second['start'] - first['start'] == timedelta(days=2).total_seconds()
+    assert first['end'] - first['start'] == timedelta(days=1).total_seconds()
+    assert not first['reminder_sent'] and not second['reminder_sent']
+
+
+def test_queue_upgrade_from_v22():
+    queue_data = [make_item(30, 0), make_item(10, 1, reminder_sent=True), make_item(20, 2)]
+    assert Spotlight._upgrade_queue_v21(queue_data) is queue_data
+    assert Spotlight._upgrade_queue_v22(queue_data) is queue_data
+    queue_data = Spotlight._upgrade_queue_v23(queue_data)
+    assert {k: v['index'] for k, v in queue_data.items()} == {'0': 1, '1': 2, '2': 0}
+
+    queue = SpotlightQueue(dict(item, id=int(item_id)) for item_id, item in queue_data.items())
+    check_consistent(queue)
+    assert [item['index'] for item in queue] == [1, 2, 0]
+    assert queue.next_reminder()['index'] == 2
+    assert queue.add(make_item(40, 3)) == 3
+    assert queue[3]['id'] == 3
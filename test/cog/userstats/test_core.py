@@ -0,0 +1,102 @@
+import json
+from datetime import datetime
+
+import pytest
+
+from kaztron.cog.userstats.core import StatsAccumulator, EventType
+
+
+@pytest.fixture(params=[True, False], ids=['indexed', 'unindexed'])
+def acc(request):
+    return StatsAccumulator(datetime(2018, 1, 1), b'salt', iterations=1, indexed=request.param)
+
+
+# noinspection PyShadowingNames
+def test_capture_and_get(acc):
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.msg, 'user2', 'chan1')
+    acc.capture_event(EventType.join, None, None)
+    acc.set_event(EventType.total_users, None, None, 42)
+    assert acc.get(EventType.msg, 'user1', 'chan1') == 2
+    assert acc.get(EventType.msg, 'user2', 'chan1') == 1
+    assert acc.get(EventType.msg, 'user2', 'chan2') == 0
+    assert acc.get(EventType.msg, 'user3', 'chan1') == 0
+    assert acc.get(EventType.join, None, None) == 1
+    assert acc.get(EventType.total_users, None, None) == 42
+    assert len(acc) == 4
+
+
+# noinspection PyShadowingNames
+def test_find(acc):
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.msg, 'user1', 'chan2')
+    acc.capture_event(EventType.msg, 'user2', 'chan1')
+    acc.capture_event(EventType.join, None, None)
+    user1_hash = acc._hash('user1')
+
+    results = acc.find(user='user1')
+    assert sorted(results) == [(EventType.msg, user1_hash, 'chan1', 1),
+                               (EventType.msg, user1_hash, 'chan2', 1)]
+    assert len(acc.find(channel='chan1')) == 2
+    assert acc.find(user='user1', channel='chan2') == [(EventType.msg, user1_hash, 'chan2', 1)]
+    assert acc.find(type_=EventType.join) == [(EventType.join, None, None, 1)]
+    assert acc.find(user='user3') == []
+    assert acc.find(channel='chan3') == []
+    assert len(acc.find()) == 4
+
+
+# noinspection PyShadowingNames
+def test_dict_round_trip(acc):
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.msg, 'user2', 'chan2')
+    acc.capture_event(EventType.part, None, None)
+    acc.capture_timed_event_start(datetime(2018, 1, 1, 0, 5), EventType.voice, 'user1', 'chan3')
+
+    acc2 = StatsAccumulator.from_dict(json.loads(json.dumps(acc.to_dict())))
+    assert sorted(acc2.items(), key=str) == sorted(acc.items(), key=str)
+    assert acc2.start_times == acc.start_times
+    assert acc2.get(EventType.msg, 'user1', 'chan1') == 1
+
+    acc2.capture_timed_event_end(datetime(2018, 1, 1, 0, 6), EventType.voice, 'user1', 'chan3')
+    assert acc2.get(EventType.voice, 'user1', 'chan3') == 60
+
+
+# noinspection PyShadowingNames
+def test_from_legacy_dict(acc):
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.join, None, None)
+    legacy = acc.to_dict()
+    legacy['data'] = [(k.name, u, c, v) for k, u, c, v in acc.items()]
+    del legacy['counts'], legacy['users'], legacy['channels']
+
+    acc2 = StatsAccumulator.from_dict(legacy)
+    assert sorted(acc2.items(), key=str) == sorted(acc.items(), key=str)
+    assert acc2.find(user='user1') == acc.find(user='user1')
+
+
+# noinspection PyShadowingNames
+def test_delta(acc):
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    snapshot = json.loads(json.dumps(acc.to_dict()))
+    acc.clear_delta()
+    assert acc.pop_delta() is None
+
+    acc.capture_event(EventType.msg, 'user1', 'chan1')
+    acc.capture_event(EventType.msg, 'user2', 'chan2')
+    delta1 = json.loads(json.dumps(acc.pop_delta()))
+    assert len(delta1['counts']) == 2
+    acc.set_event(EventType.total_users, None, None, 10)
+    delta2 = json.loads(json.dumps(acc.pop_delta()))
+    assert len(delta2['counts']) == 1
+    acc.set_event(EventType.total_users, None, None, 10)
+    assert acc.pop_delta() is None
+
+    restored = StatsAccumulator.from_dict(snapshot)
+    for delta in (delta1, delta2, delta1):  # re-applying a delta is harmless
+        restored.apply_delta(delta)
+    assert sorted(restored.items(), key=str) == sorted(acc.items(), key=str)
+
+    other = StatsAccumulator(datetime(2018, 1, 1, 1), b'salt', iterations=1)
+    with pytest.raises(ValueError):
+        other.apply_delta(delta1)
@@ -0,0 +1,28 @@
+import pytest
+
+from kaztron.driver.pagination import Pagination, QueryPagination
+
+
+@pytest.mark.parametrize('count', [0, 1, 9, 10, 11, 95])
+@pytest.mark.parametrize('align_end', [False, True])
+def test_query_pagination_matches_list(count, align_end):
+    data = list(range(count))
+    fetches = []
+
+    def fetch(start, end):
+        fetches.append((start, end))
+        return data[start:end]
+
+    expected = Pagination(data, 10, align_end)
+    lazy = QueryPagination(count, fetch, 10, align_end)
+    assert not fetches
+    assert len(lazy) == len(expected)
+    assert lazy.total_pages == expected.total_pages
+    assert lazy.page == expected.page
+
+    for page in range(expected.total_pages):
+        expected.page = page
+        lazy.page = page
+        assert list(lazy) == list(expected)
+        assert lazy.get_page_records() == expected.get_page_records()
+    assert len(fetches) == expected.total_pages  # one fetch per page, cached until page changes
@@ -0,0 +1,30 @@
+from kaztron.driver.reddit import RequestStats
+
+
+def test_endpoint():
+    assert RequestStats.endpoint('get', 'https://oauth.reddit.com/r/a+b/new?limit=100') == \
+        'GET /r/{subreddit}/new'
+    assert RequestStats.endpoint('GET', 'https://oauth.reddit.com/api/info/') == 'GET /api/info'
+    assert RequestStats.endpoint('get', 'https://oauth.reddit.com/r/wb/wiki/rules/old') == \
+        'GET /r/{subreddit}/wiki/{page}'
+    assert RequestStats.endpoint('get', 'https://oauth.reddit.com/comments/abc123/') == \
+        'GET /comments/{id}'
+    assert RequestStats.endpoint('get', 'https://oauth.reddit.com/user/someone/about') == \
+        'GET /user/{user}/about'
+
+
+def test_summary():
+    stats = RequestStats()
+    stats.record('user1', 'get', 'https://oauth.reddit.com/r/a/new', 0.1)
+    stats.record('user1', 'get', 'https://oauth.reddit.com/r/b/new', 0.3, error=True)
+    stats.record('user1', 'get', 'https://oauth.reddit.com/api/info', 0.2)
+    stats.record('user2', 'get', 'https://oauth.reddit.com/api/info', 0.2)
+    assert stats.total == 4
+    summary = stats.summary()
+    assert summary[0][:3] == ('user1', 'GET /r/{subreddit}/new', 2)
+    assert summary[0][3] == 0.2
+    assert summary[0][4] == 1
+    assert sorted(summary[1:]) == [('user1', 'GET /api/info', 1, 0.2, 0),
+                                   ('user2', 'GET /api/info', 1, 0.2, 0)]
+    stats.reset()
+    assert stats.total == 0
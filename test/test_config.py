@@ -186,6 +186,24 @@ class TestConfig:
         config.config.set('animals', 'flamingo', 'pink')
         assert config.config.get('animals', 'flamingo') == 'pink'
 
+    @write_test
+    def test_set_item(self, config: ConfigFixture):
+        config.config.set('animals', 'birds', {'flamingo': 'pink'})
+        config.config.is_dirty = False
+        config.config.set_item('animals', 'birds', ('crow',), 'black')
+        config.config.set_item('animals', 'fish', ('salmon', 'colour'), 'pink')
+        assert config.config.get('animals', 'birds') == {'flamingo': 'pink', 'crow': 'black'}
+        assert config.config.get('animals', 'fish') == {'salmon': {'colour': 'pink'}}
+        assert config.config.is_dirty
+
+    @write_test
+    def test_delete_item(self, config: ConfigFixture):
+        config.config.set('animals', 'birds', {'flamingo': 'pink', 'crow': 'black'})
+        config.config.delete_item('animals', 'birds', ('crow',))
+        config.config.delete_item('animals', 'birds', ('pelican',))
+        config.config.delete_item('animals', 'fish', ('salmon', 'colour'))
+        assert config.config.get('animals', 'birds') == {'flamingo': 'pink'}
+
     def test_set_defaults_existing_section(self, config: ConfigFixture):
         with pytest.raises(KeyError):
             assert config.config.get('core', 'jklx')
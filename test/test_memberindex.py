@@ -0,0 +1,95 @@
+import random
+import string
+from types import SimpleNamespace
+
+import pytest
+
+from kaztron.memberindex import MemberIndex
+
+
+def make_member(server, id_, name, nick=None, discriminator='0001'):
+    return SimpleNamespace(server=server, id=id_, name=name, nick=nick,
+                           discriminator=discriminator)
+
+
+@pytest.fixture
+def servers():
+    s1 = SimpleNamespace(id='s1', members=[])
+    s2 = SimpleNamespace(id='s2', members=[])
+    s1.members.extend([
+        make_member(s1, '1', 'JaneDoe', 'Jane', '0921'),
+        make_member(s1, '2', 'JohnDoe', None, '1234'),
+        make_member(s1, '3', 'Worldbuilder', 'Kaz', '0001'),
+    ])
+    s2.members.extend([
+        make_member(s2, '1', 'JaneDoe', 'Mapmaker', '0921'),
+    ])
+    return s1, s2
+
+
+@pytest.fixture
+def index(mocker, servers):
+    bot = mocker.Mock()
+    bot.servers = list(servers)
+    index = MemberIndex(bot)
+    index.rebuild()
+    return index
+
+
+def test_get_member_named(index, servers):
+    s1, s2 = servers
+    assert index.get_member_named('JohnDoe#1234') is s1.members[1]
+    assert index.get_member_named('JohnDoe#9999') is None
+    assert index.get_member_named('Kaz') is s1.members[2]
+    assert index.get_member_named('Mapmaker') is s2.members[0]
+    assert index.get_member_named('Mapmaker', s1) is None
+    assert index.get_member_named('JaneDoe#0921', s2) is s2.members[0]
+
+
+def test_search(index, servers):
+    s1, s2 = servers
+    assert set(m.id for m in index.search('doe', s1)) == {'1', '2'}
+    assert index.search('MAPM') == [s2.members[0]]
+    assert index.search('kaz', s1) == [s1.members[2]]
+    assert index.search('zzz') == []
+    assert len(index.search('o')) == 4  # short search: falls back to scan
+
+
+def test_update_remove(index, servers):
+    s1, s2 = servers
+    before = s1.members[1]
+    after = make_member(s1, '2', 'JohnDoe', 'Cartographer', '1234')
+    index.add(after)
+    assert index.search('carto') == [after]
+    assert index.get_member_named('Cartographer') is after
+    assert index.get_member_named('JohnDoe#1234') is after
+    assert before not in index.search('doe')
+
+    index.remove(after)
+    assert index.search('carto') == []
+    assert index.get_member_named('JohnDoe#1234') is None
+    assert len(index) == 3
+
+    index.remove_server(s2)
+    assert index.search('mapmaker') == []
+    assert len(index) == 2
+
+
+def test_search_matches_scan(mocker):
+    rand = random.Random(0)
+    server = SimpleNamespace(id='s', members=[])
+    for i in range(2000):
+        name = ''.join(rand.choice(string.ascii_letters) for _ in range(rand.randint(2, 12)))
+        nick = ''.join(rand.choice(string.ascii_lowercase) for _ in range(8)) \
+            if rand.random() < 0.3 else None
+        server.members.append(make_member(server, str(i), name, nick))
+    bot = mocker.Mock()
+    bot.servers = [server]
+    index = MemberIndex(bot)
+    index.rebuild()
+
+    for search in ('ab', 'abc', 'Xyz', 'qwer', 'a'):
+        s = search.lower()
+        expected = {m.id for m in server.members
+                    if (m.nick and s in m.nick.lower()) or s in m.name.lower()}
+        assert {m.id for m in index.search(search)} == expected
@@ -0,0 +1,104 @@
+import asyncio
+
+import discord
+import pytest
+
+from kaztron.sendqueue import SendQueue, Priority, RateLimitBucket
+
+
+class MockResponse:
+    def __init__(self, status, retry_after_ms=None):
+        self.status = status
+        self.reason = 'Too Many Requests' if status == 429 else 'Error'
+        self.headers = {'Retry-After': str(retry_after_ms)} if retry_after_ms is not None else {}
+
+
+class MockSender:
+    """ Records sends, and responds to the first ``n_429`` sends with a 429 error. """
+    def __init__(self, loop, n_429=0):
+        self.loop = loop
+        self.n_429 = n_429
+        self.sent = []
+
+    async def __call__(self, destination, content=None, *, tts=False, embed=None):
+        if self.n_429 > 0:
+            self.n_429 -= 1
+            raise discord.HTTPException(MockResponse(429, 50), 'rate limited')
+        self.sent.append((destination.id, content, embed, self.loop.time()))
+        return (destination.id, content, embed)
+
+
+@pytest.fixture
+def loop():
+    return asyncio.get_event_loop()
+
+
+def make_queue(mocker, loop, sender: MockSender, **kwargs):
+    bot = mocker.Mock()
+    bot.loop = loop
+    return SendQueue(bot, send_func=sender, **kwargs)
+
+
+# noinspection PyShadowingNames
+def test_order_and_priority(mocker, loop):
+    sender = MockSender(loop)
+    queue = make_queue(mocker, loop, sender)
+    dest = discord.Object(id='1')
+    futures = [queue.enqueue(dest, 'bulk1', priority=Priority.BULK),
+               queue.enqueue(dest, 'normal1'),
+               queue.enqueue(dest, 'alert', priority=Priority.HIGH),
+               queue.enqueue(dest, 'normal2')]
+    loop.run_until_complete(asyncio.gather(*futures))
+    assert [s[1] for s in sender.sent] == ['alert', 'normal1', 'normal2', 'bulk1']
+    assert futures[1].result() == ('1', 'normal1', None)
+    assert queue.stats.sent == 4
+    assert queue.depth() == 0
+
+
+# noinspection PyShadowingNames
+def test_coalesce(mocker, loop):
+    sender = MockSender(loop)
+    queue = make_queue(mocker, loop, sender)
+    dest = discord.Object(id='1')
+    futures = [queue.enqueue(dest, 'a', coalesce=True),
+               queue.enqueue(dest, 'b', coalesce=True),
+               queue.enqueue(dest, 'c'),
+               queue.enqueue(dest, 'd', coalesce=True),
+               queue.enqueue(dest, 'x' * 1999, coalesce=True)]
+    loop.run_until_complete(asyncio.gather(*futures))
+    assert [s[1] for s in sender.sent] == ['a\nb', 'c', 'd', 'x' * 1999]
+    assert futures[0].result() is futures[1].result()
+    assert queue.stats.coalesced == 1
+
+
+# noinspection PyShadowingNames
+def test_rate_limit_pacing(mocker, loop):
+    sender = MockSender(loop)
+    queue = make_queue(mocker, loop, sender)
+    dest = discord.Object(id='1')
+    futures = [queue.enqueue(dest, str(i)) for i in range(3)]
+    queue.queues['1'].bucket = RateLimitBucket(limit=2, per=0.3)
+    start = loop.time()
+    loop.run_until_complete(asyncio.gather(*futures))
+    assert sender.sent[2][3] - start >= 0.29
+
+
+# noinspection PyShadowingNames
+def test_429_retry(mocker, loop):
+    sender = MockSender(loop, n_429=2)
+    queue = make_queue(mocker, loop, sender)
+    dest = discord.Object(id='1')
+    loop.run_until_complete(queue.send(dest, 'hello'))
+    assert [s[1] for s in sender.sent] == ['hello']
+    assert queue.stats.rate_limited == 2
+    assert queue.destination_stats(dest).rate_limited == 2
+
+
+# noinspection PyShadowingNames
+def test_429_give_up(mocker, loop):
+    sender = MockSender(loop, n_429=3)
+    queue = make_queue(mocker, loop, sender, max_retries=2)
+    dest = discord.Object(id='1')
+    with pytest.raises(discord.HTTPException):
+        loop.run_until_complete(queue.send(dest, 'hello'))
+    assert queue.stats.failed == 1
@@ -0,0 +1,54 @@
+from kaztron.utils.containers import TtlLruCache
+
+
+class FakeTimer:
+    def __init__(self):
+        self.t = 0.0
+
+    def __call__(self):
+        return self.t
+
+
+def test_ttl_lru_cache_expiry():
+    timer = FakeTimer()
+    cache = TtlLruCache(maxsize=10, ttl=5.0, timer=timer)
+    cache.put('a', 1)
+    assert cache.get('a') == 1
+    timer.t = 4.9
+    assert 'a' in cache
+    timer.t = 5.0
+    assert cache.get('a') is None
+    assert cache.get('a', 'default') == 'default'
+    assert len(cache) == 0
+    assert (cache.hits, cache.misses) == (1, 2)
+
+
+def test_ttl_lru_cache_ttl_remaining():
+    timer = FakeTimer()
+    cache = TtlLruCache(maxsize=2, ttl=5.0, timer=timer)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    timer.t = 2.0
+    assert cache.ttl_remaining('a') == 3.0
+    assert cache.ttl_remaining('missing') == 0.0
+    cache.put('c', 3)  # 'a' is still least recently used
+    assert 'a' not in cache
+    timer.t = 10.0
+    assert cache.ttl_remaining('c') == 0.0
+
+
+def test_ttl_lru_cache_eviction():
+    cache = TtlLruCache(maxsize=2, ttl=60.0, timer=FakeTimer())
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')  # 'b' is now least recently used
+    cache.put('c', 3)
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+
+    cache.invalidate('a')
+    cache.invalidate('nonexistent')
+    assert 'a' not in cache
+    cache.clear()
+    assert len(cache) == 0
@@ -0,0 +1,69 @@
+import pytest
+
+from kaztron.utils.discord import Limits
+from kaztron.utils.embeds import EmbedSplitter, get_embed_size
+
+
+def make_fields(n):
+    return [('Field {:d}'.format(i), 'value ' * (i % 40 + 1)) for i in range(n)]
+
+
+def check_limits(embeds):
+    for e in embeds:
+        assert get_embed_size(e) <= Limits.EMBED_TOTAL
+        assert len(e.fields) <= Limits.EMBED_FIELD_NUM
+
+
+def test_add_field_splits():
+    es = EmbedSplitter(title='Title', description='Description')
+    es.set_footer(text='Footer')
+    for name, value in make_fields(100):
+        es.add_field(name=name, value=value)
+    embeds = es.finalize()
+    check_limits(embeds)
+    assert sum(len(e.fields) for e in embeds) == 100
+    assert embeds[0].description == 'Description'
+    assert embeds[-1].footer.text == 'Footer'
+
+
+def test_add_field_no_break_keeps_fields_together():
+    es = EmbedSplitter(title='Title')
+    for i in range(30):
+        es.add_field_no_break(name='Name {:d}'.format(i), value='a' * 1000)
+        es.add_field(name='Value {:d}'.format(i), value='b' * 1000)
+    embeds = es.finalize()
+    check_limits(embeds)
+    for e in embeds:
+        assert e.fields[0].name.startswith('Name')
+        assert e.fields[-1].name.startswith('Value')
+
+
+@pytest.mark.parametrize('fields', [
+    make_fields(500) + [('Long', 'x ' * 1500)],
+    # split field straddles an embed boundary: its parts must stay together in the next embed
+    [('n{:d}'.format(i), 'v' * 1000) for i in range(4)] + [('Long', 'x ' * 1500)],
+], ids=['many', 'straddle'])
+def test_add_fields_matches_add_field(fields):
+    es1 = EmbedSplitter(title='Title', description='Description', auto_truncate=True)
+    es1.set_footer(text='Footer')
+    for name, value in fields:
+        es1.add_field(name=name, value=value)
+    es2 = EmbedSplitter(title='Title', description='Description', auto_truncate=True)
+    es2.set_footer(text='Footer')
+    es2.add_fields(fields)
+    assert [e.to_dict() for e in es1.finalize()] == [e.to_dict() for e in es2.finalize()]
+
+
+def test_add_fields_formats():
+    es = EmbedSplitter(title='Title')
+    es.add_fields([('a', 'b'), ('c', 'd', False), {'name': 'e', 'value': 'f'}])
+    fields = es.finalize()[0].fields
+    assert [(f.name, f.value, f.inline) for f in fields] == \
+        [('a', 'b', True), ('c', 'd', False), ('e', 'f', True)]
+
+
+def test_field_too_long():
+    es = EmbedSplitter(title='Title')
+    with pytest.raises(ValueError):
+        es.add_fields([('a', 'b' * (Limits.EMBED_FIELD_VALUE + 1))])
+
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Benchmark the BLOTS check-in reports against an in-memory database: by default, 50k server
+members, 5k of whom check in most weeks over a year.
+
+Usage: ./benchmark_checkins.py [members] [users] [weeks]
+
+Must be run from a configured KazTron install (the BLOTS cog reads the bot config on import).
+"""
+from pathutils import *
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+
+START = datetime(2018, 1, 7, 12, 0)
+
+
+class MockMember:
+    def __init__(self, id_):
+        self.id = id_
+
+
+class MockServer:
+    def __init__(self, n_members):
+        self.members = [MockMember(str(10**17 + i)) for i in range(n_members)]
+        self._member_map = {m.id: m for m in self.members}
+
+    def get_member(self, id_):
+        return self._member_map.get(id_)
+
+
+def populate(session, server, n_users, weeks, seed=0):
+    """ Weekly check-ins for the first ``n_users`` members, each skipping some weeks. """
+    from kaztron.cog.blots.model import User, CheckIn, ProjectType
+    rand = random.Random(seed)
+    session.bulk_insert_mappings(User, [
+        {'user_id': i + 1, 'discord_id': m.id, 'project_type': ProjectType.words,
+         'is_exempt': False}
+        for i, m in enumerate(server.members[:n_users])
+    ])
+    check_ins = []
+    for user_id in range(1, n_users + 1):
+        word_count = 0
+        for week in range(weeks):
+            if rand.random() < 0.7:
+                word_count += rand.randint(0, 5000)
+                check_ins.append({
+                    'timestamp': START + timedelta(weeks=week, minutes=rand.randint(0, 2880)),
+                    'user_id': user_id, 'word_count': word_count,
+                    'project_type': ProjectType.words, 'message': ''
+                })
+    session.bulk_insert_mappings(CheckIn, check_ins)
+    session.commit()
+    return len(check_ins)
+
+
+def check_latest(c, session, server, members, before):
+    """ Check query_latest_check_ins against a brute-force scan. """
+    from kaztron.cog.blots.model import CheckIn
+    member_ids = {m.id for m in members}
+    expected = {}
+    for check_in in session.query(CheckIn).filter(CheckIn.timestamp < before):
+        current = expected.get(check_in.user.discord_id)
+        if check_in.user.discord_id in member_ids and \
+                (current is None or check_in.timestamp >= current.timestamp):
+            expected[check_in.user.discord_id] = check_in
+    expected = {server.get_member(id_): ci for id_, ci in expected.items()}
+    return c.query_latest_check_ins(members=members, before=before) == expected
+
+
+def main(n_members=50000, n_users=5000, weeks=52):
+    add_application_path()
+
+    from kaztron import KazCog
+    from kaztron.config import get_kaztron_config, get_runtime_config
+    KazCog.static_init(get_kaztron_config(), get_runtime_config())
+
+    from kaztron.cog.blots import controller
+    from kaztron.cog.blots.model import Base
+    from kaztron.driver import database as db
+
+    engine = db.create_engine('sqlite://')
+    Base.metadata.create_all(engine)
+    controller.session = session = db.sessionmaker(bind=engine)()
+
+    server = MockServer(n_members)
+    print("Populating {:d} members, {:d} users, {:d} weeks...".format(n_members, n_users, weeks))
+    n_check_ins = populate(session, server, n_users, weeks)
+    print("{:d} check-ins".format(n_check_ins))
+
+    config = SimpleNamespace(check_in_period_weekdays=[4, 6], check_in_period_time='12:00')
+    c = controller.CheckInController(server, config, {})
+    report_date = START + timedelta(weeks=weeks * 3 // 4)
+
+    before = START + timedelta(weeks=weeks // 2)
+    for members in (server.members[:10], server.members):
+        ok = check_latest(c, session, server, members, before)
+        print("query_latest_check_ins ({:d} members): {}".format(len(members),
+                                                                 'OK' if ok else 'MISMATCH'))
+
+    # the first report for a closed week materialises it; later reports read it back
+    for label in ('live', 'materialised'):
+        start = time.perf_counter()
+        ci_map, nci_map = c.generate_check_in_report(report_date)
+        print("generate_check_in_report ({}): {:.3f}s ({:d} checked in, {:d} not)"
+              .format(label, time.perf_counter() - start, len(ci_map), len(nci_map)))
+        session.expunge_all()
+
+    start = time.perf_counter()
+    diffs_map, _ = c.generate_check_in_deltas(report_date)
+    print("generate_check_in_deltas (materialised): {:.3f}s ({:d} members)"
+          .format(time.perf_counter() - start, len(diffs_map)))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -0,0 +1,38 @@
+#!/usr/bin/env python3
+"""
+Benchmark EmbedSplitter: by default, adding 5000 fields with repeated add_field() calls and with
+a single add_fields() call.
+
+Usage: ./benchmark_embeds.py [fields]
+"""
+from pathutils import *
+import sys
+import time
+
+
+def make_fields(n):
+    return [('Field {:d}'.format(i), 'value ' * (i % 40 + 1)) for i in range(n)]
+
+
+def main(n_fields=5000):
+    add_application_path()
+    from kaztron.utils.embeds import EmbedSplitter
+
+    fields = make_fields(n_fields)
+    for bulk in (False, True):
+        start = time.perf_counter()
+        es = EmbedSplitter(title='Title', description='Description')
+        es.set_footer(text='Footer')
+        if bulk:
+            es.add_fields(fields)
+        else:
+            for name, value in fields:
+                es.add_field(name=name, value=value)
+        embeds = es.finalize()
+        print("{:d} fields ({}): {:.3f}s, {:d} embeds".format(
+            n_fields, 'add_fields' if bulk else 'add_field', time.perf_counter() - start,
+            len(embeds)))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
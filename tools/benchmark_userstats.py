@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+"""
+Benchmark the userstats StatsAccumulator: memory use, find() and to_dict() with, by default,
+50k users posting in 3 channels each (150k counters), indexed and unindexed.
+
+Usage: ./benchmark_userstats.py [users] [channels]
+
+Must be run from a configured KazTron install (the userstats cog reads the bot config on import).
+"""
+from pathutils import *
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+
+
+def populate(acc, n_users, n_channels):
+    from kaztron.cog.userstats.core import EventType
+    for user in range(n_users):
+        user_id = str(10**17 + user)
+        for channel in range(n_channels):
+            acc.capture_event(EventType.msg, user_id, str(10**17 + (user + channel) % 50))
+
+
+def main(n_users=50000, n_channels=3):
+    add_application_path()
+    from kaztron.cog.userstats.core import StatsAccumulator
+
+    print("{:d} users x {:d} channels".format(n_users, n_channels))
+    for indexed in (True, False):
+        label = 'indexed' if indexed else 'unindexed'
+
+        tracemalloc.start()
+        acc = StatsAccumulator(datetime(2018, 1, 1), b'salt', iterations=1, indexed=indexed)
+        populate(acc, n_users, n_channels)
+        # don't count the user ID -> hash cache: it is not persisted and is the same either way
+        acc._user_id_cache.clear()
+        memory, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        print("{}: {:d} counters, {:.1f} MB".format(label, len(acc), memory / 2**20))
+
+        user_id, channel_id = str(10**17 + n_users // 2), str(10**17)
+        start = time.perf_counter()
+        for _ in range(100):
+            acc.find(user=user_id)
+        print("{}: find(user) {:.3f} ms".format(label, (time.perf_counter() - start) * 10))
+
+        start = time.perf_counter()
+        for _ in range(10):
+            acc.find(channel=channel_id)
+        print("{}: find(channel) {:.3f} ms".format(label, (time.perf_counter() - start) * 100))
+
+        start = time.perf_counter()
+        acc.to_dict()
+        print("{}: to_dict {:.3f} s".format(label, time.perf_counter() - start))
+
+
+if __name__ == '__main__':
+    main(*(int(arg) for arg in sys.argv[1:]))
@@ -1,16 +1,22 @@
 #! /usr/bin/env python3
 from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from typing import List
 import csv
+import time
 import discord
 
 from pathutils import *
 
+fieldnames = ['discord_id', 'title', 'genre', 'subgenre', 'type', 'pitch', 'description', 'url']
+required_fields = ['discord_id', 'title', 'genre', 'type', 'pitch']
+
 
 def import_file(filename, dry_run, verbose, check_matches):
     """ Import a CSV file. Params correspond to command-line arguments. """
     success = True
 
-    fieldnames = ['discord_id', 'title', 'genre', 'subgenre', 'type', 'pitch', 'description', 'url']
     with open(filename, 'r', newline='', encoding='utf-8') as f:
         csvr = csv.DictReader(f, fieldnames=fieldnames)
         print("Importing {}...".format(filename))
@@ -41,7 +47,8 @@ def import_project(row_dict, dry_run, verbose, check_matches):
     if dry_run:
         return False
     if not check_matches or not check_match(proj_dict):
-        project = query.add_project(proj_dict)
+        project = model.Project(**proj_dict)
+        query.session.add(project)
         print("Project added.")
         if verbose:
             print(repr(project))
@@ -68,7 +75,6 @@ def process_project_row(row_dict) -> dict:
             proj_dict['user'] = user
         else:
             proj_dict[key] = wizard.validators[key](val.strip()) if val else None
-    proj_dict.user_id = proj_dict['user'].discord_id
     return proj_dict
 
 
@@ -87,6 +93,185 @@ def check_match(proj_dict):
     return len(res) > 0
 
 
+#####
+# Bulk import
+#####
+
+_worker_genres = {}  # lowercase name -> id
+_worker_types = {}
+
+
+def _init_worker(genres, types):
+    add_application_path()
+    global _worker_genres, _worker_types, wizard, extract_user_id
+    from kaztron.cog.projects import wizard
+    from kaztron.utils.discord import extract_user_id
+    _worker_genres = genres
+    _worker_types = types
+
+
+def validate_row(numbered_row):
+    """
+    Validate a CSV row, without database access (genres and types are checked against the tables
+    passed to :func:`_init_worker`). Runs in a worker process.
+
+    :return: Tuple (row number, project column mapping with a 'discord_id' key, error message).
+        One of the mapping or error is None.
+    """
+    row_num, row_dict = numbered_row
+    if None in row_dict:  # too many columns
+        return row_num, None, "CSV file row contains too many columns (title={!r})"\
+            .format(row_dict['title'])
+
+    for key in required_fields:
+        if not (row_dict[key] or '').strip():
+            return row_num, None, "Missing {} (title={!r})".format(key, row_dict['title'])
+
+    proj_dict = {}
+    try:
+        for key, val in row_dict.items():
+            val = val.strip() if val else None
+            if key == 'discord_id':
+                proj_dict['discord_id'] = extract_user_id(val)
+            elif key == 'genre':
+                proj_dict['genre_id'] = _worker_genres[val.lower()]
+            elif key == 'type':
+                proj_dict['type_id'] = _worker_types[val.lower()]
+            else:
+                proj_dict[key] = wizard.validators[key](val) if val else None
+    except KeyError as e:
+        return row_num, None, "Unknown {} (title={!r}): {}".format(key, row_dict['title'], e)
+    except (AttributeError, ValueError) as e:
+        return row_num, None, "Invalid {} (title={!r}): {}".format(key, row_dict['title'], e)
+    return row_num, proj_dict, None
+
+
+def read_progress(progress_file: Path) -> int:
+    try:
+        return int(progress_file.read_text().strip())
+    except FileNotFoundError:
+        return 0
+
+
+def is_match(title: str, titles: List[str]) -> bool:
+    """
+    Check if a lowercase title matches any of a user's project titles. Same rule as
+    :func:`check_match`: a match is any title that contains this one.
+    """
+    return any(title in t for t in titles)
+
+
+def insert_batch(projects, users, existing, check_matches):
+    """
+    Insert a batch of validated projects, creating any missing users. Must be called within a
+    transaction.
+
+    :param users: Map of discord IDs to user IDs for users already in the database. Updated.
+    :param existing: Map of user IDs to the lowercase titles of their projects in the database.
+        Updated.
+    :return: Tuple (number added, number skipped as duplicates)
+    """
+    new_ids = sorted({p['discord_id'] for p in projects} - users.keys())
+    if new_ids:
+        query.session.bulk_insert_mappings(model.User, [{'discord_id': d} for d in new_ids])
+        for chunk in chunked(new_ids, db.SQLITE_MAX_VARIABLES):
+            users.update(query.session.query(model.User.discord_id, model.User.user_id)
+                .filter(model.User.discord_id.in_(chunk)))
+
+    mappings = []
+    for proj_dict in projects:
+        user_id = users[proj_dict['discord_id']]
+        title = proj_dict['title'].lower()
+        titles = existing.setdefault(user_id, [])
+        if check_matches and is_match(title, titles):
+            continue
+        titles.append(title)
+        mapping = {k: v for k, v in proj_dict.items() if k != 'discord_id'}
+        mapping['user_id'] = user_id
+        mappings.append(mapping)
+    query.session.bulk_insert_mappings(model.Project, mappings)
+    return len(mappings), len(projects) - len(mappings)
+
+
+def bulk_import_file(filename, dry_run, verbose, check_matches,
+                     batch_size=1000, workers=None, resume=False):
+    """
+    Import a CSV file in bulk. Rows are validated in worker processes against lookup tables loaded
+    once at the start, and inserted one transaction per batch.
+
+    The number of rows imported is saved to ``<filename>.progress`` after each batch. If the
+    import fails, it can be resumed from the last complete batch with ``resume=True``.
+
+    Other params correspond to command-line arguments.
+    """
+    success = True
+    progress_file = Path(filename + '.progress')
+    start_row = read_progress(progress_file) if resume else 0
+    if start_row:
+        print("Resuming after row {:d}...".format(start_row))
+
+    genres = {g.name.lower(): g.id for g in query.query_genres()}
+    types = {t.name.lower(): t.id for t in query.query_project_types()}
+    users = dict(query.session.query(model.User.discord_id, model.User.user_id))
+    existing = {}
+    if check_matches:
+        for user_id, title in query.session.query(model.Project.user_id, model.Project.title):
+            existing.setdefault(user_id, []).append(title.lower())
+    print("Loaded {:d} genres, {:d} types, {:d} users, {:d} projects"
+        .format(len(genres), len(types), len(users), sum(len(t) for t in existing.values())))
+
+    total_added = total_skipped = total_errors = 0
+    start_time = time.perf_counter()
+    with open(filename, 'r', newline='', encoding='utf-8') as f, \
+            ProcessPoolExecutor(workers, initializer=_init_worker,
+                                initargs=(genres, types)) as pool:
+        csvr = csv.DictReader(f, fieldnames=fieldnames)
+        print("Importing {}...".format(filename))
+        rows = islice(enumerate(csvr, 1), start_row, None)
+        for batch in chunked(rows, batch_size):
+            batch_start = time.perf_counter()
+            projects = []
+            for row_num, proj_dict, error in pool.map(validate_row, batch, chunksize=64):
+                if error:
+                    print("[ERROR] Row {:d}: {}".format(row_num, error))
+                    total_errors += 1
+                    success = False
+                else:
+                    projects.append(proj_dict)
+                    if verbose:
+                        print("Row {:d}: {!r}".format(row_num, proj_dict))
+
+            last_row = batch[-1][0]
+            if not dry_run:
+                try:
+                    with query.transaction():
+                        added, skipped = insert_batch(projects, users, existing, check_matches)
+                except Exception as e:
+                    print("[ERROR] Rows {:d}-{:d}: {}"
+                        .format(batch[0][0], last_row, tb_log_str(e)))
+                    print("Import stopped. Fix the error and use --resume to continue from "
+                          "row {:d}.".format(batch[0][0]))
+                    return False
+                progress_file.write_text(str(last_row))
+                total_added += added
+                total_skipped += skipped
+
+            elapsed = time.perf_counter() - batch_start
+            print("Rows {:d}-{:d}: {:d} valid, {:d} added ({:.0f} rows/s)".format(
+                batch[0][0], last_row, len(projects), added if not dry_run else 0,
+                len(batch) / elapsed if elapsed else 0))
+
+    elapsed = time.perf_counter() - start_time
+    print("Done: {:d} added, {:d} duplicates skipped, {:d} errors in {:.1f}s"
+        .format(total_added, total_skipped, total_errors, elapsed))
+    if not dry_run:
+        try:
+            progress_file.unlink()
+        except FileNotFoundError:  # no batches written (empty file)
+            pass
+    return success
+
+
 if __name__ == '__main__':
     import os
     import sys
@@ -145,18 +330,34 @@ if __name__ == '__main__':
     parser.add_argument('--allow-duplicates', '-d', action='store_true',
         help='Do not check if an existing project exists before adding. If not specified, this '
              'script will skip any user+title matches already in the database.')
+    parser.add_argument('--bulk', '-b', action='store_true',
+        help='Bulk import: validate rows in parallel and insert them in large transactions. Much '
+             'faster for large files. Progress is saved after each batch (see --resume).')
+    parser.add_argument('--batch-size', type=int, default=1000,
+        help='Bulk import: number of rows per transaction. Default 1000.')
+    parser.add_argument('--workers', type=int, default=None,
+        help='Bulk import: number of worker processes for validation. Default: number of CPUs.')
+    parser.add_argument('--resume', '-r', action='store_true',
+        help='Bulk import: continue from the last batch completed by a previous (failed) import '
+             'of the same file.')
     args = parser.parse_args()
     args.file = str(Path(args.file).resolve())
 
     add_application_path()
-    from kaztron.cog.projects import query, wizard
+    from kaztron.cog.projects import query, wizard, model
+    from kaztron.driver import database as db
     from kaztron.utils.discord import extract_user_id
+    from kaztron.utils.itertools import chunked
     from kaztron.utils.logging import tb_log_str, exc_log_str
 
     query.init_db()
 
     try:
-        r = import_file(args.file, args.dry_run, args.verbose, not args.allow_duplicates)
+        if args.bulk:
+            r = bulk_import_file(args.file, args.dry_run, args.verbose, not args.allow_duplicates,
+                                 args.batch_size, args.workers, args.resume)
+        else:
+            r = import_file(args.file, args.dry_run, args.verbose, not args.allow_duplicates)
     except OSError as e:
         print("[ERROR]", exc_log_str(e))
         sys.exit(1)